@@ -1,9 +1,34 @@
 from math import *
+from itertools import product
+import numpy as np
 import pandas as pd
 
+from sptp_cache import loadArrays, saveArrays
+
+# Names of label lists and arrays kept by SptpData_5 (and its cache)
+DATA_LABELS = ['I', 'J', 'K']
+DATA_ARRAYS = ['A', 'B', 'C', 'S', 'P', 'D', 'T']
+
+# p_ij below this value is treated as zero in the bounds of x_ij
+P_MIN = 1.e-6
+
+
+def frameToArray(frame, rows, cols, name, dtype=float):
+    """
+    Returns values of the frame as dense array with rows and columns ordered as rows, cols
+    Raises ValueError if some of rows or cols labels are absent in the frame
+    Labels are compared as strings: numeric labels are parsed as ints in an index column of CSV-file,
+    but headers of columns are always read as strings
+    """
+    frame = frame.set_axis(frame.index.map(str), axis=0).set_axis(frame.columns.map(str), axis=1)
+    arr = frame.reindex(index=[str(r) for r in rows], columns=[str(c) for c in cols]).to_numpy(dtype=float)
+    if np.isnan(arr).any():
+        raise ValueError('Labels of rows/columns in %s do not match Assets, Requirements or Types lists' % (name))
+    return arr.astype(dtype)
+
 
 class SptpData_5:
-    def __init__(self, name, path2a_csv="", path2b_csv="", path2C_csv="", path2D_csv="", path2P_csv="", path2S_csv="", path2T_csv="", debug=False):
+    def __init__(self, name, path2a_csv="", path2b_csv="", path2C_csv="", path2D_csv="", path2P_csv="", path2S_csv="", path2T_csv="", debug=False, cacheDir=None):
         """
          :param name: name of the dataset;
          :path2a_csv: path to CSV with Available Assets (vector, i)
@@ -13,86 +38,250 @@ class SptpData_5:
          :path2P_csv: path to CSV with External costs of Lots (matrix, [ij])
          :path2S_csv: path to CSV with Lots' Sizes
          :path2T_csv: path to CSV with indicator of whether asset ih as type k (0 or 1).There is exactly one1 in each row (matrix [ik]
+         :cacheDir: folder to cache parsed arrays (see sptp_cache.py), None - always parse CSV-files
          :xIntThreshold: SEE def isXinteger(self, i, j) !!!!
         """
         self.name = name
 
-        self.aVec = pd.read_csv(path2a_csv, index_col=0)
-        self.bVec = pd.read_csv(path2b_csv, index_col=0)
-        self.cMat = pd.read_csv(path2C_csv, index_col=0)
-        self.dMat = pd.read_csv(path2D_csv, index_col=0)
-        self.pMat = pd.read_csv(path2P_csv, index_col=0)
-        self.sMat = pd.read_csv(path2S_csv, index_col=0)
-        self.tMat = pd.read_csv(path2T_csv, index_col=0)
+        paths = [path2a_csv, path2b_csv, path2C_csv, path2D_csv, path2P_csv, path2S_csv, path2T_csv]
+        cached = None
+        if cacheDir is not None:
+            cached = loadArrays(cacheDir, paths)
+        if cached is None:
+            self.readCsv(*paths)
+            if cacheDir is not None:
+                saveArrays(cacheDir, paths,
+                           dict((key, getattr(self, key).tolist()) for key in DATA_LABELS),
+                           dict((key, getattr(self, key)) for key in DATA_ARRAYS))
+        else:
+            labels, arrays = cached
+            for key in DATA_LABELS:
+                setattr(self, key, pd.Index(labels[key]))
+            for key in DATA_ARRAYS:
+                setattr(self, key, arrays[key])
+            if debug:
+                print('SptpData_5(%s): arrays are loaded from cache' % (name))
+
+        self.M = len(self.I)
+        self.N = len(self.J)
+        self.NK = len(self.K)
+
+        # Positions of labels i, j, k in the arrays
+        self.iPos = dict((i, n) for n, i in enumerate(self.I))
+        self.jPos = dict((j, n) for n, j in enumerate(self.J))
+        self.kPos = dict((k, n) for n, k in enumerate(self.K))
+
+        # Arrays computed on demand, see getUpperBoundArray(), getIntegerArray(), getAdmissibleMask()
+        self.upperBound = None
+        self.xInteger = None
+        self.admissible = None
+
+    def readCsv(self, path2a_csv, path2b_csv, path2C_csv, path2D_csv, path2P_csv, path2S_csv, path2T_csv):
+        """
+        Parses CSV-files, checks data integrity and fills label lists I, J, K and arrays A, B, C, S, P, D, T
+        """
+        aVec = pd.read_csv(path2a_csv, index_col=0)
+        bVec = pd.read_csv(path2b_csv, index_col=0)
+        cMat = pd.read_csv(path2C_csv, index_col=0)
+        dMat = pd.read_csv(path2D_csv, index_col=0)
+        pMat = pd.read_csv(path2P_csv, index_col=0)
+        sMat = pd.read_csv(path2S_csv, index_col=0)
+        tMat = pd.read_csv(path2T_csv, index_col=0)
         # self.xIntThreshold =xIntThreshold
 
-        self.I = self.aVec.index
+        self.I = aVec.index
         self.M = len(self.I)
 
-        self.J = self.bVec.index
+        self.J = bVec.index
         self.N = len(self.J)
 
-        self.K = self.dMat.index
+        self.K = dMat.index
         self.NK = len(self.K)
 
         # Check data integrity
-        iBuf = len(self.cMat.index)
+        iBuf = len(cMat.index)
         if iBuf != self.M:
             raise ValueError('M of rows in C [%d] != length of Assets list [%d]' % (iBuf, self.M) )
-        iBuf = len(self.cMat.columns.values.tolist())
+        iBuf = len(cMat.columns.values.tolist())
         if iBuf != self.N:
             raise ValueError('N of columns in C [%d] != length of Requirements list [%d]' % (iBuf, self.N) )
 
-        iBuf = len(self.tMat.columns.values.tolist())
+        iBuf = len(tMat.columns.values.tolist())
         if iBuf != self.NK:
             raise ValueError('K of rows in D [%d] != length of number Assets types [%d] (columns of T' % (iBuf, self.NK))
-        iBuf = len(self.dMat.columns.values.tolist())
+        iBuf = len(dMat.columns.values.tolist())
         if iBuf != self.N:
             raise ValueError('N of columns in D [%d] != length of Requirements list [%d]' % (iBuf, self.N))
 
-        iBuf = len(self.pMat.index)
+        iBuf = len(pMat.index)
         if iBuf != self.M:
             raise ValueError('M of rows in P [%d] != length of Assets list [%d]' % (iBuf, self.M) )
-        iBuf = len(self.pMat.columns.values.tolist())
+        iBuf = len(pMat.columns.values.tolist())
         if iBuf != self.N:
             raise ValueError('N of columns in P [%d] != length of Requirements list [%d]' % (iBuf, self.N) )
 
-        iBuf = len(self.sMat.index)
+        iBuf = len(sMat.index)
         if iBuf != self.M:
             raise ValueError('M of rows in S [%d] != length of Assets list [%d]' % (iBuf, self.M) )
-        iBuf = len(self.sMat.columns.values.tolist())
+        iBuf = len(sMat.columns.values.tolist())
         if iBuf != self.N:
             raise ValueError('N of columns in S [%d] != length of Requirements list [%d]' % (iBuf, self.N) )
         # ====================================
 
+        # Dense arrays ordered as I, J, K
+        self.A = aVec['Units'].to_numpy(dtype=float)       # [i]
+        self.B = bVec['Amount'].to_numpy(dtype=float)      # [j]
+        self.C = frameToArray(cMat, self.I, self.J, 'C')    # [ij]
+        self.S = frameToArray(sMat, self.I, self.J, 'S')    # [ij]
+        self.P = frameToArray(pMat, self.I, self.J, 'P')    # [ij]
+        self.D = frameToArray(dMat, self.K, self.J, 'D')    # [kj]
+        self.T = frameToArray(tMat, self.I, self.K, 'T', dtype=int)  # [ik]
+
+    # Bulk accessors, arrays are ordered as I, J, K
+    def getAArray(self):
+        return self.A
+
+    def getBArray(self):
+        return self.B
+
+    def getCArray(self):
+        return self.C
+
+    def getSArray(self):
+        return self.S
+
+    def getPArray(self):
+        return self.P
+
+    def getDArray(self):
+        return self.D
+
+    def getTArray(self):
+        return self.T
+
+    def getAdmissibleMask(self):
+        """
+        Returns boolean [ij]-array, True iff x_ij may be positive: p_ij > 0 and upper bound of x_ij > 0.
+        As c_ij >= 0 all other x_ij are zero in some optimal solution and may be excluded from the model
+        """
+        if self.admissible is None:
+            self.admissible = (self.P > 0) & (self.getUpperBoundArray() > 0)
+        return self.admissible
+
+    def getTypeDArray(self):
+        """
+        Returns [ij]-array of d_kj for type k of asset i (minimum over types if asset has several, inf if none)
+        """
+        isType = self.T > 0
+        nTypes = isType.sum(axis=1)
+        if (nTypes == 1).all():
+            return self.D[np.argmax(isType, axis=1)]
+        dArr = np.full((self.M, self.N), np.inf)
+        for k in range(self.NK):
+            dArr[isType[:, k]] = np.minimum(dArr[isType[:, k]], self.D[k])
+        return dArr
+
+    def getUpperBoundArray(self):
+        """
+        Returns [ij]-array of upper bounds on x_ij: min(a_i/s_ij, d_kj/p_ij) for type k of asset i,
+        the second term is used if p_ij >= P_MIN only. Zero s_ij gives no bound (inf) by the first term
+        """
+        if self.upperBound is None:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ub = np.where(self.S > 0, self.A[:, None] / self.S, np.inf)
+                self.upperBound = np.where(self.P >= P_MIN, np.minimum(ub, self.getTypeDArray() / self.P), ub)
+        return self.upperBound
+
+    def getIntegerArray(self):
+        """
+        Returns boolean [ij]-array, True iff x_ij MUST BE Integer (see isXinteger)
+        """
+        if self.xInteger is None:
+            # !!! All non-currency x_{ij} ARE INTEGER (currencies have 3-letter codes)
+            isInt = np.array([len(str(i)) > 3 for i in self.I], dtype=bool)
+            self.xInteger = np.broadcast_to(isInt[:, None], (self.M, self.N))
+        return self.xInteger
+
+    def getPairIJ(self, sparse=True):
+        """
+        Returns (i, j)-positions of pairs in COO format, ordered by i, then by j
+        :param sparse: if True then admissible pairs only, else all pairs of I x J
+        """
+        if not sparse:
+            iIdx, jIdx = np.indices((self.M, self.N))
+            return iIdx.ravel(), jIdx.ravel()
+        return np.nonzero(self.getAdmissibleMask())
+
+    def getPairPtr(self, sparse=True):
+        """
+        Returns CSR row pointer for getPairIJ(sparse): pairs of i-th asset are [ptr[i], ptr[i+1])
+        """
+        if not sparse:
+            return np.arange(self.M + 1) * self.N
+        return np.concatenate(([0], np.cumsum(self.getAdmissibleMask().sum(axis=1))))
+
+    def getPairValues(self, arr, sparse=True):
+        """
+        Returns values of [ij]-array arr for pairs of getPairIJ(sparse)
+        """
+        iIdx, jIdx = self.getPairIJ(sparse)
+        return arr[iIdx, jIdx]
+
+    def getTypeAssets(self):
+        """
+        Returns list of NK arrays: positions of assets i of type k (t_ik > 0), ordered as I
+        """
+        return [np.nonzero(self.T[:, k] > 0)[0] for k in range(self.NK)]
+
+    def getTypePSum(self, sparse=True):
+        """
+        Returns [kj]-array of sum{i in I} t_ik*p_ij taken over pairs (i,j) of getPairIJ(sparse)
+        """
+        P = np.where(self.getAdmissibleMask(), self.P, 0.) if sparse else self.P
+        return np.dot((self.T > 0).T.astype(float), P)
+
+    # List of (i,j) labels in the order of getPairIJ(sparse)
+    def getPairs(self, sparse=False):
+        if not sparse:
+            return list(product(self.I, self.J))
+        iIdx, jIdx = self.getPairIJ(sparse)
+        return list(zip(self.I[iIdx].tolist(), self.J[jIdx].tolist()))
+
+    # Scalar accessors (compatibility wrappers)
     def getC(self, i, j):
-        return self.cMat.loc[i][j]
+        return self.C[self.iPos[i], self.jPos[j]]
 
     def getA(self, i):
-        return self.aVec.loc[i]['Units']
+        return self.A[self.iPos[i]]
 
     def getB(self, j):
-        return self.bVec.loc[j]['Amount']
+        return self.B[self.jPos[j]]
 
     def getS(self, i, j):
-        return self.sMat.loc[i][j]
+        return self.S[self.iPos[i], self.jPos[j]]
     def getX2A(self, i, j):
-        return self.getS(i, j) #self.sMat.loc[i][j]
+        return self.getS(i, j)
 
     def getP(self, i, j):
-        return self.pMat.loc[i][j]
+        return self.P[self.iPos[i], self.jPos[j]]
     def getX2B(self, i, j):
-        return self.getP(i, j) #self.pMat.loc[i][j]
+        return self.getP(i, j)
 
     def getD(self, k, j):
-        return self.dMat.loc[k][j]
+        return self.D[self.kPos[k], self.jPos[j]]
 
     def getT(self, i, k):
-        return self.tMat.loc[i][k]
+        return self.T[self.iPos[i], self.kPos[k]]
 
     def getInitX(self, i, j):
         return 0.
 
+    def getInitXArray(self):
+        """
+        Returns [ij]-array of initial solution x_ij (see getInitX), zeros by default
+        """
+        return np.zeros((self.M, self.N))
+
     def checkFeasible(self, debug=False):
         checkDict = {}
         # for j in self.J:
@@ -104,9 +293,5 @@ class SptpData_5:
         #         checkDict[j] = True
         return checkDict
 
-    # !!! All non-currency x_{ij} ARE INTEGER
     def isXinteger(self, i, j):
-        if len(str(i)) > 3:
-            return True
-        else:
-            return False
\ No newline at end of file
+        return bool(self.getIntegerArray()[self.iPos[i], self.jPos[j]])
\ No newline at end of file
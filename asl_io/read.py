@@ -1,13 +1,37 @@
+import os
 import pyomo.environ
 from pyomo.core import SymbolMap
 from pyomo.opt import (ReaderFactory,
                        ResultsFormat)
 # use fast version of pickle (python 2 or 3)
 from six.moves import cPickle as pickle
+import numpy as np
+
+from smap import SymbolMapFile, is_symbol_map_file, SMAP_EXT
+from write import ORDER_MAP_EXT, ORDER_MAP_KINDS
 
 SOL_EXT = '.sol'
+# Solve result codes below this one are solved (0-99) or solved? (100-199), the rest are failures:
+# infeasible (200-299), unbounded (300-399), limit reached (400-499), failure (500-599)
+SOLVE_RESULT_FAILED = 200
 
 
+def load_symbol_map(model, symbol_map_filename):
+    """
+    Loads the symbol map saved by write_nl or write_nl_smap for the model:
+    binary file (see smap.py) or pickled (symbol, ComponentUID) pairs of former versions
+    """
+    if is_symbol_map_file(symbol_map_filename):
+        with SymbolMapFile(symbol_map_filename) as smap_file:
+            return smap_file.symbol_map(model)
+
+    with open(symbol_map_filename, "rb") as f:
+        symbol_cuid_pairs = pickle.load(f)
+    symbol_map = SymbolMap()
+    symbol_map.addSymbols((cuid.find_component(model), symbol)
+                          for symbol, cuid in symbol_cuid_pairs)
+    return symbol_map
+
 def read_sol(model, sol_filename, symbol_map_filename, suffixes=[".*"]):
     """
     Reads the solution from the SOL file and generates a
@@ -26,14 +50,7 @@ def read_sol(model, sol_filename, symbol_map_filename, suffixes=[".*"]):
         results = reader(sol_filename, suffixes=suffixes)
 
     # regenerate the symbol_map for this model
-    with open(symbol_map_filename, "rb") as f:
-        symbol_cuid_pairs = pickle.load(f)
-    symbol_map = SymbolMap()
-    symbol_map.addSymbols((cuid.find_component(model), symbol)
-                          for symbol, cuid in symbol_cuid_pairs)
-
-    # tag the results object with the symbol_map
-    results._smap = symbol_map
+    results._smap = load_symbol_map(model, symbol_map_filename)
 
     return results
 
@@ -52,7 +69,9 @@ def read_sol_smap(model, sol_filename, symbol_filename, suffixes=[".*"]):
 
     # Remove possible suffix '.sol' if any, treating sol_filename as dir_sol/modelName, dir_sol/dataName
     if sol_filename.endswith(SOL_EXT): sol_filename = sol_filename[:-len(SOL_EXT)]
-    symbol_map_filename = symbol_filename + ".symbol_map.pickle"
+    symbol_map_filename = symbol_filename + SMAP_EXT
+    if not os.path.exists(symbol_map_filename) and os.path.exists(symbol_filename + ".symbol_map.pickle"):
+        symbol_map_filename = symbol_filename + ".symbol_map.pickle"
     sol_filename = sol_filename + ".sol"
 
     # parse the SOL file
@@ -60,14 +79,7 @@ def read_sol_smap(model, sol_filename, symbol_filename, suffixes=[".*"]):
         results = reader(sol_filename, suffixes=suffixes)
 
     # regenerate the symbol_map for this model
-    with open(symbol_map_filename, "rb") as f:
-        symbol_cuid_pairs = pickle.load(f)
-    symbol_map = SymbolMap()
-    symbol_map.addSymbols((cuid.find_component(model), symbol)
-                          for symbol, cuid in symbol_cuid_pairs)
-
-    # tag the results object with the symbol_map
-    results._smap = symbol_map
+    results._smap = load_symbol_map(model, symbol_map_filename)
 
     return results
 
@@ -105,13 +117,152 @@ def read_sol_smap_var(model, sol_filename, smap, suffixes=[".*"]):
 
     return results
 
+def load_order_map(model, map_filename):
+    """
+    Loads order-based symbol map saved by write.write_nl_omap for the model
+    with the same components (and the same order of their data)
+    Each component is iterated once, so the time is linear in the number of symbols
+    :return: SymbolMap
+    """
+    symbol_map = SymbolMap()
+    with np.load(map_filename) as arrays:
+        for kind in ORDER_MAP_KINDS:
+            datas = []
+            for name in arrays[kind + '_names'].tolist():
+                comp = model.find_component(name)
+                if comp is None:
+                    raise ValueError('Component %s of the symbol map %s is not found in the model' % (name, map_filename))
+                datas.append(list(comp.values()) if comp.is_indexed() else [comp])
+            comps = arrays[kind + '_comps'].tolist()
+            poss = arrays[kind + '_poss'].tolist()
+            symbol_map.addSymbols((datas[c][p], '%s%d' % (kind, n))
+                                  for n, (c, p) in enumerate(zip(comps, poss)))
+    return symbol_map
+
+def read_sol_omap(model, sol_filename, map_filename, suffixes=[".*"]):
+    """
+    Reads the solution from the SOL file and generates a
+    results object with the symbol map loaded from order-based map
+    (see load_order_map) for loading it into the given Pyomo model.
+    The model IS NOT WRITTEN to obtain the symbol map.
+    :param sol_filename: SOL-file, suffix '.sol' may be omitted
+    :param map_filename: file of order-based map or NL-file name without extension (then '.order_map.npz' is added)
+    """
+    if suffixes is None:
+        suffixes = []
+
+    # Remove possible suffix '.sol' if any, treating sol_filename as dir_sol/modelName, dir_sol/dataName
+    if sol_filename.endswith(SOL_EXT): sol_filename = sol_filename[:-len(SOL_EXT)]
+    sol_filename = sol_filename + ".sol"
+    if not map_filename.endswith(ORDER_MAP_EXT): map_filename = map_filename + ORDER_MAP_EXT
+
+    # parse the SOL file
+    with ReaderFactory(ResultsFormat.sol) as reader:
+        results = reader(sol_filename, suffixes=suffixes)
+
+    # tag the results object with the symbol_map
+    results._smap = load_order_map(model, map_filename)
+
+    return results
+
+def read_sol_arrays(sol_filename, duals=False):
+    """
+    Parses the SOL file (text format) directly into NumPy arrays,
+    neither Pyomo results object nor the model are created
+    :param sol_filename: SOL-file, suffix '.sol' may be omitted
+    :param duals: if True then dual values are returned as well
+    :return: (x, y, message, solve_result_num):
+             x - array of primal values in the order of variables of NL-file (.col file),
+             y - array of dual values in the order of constraints of NL-file (.row file), None if duals is False,
+             message - message of the solver,
+             solve_result_num - solve result code of the objno line (0-99 optimal, 200-299 infeasible, etc.)
+    """
+    # Remove possible suffix '.sol' if any
+    if sol_filename.endswith(SOL_EXT): sol_filename = sol_filename[:-len(SOL_EXT)]
+    sol_filename = sol_filename + ".sol"
+
+    with open(sol_filename, 'r') as f:
+        lines = f.read().splitlines()
+    return parse_sol_lines(lines, sol_filename, duals)
+
+def read_sol_bytes(data, duals=False, name='SOL'):
+    """
+    Same as read_sol_arrays for the contents of SOL-file in memory (e.g. read from results zip of SSOP)
+    :param data: bytes or str
+    :param name: name of the solution in error messages
+    """
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return parse_sol_lines(data.splitlines(), name, duals)
+
+def parse_sol_lines(lines, sol_filename, duals=False):
+    # Message of the solver is followed by Options section
+    msg = []
+    pos = 0
+    while pos < len(lines) and lines[pos].strip() != 'Options':
+        if lines[pos].strip():
+            msg.append(lines[pos].strip())
+        pos += 1
+    if pos == len(lines):
+        raise ValueError("no Options line found in %s" % (sol_filename))
+    nopts = int(lines[pos + 1])
+    pos += 2
+    need_vbtol = False
+    if nopts > 4:
+        nopts -= 2
+        need_vbtol = True
+    z = [int(line) for line in lines[pos:pos + nopts + 4]]
+    pos += nopts + 4
+    if need_vbtol:
+        pos += 1
+    m = z[nopts + 1]  # dual values
+    n = z[nopts + 3]  # primal values
+
+    y = np.array(lines[pos:pos + m], dtype=float) if duals else None
+    pos += m
+    x = np.array(lines[pos:pos + n], dtype=float)
+    if len(x) != n:
+        raise ValueError("%s has %d primal values instead of %d" % (sol_filename, len(x), n))
+    pos += n
+
+    solve_result_num = 0
+    if pos < len(lines) and lines[pos].strip():
+        t = lines[pos].split()
+        if t[0] != 'objno' or len(t) != 3:
+            raise ValueError("expected 'objno' line, found '%s'" % (lines[pos]))
+        solve_result_num = int(t[2])
+
+    return x, y, '\n'.join(msg), solve_result_num
+
+def is_solved(solve_result_num):
+    """
+    Returns True iff solve_result_num (see read_sol_arrays) means the problem is solved
+    """
+    return 0 <= solve_result_num < SOLVE_RESULT_FAILED
+
+def load_order_positions(map_filename, name, kind='v'):
+    """
+    Returns positions of the data of component name in the order-based symbol map (see load_order_map)
+    :param map_filename: file of order-based map or NL-file name without extension (then '.order_map.npz' is added)
+    :param kind: 'v' for variables, 'c' for constraints
+    :return: (symbols, positions): numbers n of symbols (v<n> or c<n>) of the component,
+             positions of the data in component.values() (e.g. positions of pairs (i,j) of indexed variable x[i,j])
+    """
+    if not map_filename.endswith(ORDER_MAP_EXT): map_filename = map_filename + ORDER_MAP_EXT
+    with np.load(map_filename) as arrays:
+        names = arrays[kind + '_names'].tolist()
+        if name not in names:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        symbols = np.nonzero(arrays[kind + '_comps'] == names.index(name))[0]
+        return symbols, arrays[kind + '_poss'][symbols]
+
 if __name__ == "__main__":
     from pyomo.opt import TerminationCondition
     from script import create_model
 
     model = create_model()
     sol_filename = "example.sol"
-    symbol_map_filename = "example.nl.symbol_map.pickle"
+    symbol_map_filename = "example.nl.symbol_map.bin"
     results = read_sol(model, sol_filename, symbol_map_filename)
     if results.solver.termination_condition != \
        TerminationCondition.optimal:
@@ -0,0 +1,222 @@
+"""
+Compact binary symbol map of NL file, replaces the pickled (symbol, ComponentUID) pairs.
+
+Every symbol of NL writer (v0, v1, ..., c0, ..., o0) is stored as integers:
+its kind and number, id of the name of its component and ids of the values of its index
+(e.g. ids of the labels of asset i and requirement j of x[i,j]) in a common string table.
+Symbols are ordered by kind and number, i.e. the variables are in the column order of NL file.
+
+Layout of the file (little-endian):
+    header       magic, number of symbols, dimension of indices, number of strings, size of string data
+    kinds        int32[symbols]       index in SYMBOL_KINDS or -1 (then number is id of the symbol string)
+    numbers      int64[symbols]
+    components   int32[symbols]       string ids of fully qualified names of components
+    indices      int32[symbols, dim]  string ids of index values, -1 for unused
+    offsets      int64[strings + 1]   offsets of strings in the string data
+    data         utf-8 strings, each is prefixed by type tag: s - str, i - int, f - float
+The file is opened by mmap, so loading takes constant time,
+symbols are resolved to model components lazily (SymbolMapFile.find) or in bulk (SymbolMapFile.symbol_map).
+"""
+import mmap
+import re
+import struct
+
+import numpy as np
+from pyomo.core import SymbolMap
+
+SMAP_EXT = '.symbol_map.bin'
+SMAP_MAGIC = b'ASLSMAP1'
+SYMBOL_KINDS = 'vco'
+HEADER = struct.Struct('<8s4q')
+
+re_symbol = re.compile(r'([' + SYMBOL_KINDS + r'])([0-9]+)$')
+
+
+def encode_label(value):
+    if isinstance(value, str):
+        return 's' + value
+    if isinstance(value, bool):
+        raise ValueError('Index value %r is not supported by symbol map' % (value,))
+    if isinstance(value, int):
+        return 'i' + repr(value)
+    if isinstance(value, float):
+        return 'f' + repr(value)
+    raise ValueError('Index value %r is not supported by symbol map' % (value,))
+
+
+def decode_label(text):
+    tag, value = text[0], text[1:]
+    if tag == 's':
+        return value
+    if tag == 'i':
+        return int(value)
+    return float(value)
+
+
+def align8(n):
+    return (n + 7) // 8 * 8
+
+
+def save_symbol_map(symbol_map, filename):
+    """
+    Saves symbol_map (pyomo SymbolMap returned by NL writer) to the binary file
+    :return: filename
+    """
+    strings = {}
+    def string_id(text):
+        sid = strings.get(text)
+        if sid is None:
+            sid = strings[text] = len(strings)
+        return sid
+
+    entries = []
+    for symbol, obj in symbol_map.bySymbol.items():
+        m = re_symbol.match(symbol)
+        if m:
+            key = (SYMBOL_KINDS.index(m.group(1)), int(m.group(2)))
+        else:
+            key = (len(SYMBOL_KINDS), symbol)
+        entries.append((key, symbol, obj))
+    entries.sort(key=lambda e: e[0])
+
+    n = len(entries)
+    kinds = np.empty(n, dtype=np.int32)
+    numbers = np.empty(n, dtype=np.int64)
+    comps = np.empty(n, dtype=np.int32)
+    indices = []
+    comp_ids = {}
+    for k, (key, symbol, obj) in enumerate(entries):
+        if key[0] < len(SYMBOL_KINDS):
+            kinds[k], numbers[k] = key
+        else:
+            kinds[k], numbers[k] = -1, string_id('s' + symbol)
+        comp = obj.parent_component()
+        cid = comp_ids.get(id(comp))
+        if cid is None:
+            cid = comp_ids[id(comp)] = string_id('s' + comp.getname(fully_qualified=True))
+        comps[k] = cid
+        if comp.is_indexed():
+            idx = obj.index()
+            idx = idx if idx.__class__ is tuple else (idx,)
+            indices.append([string_id(encode_label(v)) for v in idx])
+        else:
+            indices.append([])
+    dim = max([len(idx) for idx in indices] + [0])
+    index_arr = np.full((n, dim), -1, dtype=np.int32)
+    for k, idx in enumerate(indices):
+        index_arr[k, :len(idx)] = idx
+
+    texts = [t.encode('utf-8') for t, sid in sorted(strings.items(), key=lambda item: item[1])]
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(t) for t in texts])
+    data = b''.join(texts)
+
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(SMAP_MAGIC, n, dim, len(texts), len(data)))
+        for arr in (kinds, numbers, comps, index_arr, offsets):
+            buf = arr.astype(arr.dtype.newbyteorder('<'), copy=False).tobytes()
+            f.write(buf + b'\0' * (align8(len(buf)) - len(buf)))
+        f.write(data)
+    return filename
+
+
+def is_symbol_map_file(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(SMAP_MAGIC)) == SMAP_MAGIC
+
+
+class SymbolMapFile:
+    def __init__(self, filename):
+        """
+        Opens the binary symbol map (see save_symbol_map) by mmap, nothing is parsed except the header
+        """
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, dim, n_strings, data_size = HEADER.unpack_from(self.mm, 0)
+        if magic != SMAP_MAGIC:
+            self.close()
+            raise ValueError('%s is not a symbol map file' % (filename))
+        self.dim = dim
+        pos = HEADER.size
+        arrays = []
+        for dtype, count in ((np.int32, n), (np.int64, n), (np.int32, n), (np.int32, n * dim), (np.int64, n_strings + 1)):
+            dtype = np.dtype(dtype).newbyteorder('<')
+            arrays.append(np.frombuffer(self.mm, dtype=dtype, count=count, offset=pos))
+            pos += align8(count * dtype.itemsize)
+        self.kinds, self.numbers, self.components, indices, self.offsets = arrays
+        self.indices = indices.reshape((n, dim))
+        self.data_pos = pos
+        self.labels = {}
+        self.found = {}
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        # Arrays are views of the mmap, drop them before it is closed
+        self.kinds = self.numbers = self.components = self.indices = self.offsets = None
+        self.labels = {}
+        self.found = {}
+        try:
+            self.mm.close()
+        except (AttributeError, BufferError):
+            pass
+        self.file.close()
+
+    def string(self, sid):
+        lo, hi = int(self.offsets[sid]), int(self.offsets[sid + 1])
+        return self.mm[self.data_pos + lo:self.data_pos + hi].decode('utf-8')
+
+    def label(self, sid):
+        # Decoded values of the string table are cached
+        value = self.labels.get(sid)
+        if value is None:
+            value = self.labels[sid] = decode_label(self.string(sid))
+        return value
+
+    def symbol(self, n):
+        kind = int(self.kinds[n])
+        if kind < 0:
+            return self.label(int(self.numbers[n]))
+        return '%s%d' % (SYMBOL_KINDS[kind], self.numbers[n])
+
+    def component_name(self, n):
+        return self.label(int(self.components[n]))
+
+    def index(self, n):
+        """
+        Returns index of n-th symbol's component data: tuple of values, single value or None for scalar component
+        """
+        idx = tuple(self.label(sid) for sid in self.indices[n].tolist() if sid >= 0)
+        if len(idx) == 0:
+            return None
+        return idx if len(idx) > 1 else idx[0]
+
+    def find(self, model, n):
+        """
+        Returns component data of n-th symbol in the model, components are looked up once
+        """
+        cid = int(self.components[n])
+        comp = self.found.get(cid)
+        if comp is None:
+            comp = self.found[cid] = model.find_component(self.label(cid))
+            if comp is None:
+                raise ValueError('Component %s of the symbol map %s is not found in the model'
+                                 % (self.label(cid), self.filename))
+        idx = self.index(n)
+        return comp if idx is None else comp[idx]
+
+    def symbol_map(self, model):
+        """
+        Returns SymbolMap of all symbols resolved to the components of the model
+        """
+        symbol_map = SymbolMap()
+        symbol_map.addSymbols((self.find(model, n), self.symbol(n)) for n in range(len(self)))
+        return symbol_map
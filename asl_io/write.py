@@ -3,8 +3,14 @@ from pyomo.core import ComponentUID
 from pyomo.opt import ProblemFormat
 # use fast version of pickle (python 2 or 3)
 from six.moves import cPickle as pickle
+import numpy as np
+
+from smap import save_symbol_map, SMAP_EXT
 
 NL_EXT = '.nl'
+ORDER_MAP_EXT = '.order_map.npz'
+# Prefixes of symbols of NL-file: variables, constraints, objectives
+ORDER_MAP_KINDS = ('v', 'c', 'o')
 
 
 def write_nl(model, nl_filename, **kwds):
@@ -16,7 +22,7 @@ def write_nl(model, nl_filename, **kwds):
     see [write] function from /usr/local/lib/python2.7/dist-packages/pyomo/opt/problem/ampl.py
     calls [convert_problem] from /usr/local/lib/python2.7/dist-packages/pyomo/opt/base/convert.py
     """
-    symbol_map_filename = nl_filename + ".symbol_map.pickle"
+    symbol_map_filename = nl_filename + SMAP_EXT
 
     # write the model and obtain the symbol_map
     _, smap_id = model.write(nl_filename,
@@ -24,16 +30,11 @@ def write_nl(model, nl_filename, **kwds):
                              io_options=kwds)
     symbol_map = model.solutions.symbol_map[smap_id]
 
-    # save a persistent form of the symbol_map (using pickle) by
-    # storing the NL file label with a ComponentUID, which is
-    # an efficient lookup code for model components (created
-    # by John Siirola)
-    tmp_buffer = {} # this makes the process faster
-    symbol_cuid_pairs = tuple(
-        (symbol, ComponentUID(var_weakref(), cuid_buffer=tmp_buffer))
-        for symbol, var_weakref in symbol_map.bySymbol.items())
-    with open(symbol_map_filename, "wb") as f:
-        pickle.dump(symbol_cuid_pairs, f)
+    # save a persistent form of the symbol_map: the NL file label
+    # with ids of the component name and its index values in the
+    # string table (see smap.py), it is read by mmap and resolved
+    # to the components of a model with matching component names
+    save_symbol_map(symbol_map, symbol_map_filename)
 
     return symbol_map_filename
 
@@ -48,7 +49,7 @@ def write_nl_smap(model, nl_filename, **kwds):
     # Remove possible suffix '.nl' if any
     if nl_filename.endswith(NL_EXT): nl_filename = nl_filename[:-len(NL_EXT)]
 
-    symbol_map_filename = nl_filename+".symbol_map.pickle"
+    symbol_map_filename = nl_filename + SMAP_EXT
 
     # write the model and obtain the symbol_map
     nlFile, smap_id = model.write(nl_filename + ".nl",
@@ -56,16 +57,8 @@ def write_nl_smap(model, nl_filename, **kwds):
                              io_options=kwds)
     symbol_map = model.solutions.symbol_map[smap_id]
 
-    # save a persistent form of the symbol_map (using pickle) by
-    # storing the NL file label with a ComponentUID, which is
-    # an efficient lookup code for model components (created
-    # by John Siirola)
-    tmp_buffer = {} # this makes the process faster
-    symbol_cuid_pairs = tuple(
-        (symbol, ComponentUID(var_weakref(), cuid_buffer=tmp_buffer))
-        for symbol, var_weakref in symbol_map.bySymbol.items())
-    with open(symbol_map_filename, "wb") as f:
-        pickle.dump(symbol_cuid_pairs, f)
+    # save a persistent form of the symbol_map (see smap.py)
+    save_symbol_map(symbol_map, symbol_map_filename)
 
     return nlFile, symbol_map_filename
 
@@ -137,6 +130,70 @@ def get_smap_var(model):
     return symbol_map
 
 
+def order_map(symbol_map):
+    """
+    Returns order-based form of the symbol map of NL-file: the symbols are v0, v1, ..., c0, c1, ..., o0, ...,
+    so for each kind of symbols it is enough to store the component of n-th symbol
+    and position of its data in component.values()
+    :return: dictionary {kind: (list of names of components, array of numbers of components, array of positions)}
+    """
+    order = {}
+    positions = {}
+    for kind in ORDER_MAP_KINDS:
+        names = []
+        compOf = {}
+        comps = []
+        poss = []
+        n = 0
+        while True:
+            obj = symbol_map.bySymbol.get('%s%d' % (kind, n))
+            if obj is None:
+                break
+            comp = obj.parent_component()
+            if id(comp) not in compOf:
+                compOf[id(comp)] = len(names)
+                names.append(comp.getname(fully_qualified=True))
+                if comp.is_indexed():
+                    positions[id(comp)] = dict((id(data), pos) for pos, data in enumerate(comp.values()))
+                else:
+                    positions[id(comp)] = {id(comp): 0}
+            comps.append(compOf[id(comp)])
+            poss.append(positions[id(comp)][id(obj)])
+            n += 1
+        order[kind] = (names, np.array(comps, dtype=np.int32), np.array(poss, dtype=np.int64))
+    return order
+
+def save_order_map(map_filename, order):
+    """
+    Saves order-based symbol map (see order_map) to the file map_filename (NumPy .npz format)
+    """
+    arrays = {}
+    for kind, (names, comps, poss) in order.items():
+        arrays[kind + '_names'] = np.array(names, dtype=str)
+        arrays[kind + '_comps'] = np.asarray(comps, dtype=np.int32)
+        arrays[kind + '_poss'] = np.asarray(poss, dtype=np.int64)
+    with open(map_filename, 'wb') as f:
+        np.savez(f, **arrays)
+    return map_filename
+
+def write_nl_omap(model, nl_filename, **kwds):
+    """
+    Writes a Pyomo model in NL file format and stores
+    order-based symbol map (see order_map) to the file nl_filename.order_map.npz,
+    it allows to read SOL-file without writing the model again (see read.read_sol_omap)
+    """
+    # Remove possible suffix '.nl' if any
+    if nl_filename.endswith(NL_EXT): nl_filename = nl_filename[:-len(NL_EXT)]
+
+    # write the model and obtain the symbol_map
+    nlFile, smap_id = model.write(nl_filename + ".nl",
+                             format=ProblemFormat.nl,
+                             io_options=kwds)
+    symbol_map = model.solutions.symbol_map[smap_id]
+    map_filename = save_order_map(nl_filename + ORDER_MAP_EXT, order_map(symbol_map))
+
+    return nlFile, map_filename
+
 
 if __name__ == "__main__":
     from script import create_model
@@ -0,0 +1,200 @@
+from __future__ import print_function
+
+import os
+import argparse
+import asyncio
+import io
+import json
+import shutil
+import tempfile
+from timeit import default_timer as timer
+
+import numpy as np
+
+import everest
+import everest_mock
+import ssop_config
+import ssop_scheduler
+import ssop_session
+import ssop_zip
+
+PERCENTILES = (50, 90, 99)
+
+
+def makeParser():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+                                     description='Throughput of everest.py and ssop_session.py with N concurrent jobs '
+                                                 'run by local mock of Everest (see everest_mock.py)')
+    parser.add_argument('-n', '--jobs', type=int, default=20, help='number of jobs submitted at once')
+    parser.add_argument('-t', '--tasks', type=int, default=10, help='NL-files per job')
+    parser.add_argument('-s', '--nl-size', type=int, default=100000, help='bytes of every NL-file')
+    parser.add_argument('-c', '--client', default='everest', choices=['everest', 'ssop'],
+                        help='everest - AsyncSession with all jobs at once, ssop - SsopSession with JobBatch')
+    parser.add_argument('-e', '--endpoint', help='running server (e.g. everest_mock.py), default - mock in process')
+    parser.add_argument('-pi', '--poll-interval', type=float, default=0.2, help='poll interval of the client, s')
+    parser.add_argument('-dp', '--download-parallel', type=int, default=ssop_config.SSOP_DOWNLOAD_PARALLEL)
+    parser.add_argument('-l', '--latency', type=float, default=0.01, help='delay of responses of the mock, s')
+    parser.add_argument('-f', '--fail-rate', type=float, default=0., help='share of requests failed by the mock')
+    parser.add_argument('-d', '--drop-rate', type=float, default=0., help='share of requests dropped by the mock')
+    parser.add_argument('-jt', '--job-time', type=float, default=1., help='run time of a job in the mock, s')
+    parser.add_argument('-tt', '--task-time', type=float, default=0., help='run time of a task in the mock, s')
+    parser.add_argument('-sv', '--sol-values', type=int, default=10000, help='primal values in SOL-files of the mock')
+    parser.add_argument('-j', '--json', help='file to write the report as JSON')
+    return parser
+
+
+def busyTime(intervals):
+    """
+    Returns length of union of the intervals [(start, stop), ...]
+    """
+    total = 0.
+    end = None
+    for start, stop in sorted(intervals):
+        if end is None or start > end:
+            total += stop - start
+            end = stop
+        elif stop > end:
+            total += stop - end
+            end = stop
+    return total
+
+
+def makeNlFiles(folder, nJobs, nTasks, size):
+    # NL-files of jobs are random bytes (the mock does not read them), every job has its own files
+    names = []
+    for n in range(nJobs):
+        jobNames = ['bench%04d_%05d' % (n, k) for k in range(nTasks)]
+        for nlName in jobNames:
+            with open(os.path.join(folder, nlName + '.nl'), 'wb') as f:
+                f.write(os.urandom(size))
+        names.append(jobNames)
+    with open(os.path.join(folder, 'bench.opt'), 'w') as f:
+        f.write('max_iter 100\n')
+    return names
+
+
+async def runEverestJob(session, folder, nlNames, parallel):
+    # inputs of SSOP job like SsopSession.makeJobFiles
+    plan = io.BytesIO(ssop_session.makePlan(nlNames, 'bench.opt').encode('utf-8'))
+    plan.name = 'bench.plan'
+    files = io.BytesIO()
+    files.name = nlNames[0] + '.zip'
+    members = [(nlName + '.nl', os.path.join(folder, nlName + '.nl')) for nlName in nlNames]
+    ssop_zip.writeZip(files, members + [('bench.opt', os.path.join(folder, 'bench.opt'))], 0)
+    files.seek(0)
+    upBytes = len(plan.getvalue()) + len(files.getvalue())
+    times = {'start': timer()}
+    job = await session.run(ssop_config.SSOP_ID, {'plan': plan, 'files': files}, job_name=nlNames[0])
+    times['submitted'] = timer()
+    try:
+        result = await job.result()
+    except everest.JobException:
+        return dict(times, failed=True, upBytes=upBytes, downBytes=0)
+    times['done'] = timer()
+    path = os.path.join(folder, nlNames[0] + '-results.zip')
+    await session.getFile(result['results'], path, parallel)
+    times['downloaded'] = timer()
+    return dict(times, failed=False, upBytes=upBytes, downBytes=os.path.getsize(path))
+
+
+async def benchEverest(endpoint, folder, names, args):
+    async with everest.AsyncSession('bench', endpoint, token=everest_mock.TOKEN, poll_interval=args.poll_interval,
+                                    max_concurrency=max(everest.MAX_CONCURRENCY, len(names))) as session:
+        return await asyncio.gather(*[runEverestJob(session, folder, nlNames, args.download_parallel)
+                                      for nlNames in names])
+
+
+def benchSsop(endpoint, folder, names, args):
+    tokenFile = os.path.join(folder, '.token')
+    with open(tokenFile, 'w') as f:
+        f.write(everest_mock.TOKEN)
+    session = ssop_session.SsopSession('bench', token=tokenFile, workdir=folder, endpoint=endpoint, journal=None,
+                                       cacheDir=None, downloadParallel=args.download_parallel, zipLevel=0)
+    session.session.asession.poll_interval = args.poll_interval
+    batch = ssop_scheduler.JobBatch(session, os.path.join(folder, ssop_config.SSOP_THROUGHPUT_FILE))
+    batch.start([nlName for nlNames in names for nlName in nlNames], 'bench.opt', 'ipopt')
+    jobs = []
+    try:
+        for nlNames in names:
+            start = timer()
+            job = batch.submit(nlNames, 'bench.opt', 'ipopt')
+            jobs.append((job, {'start': start, 'submitted': timer(), 'failed': job is None,
+                               'upBytes': sum(batch.sizes[nlName] for nlName in nlNames), 'downBytes': 0}))
+        running = [job for job, times in jobs if job is not None]
+        timesOf = dict((id(job), times) for job, times in jobs)
+        while running:
+            done, running = session.session.wait(running)
+            for job in done:
+                times = timesOf[id(job)]
+                times['done'] = timer()
+                info = batch.finish(job)[0]
+                times['downloaded'] = timer()
+                times['failed'] = info['state'] != 'DONE'
+                path = session.resultFiles.get(job.id)
+                times['downBytes'] = os.path.getsize(path) if path is not None else 0
+    finally:
+        session.session.close()
+    return [times for job, times in jobs]
+
+
+def report(results, wall):
+    ok = [r for r in results if not r['failed']]
+    latency = np.array([r['downloaded'] - r['start'] for r in ok])
+    upBytes = sum(r['upBytes'] for r in results)
+    downBytes = sum(r['downBytes'] for r in ok)
+    upTime = busyTime([(r['start'], r['submitted']) for r in results])
+    downTime = busyTime([(r['done'], r['downloaded']) for r in ok])
+    summary = {'jobs': len(results), 'failed': len(results) - len(ok), 'seconds': wall,
+               'jobsPerSecond': len(ok) / wall if wall > 0 else None,
+               'uploadMB': upBytes / 1e6, 'uploadMBps': upBytes / 1e6 / upTime if upTime > 0 else None,
+               'downloadMB': downBytes / 1e6, 'downloadMBps': downBytes / 1e6 / downTime if downTime > 0 else None,
+               'latency': dict(('p%d' % p, float(np.percentile(latency, p)) if len(ok) else None) for p in PERCENTILES)}
+    if len(ok):
+        summary['latency']['max'] = float(latency.max())
+    return summary
+
+
+def printReport(summary, stats):
+    print('jobs: %d, failed: %d, %.3f s, %.2f jobs/s' %
+          (summary['jobs'], summary['failed'], summary['seconds'], summary['jobsPerSecond'] or 0.))
+    print('upload:   %10.3f MB %10.2f MB/s' % (summary['uploadMB'], summary['uploadMBps'] or 0.))
+    print('download: %10.3f MB %10.2f MB/s' % (summary['downloadMB'], summary['downloadMBps'] or 0.))
+    print('latency, s: ' + ', '.join('%s %.3f' % (key, value) for key, value in sorted(summary['latency'].items())
+                                      if value is not None))
+    if stats is not None:
+        print('server: ' + ', '.join('%s %d' % (key, value) for key, value in sorted(stats.items())))
+
+
+if __name__ == "__main__":
+    parser = makeParser()
+    args = parser.parse_args()
+
+    mock = None
+    endpoint = args.endpoint
+    if endpoint is None:
+        mock = everest_mock.MockEverest(latency=args.latency, failRate=args.fail_rate, dropRate=args.drop_rate,
+                                        jobTime=args.job_time, taskTime=args.task_time,
+                                        solValues=args.sol_values).start()
+        endpoint = mock.endpoint
+    tmpDir = tempfile.mkdtemp(prefix='benchEverest_')
+    try:
+        names = makeNlFiles(tmpDir, args.jobs, args.tasks, args.nl_size)
+        start = timer()
+        if args.client == 'everest':
+            loop = asyncio.new_event_loop()
+            results = loop.run_until_complete(benchEverest(endpoint, tmpDir, names, args))
+            loop.close()
+        else:
+            results = benchSsop(endpoint, tmpDir, names, args)
+        summary = report(results, timer() - start)
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+        if mock is not None:
+            mock.stop()
+
+    summary['client'] = args.client
+    summary['server'] = mock.stats if mock is not None else None
+    printReport(summary, summary['server'])
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=1, sort_keys=True)
@@ -0,0 +1,104 @@
+from __future__ import print_function
+
+import os
+import argparse
+import filecmp
+import gc
+import shutil
+import tempfile
+from timeit import default_timer as timer
+
+import numpy as np
+import pandas as pd
+
+from write import write_nl_only
+
+from sptpmodel_5 import SPTPmodel_5
+from SptpData_5 import SptpData_5
+from sptpnl_5 import writeNlDirect
+
+CURRENCIES = ['EUR', 'USD', 'GBP', 'JPY', 'CHF']
+
+
+def makeParser():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+                                     description='Compare build time of SPTPmodel_5 by rules and by fast builder, '
+                                                 'and time of direct NL writer (sparse model only)')
+    parser.add_argument('-sz', '--sizes', nargs='+', default=['100x50x4', '300x150x8', '600x300x10'],
+                        help='sizes of random problems as MxNxK')
+    parser.add_argument('-d', '--density', type=float, default=0.3, help='share of pairs (i,j) with p_ij > 0')
+    parser.add_argument('-ds', '--dense', action='store_true', help='declare x_ij for all pairs of I x J')
+    parser.add_argument('-nc', '--nocheck', action='store_true', help='do not compare NL-files made by both builders')
+    parser.add_argument('-sd', '--seed', type=int, default=0, help='seed of random data')
+    return parser
+
+
+def makeRandomCsv(folder, M, N, K, density=0.3, seed=0):
+    """
+    Writes 7 CSV-files of random SPTP data (see SptpData_5) to the folder
+    :return: dictionary of path2*_csv arguments of SptpData_5
+    """
+    rng = np.random.RandomState(seed)
+    nCur = min(len(CURRENCIES), M)
+    I = CURRENCIES[:nCur] + ['Asset %d' % i for i in range(M - nCur)]
+    J = ['Requirement %d' % j for j in range(N)]
+    K = ['Type %d' % k for k in range(K)]
+    T = np.zeros((M, len(K)), dtype=int)
+    T[np.arange(M), rng.randint(0, len(K), M)] = 1
+    P = np.where(rng.rand(M, N) < density, np.round(10 * rng.rand(M, N), 3), 0.)
+    frames = {'a': pd.DataFrame({'Units': rng.randint(1, 1000, M).astype(float)}, index=I),
+              'b': pd.DataFrame({'Amount': rng.randint(1, 50, N).astype(float)}, index=J),
+              'C': pd.DataFrame(np.round(5 * rng.rand(M, N), 3), index=I, columns=J),
+              'D': pd.DataFrame(np.round(100 * rng.rand(len(K), N), 3), index=K, columns=J),
+              'P': pd.DataFrame(P, index=I, columns=J),
+              'S': pd.DataFrame(np.round(1 + rng.rand(M, N), 3), index=I, columns=J),
+              'T': pd.DataFrame(T, index=I, columns=K)}
+    # The last asset takes no room (s_ij = 0), so its row of cons_Assets is empty and skipped by all builders
+    frames['S'].iloc[-1] = 0.
+    paths = {}
+    for key, frame in frames.items():
+        path = os.path.join(folder, key + '.csv')
+        frame.to_csv(path)
+        paths['path2' + key + '_csv'] = path
+    return paths
+
+
+if __name__ == "__main__":
+    parser = makeParser()
+    args = parser.parse_args()
+
+    tmpDir = tempfile.mkdtemp(prefix='benchSptp_5_')
+    try:
+        print('%-14s %8s %10s %10s %8s %10s %s' % ('MxNxK', 'pairs', 'rules, s', 'fast, s', 'speedup', 'direct, s', 'NL'))
+        for size in args.sizes:
+            M, N, K = (int(v) for v in size.split('x'))
+            folder = os.path.join(tmpDir, size)
+            os.makedirs(folder)
+            theData = SptpData_5('bench', debug=False, **makeRandomCsv(folder, M, N, K, args.density, args.seed))
+
+            timing = {}
+            nlNames = {}
+            for fast in (False, True):
+                # garbage of the former model is not collected while the next one is timed
+                gc.collect()
+                start = timer()
+                theModel = SPTPmodel_5(theData, isInteger=True, sparse=not args.dense, fast=fast)
+                timing[fast] = timer() - start
+                if not args.nocheck:
+                    nlNames[fast] = write_nl_only(theModel.model, os.path.join(folder, theModel.name + ('_fast' if fast else '')),
+                                                  symbolic_solver_labels=True)
+            # Direct NL writer makes NL-file of the sparse model, time includes writing the file
+            timing['direct'] = float('nan')
+            if not args.dense:
+                start = timer()
+                nlNames['direct'] = writeNlDirect(theData, os.path.join(folder, theModel.name + '_direct'))
+                timing['direct'] = timer() - start
+            if args.nocheck:
+                sameNl = 'not checked'
+            else:
+                sameNl = all(filecmp.cmp(nlNames[False], nl, shallow=False) for nl in nlNames.values())
+                sameNl = 'same' if sameNl else 'DIFFERENT'
+            print('%-14s %8d %10.3f %10.3f %8.2f %10.3f %s' % (size, len(theModel.model.IJ), timing[False], timing[True],
+                                                             timing[False] / timing[True], timing['direct'], sameNl))
+    finally:
+        shutil.rmtree(tmpDir)
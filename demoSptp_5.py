@@ -4,10 +4,11 @@ from future.utils import iteritems
 import os
 import sys
 import argparse
+import numpy as np
 
-from write import write_nl_only
-from write import get_smap_var
-from read import read_sol_smap_var
+from write import write_nl_omap
+from read import read_sol_omap
+from read import read_sol_arrays, load_order_positions, is_solved
 
 # import ssop_config
 from ssop_session import *
@@ -15,6 +16,7 @@ from ssop_session import *
 import ssop_config
 from sptpmodel_5 import *
 from SptpData_5 import *
+from sptpnl_5 import writeNlDirect, modelName
 
 def makeParser():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -29,6 +31,15 @@ def makeParser():
     parser.add_argument('-cf', '--cleanfiles', action='store_true', help='clean working directory')
     parser.add_argument('-cj', '--cleanjobs', action='store_true', help='clean jobs from server')
     parser.add_argument('-x', '--extra', action='store_true', help='extra tests')
+    parser.add_argument('-dc', '--datacache', default='', help='folder to cache parsed CSV data, by default <workdir>/datacache')
+    parser.add_argument('-nc', '--nocache', action='store_true', help='always parse CSV data, do not use cache')
+    parser.add_argument('-fb', '--fastbuild', action='store_true', help='build the model by vectorized builder')
+    parser.add_argument('-fnl', '--fast-nl', action='store_true',
+                        help='write NL-file directly from data, without the model (see sptpnl_5.py)')
+    parser.add_argument('-lm', '--loadmodel', action='store_true',
+                        help='build the model and load SOL-file into it, else SOL-file is read into arrays')
+    parser.add_argument('-np', '--nlprocesses', type=int, default=0,
+                        help='number of processes to format NL-file by --fast-nl, 0 - no extra processes')
     return parser
 
 def makeIpoptOptionsFile(workdir, optFileName):
@@ -56,12 +67,48 @@ def makeScipOptionsFile(workdir, optFileName):
 
 def makeNlFile(theModel, workdir, **params):
     # theModel = SPTPmodel(SptpData(M, N), isInteger=True)
-    nlName = write_nl_only(theModel.model, workdir + '/' + theModel.name,  symbolic_solver_labels=True)
+    # Order-based symbol map is saved next to NL-file to read SOL-file later without writing the model again
+    nlName, mapName = write_nl_omap(theModel.model, workdir + '/' + theModel.name,  symbolic_solver_labels=True)
     return nlName
 
-def checkResults(theModel, workdir):
-    smap = get_smap_var(theModel.model)
-    results = read_sol_smap_var(theModel.model, workdir + "/" + theModel.name, smap)
+def checkResults(theData, workdir):
+    # SOL-file is read into arrays and mapped to pairs (i,j) by order-based symbol map, the model is not built
+    name = modelName(theData)
+    x, y, message, solveCode = read_sol_arrays(workdir + "/" + name)
+    cols, pairs = load_order_positions(workdir + "/" + name, 'x')
+    print("Solution of ", name)
+    print("Solver: %s (solve result %d)" % (message, solveCode))
+    # SOL-file of a failed solve may have no primal values at all
+    if not is_solved(solveCode):
+        print("The problem is not solved (solve result %d), no solution to check" % (solveCode))
+        return
+    if len(x) != len(cols):
+        print("SOL-file has %d primal values, NL-file has %d variables: no solution to check" % (len(x), len(cols)))
+        return
+    iIdx, jIdx = theData.getPairIJ(True)
+    xPair = np.zeros(len(iIdx))
+    xPair[pairs] = x[cols]
+
+    with open(workdir + "/" + name + '.sol.txt', 'w') as f:
+        sBuf = ('Optimal cost: %.3f' % (np.dot(theData.getPairValues(theData.getCArray()), xPair)))
+        print(sBuf)
+        f.write(sBuf + '\n')
+
+        sBuf = 'i, j, x_ij (>1.e-6)'
+        print(sBuf)
+        f.write(sBuf + '\n')
+
+        I, J = theData.I.tolist(), theData.J.tolist()
+        for n in np.nonzero(xPair > 1.e-6)[0].tolist():
+            sBuf = ("%s, %s, %.2f" % (str(I[iIdx[n]]), str(J[jIdx[n]]), xPair[n]))
+            print(sBuf)
+            f.write(sBuf+'\n')
+        f.close()
+
+    return
+
+def checkResultsModel(theModel, workdir):
+    results = read_sol_omap(theModel.model, workdir + "/" + theModel.name, workdir + "/" + theModel.name)
     theModel.model.solutions.load_from(results)
     # solution have been loaded to the model
     print("Solution of ", theModel.name)
@@ -75,12 +122,11 @@ def checkResults(theModel, workdir):
         print(sBuf)
         f.write(sBuf + '\n')
 
-        for i in theModel.model.I:
-            for j in theModel.model.J:
-                if theModel.model.x[i,j]() > 1.e-6:
-                    sBuf = ("%s, %s, %.2f" % (str(i), str(j), theModel.model.x[i,j]()))
-                    print(sBuf)
-                    f.write(sBuf+'\n')
+        for (i, j) in theModel.model.IJ:
+            if theModel.model.x[i,j]() > 1.e-6:
+                sBuf = ("%s, %s, %.2f" % (str(i), str(j), theModel.model.x[i,j]()))
+                print(sBuf)
+                f.write(sBuf+'\n')
         f.close()
 
     return
@@ -106,6 +152,10 @@ if __name__ == "__main__":
         print('Reading data...')
     start_read_check = timer()
 
+    cacheDir = None
+    if not args.nocache:
+        cacheDir = args.datacache if args.datacache else workdir + '/datacache'
+
     theData = SptpData_5(args.problem, \
                        path2a_csv='../financial-services/data/processed/version 5/a_vector.csv', \
                        path2b_csv='../financial-services/data/processed/version 5/b_vector.csv', \
@@ -113,7 +163,8 @@ if __name__ == "__main__":
                        path2D_csv='../financial-services/data/processed/version 5/d_matrix.csv', \
                        path2P_csv='../financial-services/data/processed/version 5/p_matrix.csv', \
                        path2S_csv='../financial-services/data/processed/version 5/s_matrix.csv', \
-                       path2T_csv='../financial-services/data/processed/version 5/t_matrix.csv')
+                       path2T_csv='../financial-services/data/processed/version 5/t_matrix.csv', \
+                       cacheDir=cacheDir)
     # Check necessary condition for feasibility
     if args.action == 'nl':
         checkDict = theData.checkFeasible(debug=True)
@@ -127,9 +178,24 @@ if __name__ == "__main__":
         print('Reading took: %g sec' % (timer() - start_read_check))
 
 
+    # SOL-file is read into arrays, the model is not needed
+    if args.action == 'sol' and not args.loadmodel:
+        print('Checking SOL-file')
+        checkResults(theData, workdir)
+        quit()
+
+    # NL-file is written directly from data, the model is not needed
+    if args.action == 'nl' and args.fast_nl:
+        print('Writing NL-file directly')
+        start_makeNl = timer()
+        nlName = writeNlDirect(theData, workdir + '/' + modelName(theData), isInteger=True,
+                               nProcesses=args.nlprocesses)
+        print('writeNlDirect(%s) took: %g sec' % (modelName(theData), timer() - start_makeNl))
+        quit()
+
     print('Model creating ...')
     start_model = timer()
-    theModel = SPTPmodel_5(theData, isInteger=True, debug=False)
+    theModel = SPTPmodel_5(theData, isInteger=True, debug=False, fast=args.fastbuild)
     # with open(workdir + '/' + theModel.name + '.mod.txt', 'w') as f:
     #     theModel.model.pprint(ostream=f)
     #     f.close()
@@ -165,7 +231,7 @@ if __name__ == "__main__":
     # Write SOL-files
     if args.action == 'sol':
         print('Checking SOL-file')
-        checkResults(theModel, workdir)
+        checkResultsModel(theModel, workdir)
         quit()
 
     quit()
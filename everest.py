@@ -3,14 +3,61 @@ from __future__ import print_function
 from future.utils import iteritems
 
 import argparse
+import asyncio
+import functools
 import getpass
+import hashlib
 import json
 import logging
 import os
+import random
 import requests
+import requests.adapters
 import sys
-import time
 import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+# Job states after which the state does not change
+FINAL_STATES = ('DONE', 'FAILED', 'CANCELLED', 'BROKEN')
+# Max number of HTTP requests in flight (size of the pool of threads making them)
+MAX_CONCURRENCY = 16
+# Seconds between checks of job states, the interval grows by POLL_BACKOFF up to MAX_POLL_INTERVAL
+# while nothing changes and is randomized by +-POLL_JITTER
+POLL_INTERVAL = 2
+MAX_POLL_INTERVAL = 30
+POLL_BACKOFF = 1.5
+POLL_JITTER = 0.2
+# Transport: seconds to connect and to wait for data, number of retries of failed request
+# and base of exponential backoff between them (seconds), statuses of responses to retry
+TIMEOUT = (10, 60)
+RETRIES = 5
+BACKOFF = 0.5
+MAX_BACKOFF = 30
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Requests with these methods may be repeated, others - only if connection to the server failed
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+# Downloads: size of buffer, number of resumptions of broken transfer,
+# files smaller than PARALLEL_MIN_SIZE are not split into ranges fetched in parallel
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+DOWNLOAD_RETRIES = 5
+PARALLEL_MIN_SIZE = 8 << 20
+# Seconds an uploaded file is reused for inputs with the same name and contents,
+# it should be less than lifetime of temporary files of Everest
+UPLOAD_CACHE_TTL = 1800
+# Extension of partially downloaded file, the download is resumed from its end;
+# validator (ETag or Last-Modified) of the file of the server is kept in PARTIAL_EXT + VALIDATOR_EXT,
+# ranges fetched in parallel are written to RANGES_EXT file, it is never resumed
+PARTIAL_EXT = '.part'
+VALIDATOR_EXT = '.validator'
+RANGES_EXT = '.ranges'
+# Header with a key of submission, the same in all attempts, for servers discarding repeated requests;
+# if the response to submission is lost, the job is found by its name, inputs and time of submission
+# (milliseconds since epoch on the server, SUBMIT_TIME_SKEW seconds of clock difference are allowed)
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+SUBMIT_TIME_SKEW = 60
 
 def get_token(server_uri, user, password, label, lifetime=None):
     request = {
@@ -29,6 +76,27 @@ def get_token(server_uri, user, password, label, lifetime=None):
     token = r.json()['access_token']
     return token
 
+def make_http_session(pool_size):
+    # Session keeping up to pool_size connections to every host alive,
+    # requests are not retried by urllib3: AsyncSession.request and fetch repeat them
+    http = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size, max_retries=0)
+    http.mount('http://', adapter)
+    http.mount('https://', adapter)
+    return http
+
+def is_not_sent(err):
+    # True if the request failed before it was sent (no connection), so it may be repeated whatever its method is
+    if isinstance(err, requests.exceptions.ConnectTimeout):
+        return True
+    reason = err.args[0] if err.args else None
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+def retry_delay(attempt, backoff):
+    # Exponential backoff with full jitter
+    return random.uniform(0., min(backoff * 2 ** attempt, MAX_BACKOFF))
+
 def debug_request(r):
     if logging.getLogger().isEnabledFor(logging.DEBUG):    
         logging.debug("REQUEST: " + str(r.request.body))
@@ -37,9 +105,59 @@ def debug_request(r):
 def is_file(f):
     return isinstance(f, file) if sys.version_info[0] == 2 else hasattr(f, 'read')
 
-class Session:
+def content_range_size(r):
+    # Full size of the file from 'Content-Range: bytes a-b/size' header, None if unknown
+    value = r.headers.get('Content-Range', '')
+    size = value.rpartition('/')[2]
+    return int(size) if size.isdigit() else None
+
+def response_validator(r):
+    # Strong ETag or Last-Modified of the response for If-Range, None if there are none
+    etag = r.headers.get('ETag')
+    if etag is not None and not etag.startswith('W/'):
+        return etag
+    return r.headers.get('Last-Modified')
+
+def remove_files(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def stream_sha256(f):
+    # Digest of the rest of file object f, its position is restored
+    pos = f.tell()
+    h = hashlib.sha256()
+    for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), f.read(0)):
+        h.update(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+    f.seek(pos)
+    return h.hexdigest()
+
+def stream_size(f):
+    # Bytes of the rest of file object f, its position is restored
+    pos = f.tell()
+    size = f.seek(0, os.SEEK_END) - pos
+    f.seek(pos)
+    return size
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return stream_sha256(f)
+
+class AsyncSession:
 
     def __init__(self, *args, **kwargs):
+        """
+        Asynchronous client of Everest: all calls are coroutines, HTTP requests are made by requests
+        in a pool of threads, at most max_concurrency of them are in flight at once.
+        States of all submitted jobs are checked by one poller making one request per check,
+        the poller runs only while some jobs are not finished
+        :param args: name, endpoint (e.g. https://everest.distcomp.org)
+        :param kwargs: token or user, password, app (label of new token);
+                       max_concurrency (MAX_CONCURRENCY), poll_interval (POLL_INTERVAL),
+                       max_poll_interval (MAX_POLL_INTERVAL), upload_cache_ttl (UPLOAD_CACHE_TTL, 0 - no cache);
+                       transport: pool_size (max_concurrency), timeout (TIMEOUT, seconds or (connect, read) pair),
+                       retries (RETRIES), backoff (BACKOFF)
+        """
         self.name = args[0]
         self.endpoint = args[1]
         token = kwargs.get('token', '')
@@ -48,145 +166,227 @@ class Session:
             password = kwargs['password']
             app = kwargs.get('app', 'python-api')
             token = get_token(self.endpoint, user, password, app)
-        self.session = requests.Session()
+        self.max_concurrency = kwargs.get('max_concurrency', MAX_CONCURRENCY)
+        self.timeout = kwargs.get('timeout', TIMEOUT)
+        self.retries = kwargs.get('retries', RETRIES)
+        self.backoff = kwargs.get('backoff', BACKOFF)
+        pool_size = kwargs.get('pool_size', self.max_concurrency)
+        self.session = make_http_session(pool_size)
         self.session.headers.update({'Authorization': 'Bearer ' + token})
+        # files outside of Everest are requested without the token
+        self.external = make_http_session(pool_size)
+        self.poll_interval = kwargs.get('poll_interval', POLL_INTERVAL)
+        self.max_poll_interval = max(kwargs.get('max_poll_interval', MAX_POLL_INTERVAL), self.poll_interval)
+        self.executor = ThreadPoolExecutor(self.max_concurrency)
+        self.semaphore = None
         self.job_counter = 0
-        self.submitted_jobs = []
-        self.deferred_jobs = []
-        self.timer = threading.Timer(3, self.__checkJobs)
-        self.timer.start()
-
-    def __enter__(self):
+        # coroutines submitting deferred jobs
+        self.watchers = set()
+        # submitted jobs which are not finished yet, by id
+        self.tracked = {}
+        # ids of all jobs submitted by the session
+        self.submitted = set()
+        self.poller = None
+        self.poll_delay = self.poll_interval
+        self.wakeup = None
+        # uploads of input files: (name, sha256) -> (task returning URI, expiration time)
+        self.upload_cache_ttl = kwargs.get('upload_cache_ttl', UPLOAD_CACHE_TTL)
+        self.uploads = {}
+
+    async def __aenter__(self):
         return self
 
-    def __exit__(self, type, value, traceback):
-        self.close()
-
-    def getTokenInfo(self):
-        r = self.session.get(self.endpoint + '/api/auth/access_token')
-        debug_request(r)
+    async def __aexit__(self, type, value, traceback):
+        await self.close()
+
+    async def call(self, func, *args, **kwargs):
+        # Blocking func is called in the pool of threads, number of calls in flight is bounded
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.semaphore:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, functools.partial(func, *args, **kwargs))
+
+    async def request(self, method, path, idempotent=None, **kwargs):
+        """
+        Makes request to Everest API, repeats it after connection errors, timeouts and RETRY_STATUSES responses
+        :param idempotent: request may be repeated, default - if its method is in IDEMPOTENT_METHODS.
+                           Other requests are repeated only if they are not sent (the connection is not made)
+        :param kwargs: arguments of requests.request, timeout is self.timeout by default
+        """
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        kwargs.setdefault('timeout', self.timeout)
+        # uploaded files are read again by repeated request
+        files = [(f, f.tell()) for f in kwargs.get('files', {}).values() if hasattr(f, 'seek')]
+        attempt = 0
+        while True:
+            try:
+                r = await self.call(self.session.request, method, self.endpoint + path, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+                if not (idempotent or is_not_sent(err)) or attempt >= self.retries:
+                    raise
+                logging.debug("Repeating %s %s: %s" % (method, path, err))
+            else:
+                debug_request(r)
+                if not idempotent or attempt >= self.retries or r.status_code not in RETRY_STATUSES:
+                    return r
+                logging.debug("Repeating %s %s: %d(%s)" % (method, path, r.status_code, r.reason))
+            await asyncio.sleep(retry_delay(attempt, self.backoff))
+            for f, pos in files:
+                f.seek(pos)
+            attempt += 1
+
+    async def getTokenInfo(self):
+        r = await self.request('GET', '/api/auth/access_token')
         r.raise_for_status()
         return r.json()
 
     def app(self, app_id):
-        return App(self, app_id)
+        return App(app_id, self)
 
-    def getAppDesc(self, app_id):
-        r = self.session.get(self.endpoint + '/api/apps/' + app_id)
-        debug_request(r)
+    async def getAppDesc(self, app_id):
+        r = await self.request('GET', '/api/apps/' + app_id)
         r.raise_for_status()
         return r.json()
 
-    def run(self, app_id, inputs, resources=[], job_name=None):
+    async def run(self, app_id, inputs, resources=[], job_name=None):
         # create new job
         if job_name is None:
             job_name = self.name + " - Job " + str(self.job_counter)
-        job = Job(self, job_name, app_id, inputs, resources)
+        job = AsyncJob(self, job_name, app_id, inputs, resources)
         self.job_counter += 1
 
         # check if job inputs are ready
         if job.isReady():
-            self.__submitJob(job)
-            self.submitted_jobs.append(job)
+            await self.submitJob(job)
+            self.watch(job)
         else:
-            self.deferred_jobs.append(job)
             print("Deferred job")
+            self.watch(job, deferred=True)
 
         return job
 
-    def runAll(self, app_id, tasks, resources=[], job_name_prefix=None):
-        jobs = []
-        task_num = 0
-        for inputs in tasks:
+    async def runAll(self, app_id, tasks, resources=[], job_name_prefix=None):
+        # jobs are submitted concurrently
+        runs = []
+        for task_num, inputs in enumerate(tasks):
             if job_name_prefix is None:
-                jobs.append(self.run(app_id, inputs, resources))
+                runs.append(self.run(app_id, inputs, resources))
             else:
-                jobs.append(self.run(app_id, inputs, resources, job_name_prefix + str(task_num)))
-            task_num += 1
-        return jobs
-
-    def getJobs(self):
-        r = self.session.get(self.endpoint + '/api/jobs')
-        debug_request(r)
+                runs.append(self.run(app_id, inputs, resources, job_name_prefix + str(task_num)))
+        return list(await asyncio.gather(*runs))
+
+    async def wait(self, jobs, timeout=None, return_when=asyncio.FIRST_COMPLETED):
+        """
+        Waits for final state of some (FIRST_COMPLETED) or all (ALL_COMPLETED) of the jobs
+        :return: lists of done and pending jobs
+        """
+        for job in jobs:
+            if not job.done.is_set() and not job.watched and job.id is not None:
+                self.watch(job)
+        if any(not job.done.is_set() for job in jobs):
+            waiters = [asyncio.ensure_future(job.done.wait()) for job in jobs]
+            waited, pending = await asyncio.wait(waiters, timeout=timeout, return_when=return_when)
+            for waiter in pending:
+                waiter.cancel()
+        return [job for job in jobs if job.done.is_set()], [job for job in jobs if not job.done.is_set()]
+
+    async def getJobsJson(self):
+        r = await self.request('GET', '/api/jobs')
         r.raise_for_status()
-        return [Job.fromjson(self, job_json) for job_json in r.json()]
+        return r.json()
 
-    def getJobStatus(self, job_id):
-        r = self.session.get(self.endpoint + '/api/jobs/' + job_id)
-        debug_request(r)
+    async def getJobs(self):
+        return [AsyncJob.fromjson(self, job_json) for job_json in (await self.getJobsJson())]
+
+    async def getJobStatus(self, job_id):
+        r = await self.request('GET', '/api/jobs/' + job_id)
         r.raise_for_status()
         return r.json()
 
-    def getJobState(self, job_id):
-        job_status = self.getJobStatus(job_id)
+    async def getJob(self, job_id):
+        # Job known by id (e.g. submitted by earlier run), it is watched when its result is requested
+        return AsyncJob.fromjson(self, await self.getJobStatus(job_id))
+
+    async def getJobState(self, job_id):
+        job_status = await self.getJobStatus(job_id)
         return job_status['state']
 
-    def getJobLog(self, job_id, path):
-        dir = os.path.abspath(os.path.join(path, os.pardir))
-        if not os.path.exists(dir):
-            os.makedirs(dir)
-        r = self.session.get(self.endpoint + '/api/jobs/' + job_id + '/log', stream=True)
-        r.raise_for_status()
-        with open(path, 'wb') as fd:
-            for chunk in r.iter_content(chunk_size=1024):
-                fd.write(chunk)
-
-    def cancelJob(self, job_id):    
-        r = self.session.post(
-            self.endpoint + '/api/jobs/' + job_id + '/cancel'
-        )
-        debug_request(r)
+    async def getJobLog(self, job_id, path):
+        await self.download(self.endpoint + '/api/jobs/' + job_id + '/log', path, self.session)
+
+    async def cancelJob(self, job_id):
+        r = await self.request('POST', '/api/jobs/' + job_id + '/cancel', idempotent=True)
         r.raise_for_status()
         print("Cancelled job " + job_id)
 
-    def deleteJob(self, job_id):    
-        r = self.session.delete(
-            self.endpoint + '/api/jobs/' + job_id
-        )
-        debug_request(r)
+    async def deleteJob(self, job_id):
+        r = await self.request('DELETE', '/api/jobs/' + job_id)
         r.raise_for_status()
         print("Deleted job " + job_id)
 
-    def deleteJobs(self, name):
-        r = self.session.delete(
-            self.endpoint + '/api/jobs?name=' + name
-        )
-        debug_request(r)
+    async def deleteJobs(self, name):
+        r = await self.request('DELETE', '/api/jobs?name=' + name)
         r.raise_for_status()
         print("Deleted jobs by name " + name)
 
-    def __uploadFile(self, file):
-        r = self.session.post(
-            self.endpoint + '/api/files/temp',
-            files={'file': file}
-        )
+    async def uploadFile(self, file):
+        # repeated upload leaves unused temporary file only
+        r = await self.request('POST', '/api/files/temp', idempotent=True, files={'file': file})
         r.raise_for_status()
         file_uri = r.json()['uri']
-        #print(file_uri)
         return file_uri
 
-    def __submitJob(self, job):
-        # process inputs
+    async def uploadInput(self, file):
+        """
+        Uploads input file, the file with the same name and contents is uploaded once per upload_cache_ttl seconds;
+        contents are identified by attribute sha256 of the file object if it is set (e.g. hex digest computed
+        from digests of the files packed into it), otherwise they are hashed
+        :return: URI of the file, bytes sent (0 if the file is uploaded already)
+        """
+        size = stream_size(file)
+        if self.upload_cache_ttl <= 0:
+            return await self.uploadFile(file), size
+        digest = getattr(file, 'sha256', None)
+        if digest is None:
+            digest = await self.call(stream_sha256, file)
+        key = (os.path.basename(str(getattr(file, 'name', ''))), digest)
+        entry = self.uploads.get(key)
+        if entry is None or entry[1] < time.time():
+            entry = (asyncio.ensure_future(self.uploadFile(file)), time.time() + self.upload_cache_ttl)
+            self.uploads[key] = entry
+        else:
+            size = 0
+        try:
+            return await asyncio.shield(entry[0]), size
+        except Exception:
+            if self.uploads.get(key) is entry:
+                del self.uploads[key]
+            raise
+
+    async def submitJob(self, job):
+        # process inputs: read output values, upload input files (also in arrays) at once
+        uploads = []
         for param, value in iteritems(job.inputs):
-            # upload input files
             if is_file(value):
-                file_uri = self.__uploadFile(value)
-                job.inputs[param] = file_uri
-            # read output values
-            if isinstance(value, Output):
+                uploads.append((job.inputs, param, value))
+            elif isinstance(value, Output):
                 job.inputs[param] = value.value()
-            # same for arrays
-            if isinstance(value, list):
-                new_list = []
-                for item in value:
-                    if is_file(file):
-                        file_uri = self.__uploadFile(item)
-                        new_list.append(file_uri)
+            elif isinstance(value, list):
+                new_list = list(value)
+                for n, item in enumerate(value):
+                    if is_file(item):
+                        uploads.append((new_list, n, item))
                     elif isinstance(item, Output):
-                        new_list.append(item.value())
-                    else:
-                        new_list.append(item)
+                        new_list[n] = item.value()
                 job.inputs[param] = new_list
+        job.times['upload'] = time.time()
+        uploaded = await asyncio.gather(*[self.uploadInput(file) for inputs, key, file in uploads])
+        job.times['uploaded'] = time.time()
+        for (inputs, key, file), (file_uri, size) in zip(uploads, uploaded):
+            inputs[key] = file_uri
+            job.uploaded_bytes += size
 
         # prepare request
         req = {}
@@ -194,86 +394,400 @@ class Session:
         req['inputs'] = job.inputs
         if len(job.resources) > 0:
             req['resources'] = job.resources
-        #print(req)
-
-        # submit job
-        r = self.session.post(
-            self.endpoint + '/api/apps/' + job.app_id, 
-            headers = {'Content-Type': 'application/json'},
-            data = json.dumps(req)
-        )
-        debug_request(r)
+
+        # submit job, the request is repeated only if the job is not found on the server:
+        # a job with the same name and inputs submitted after the first attempt by another session
+        headers = {'Content-Type': 'application/json', IDEMPOTENCY_HEADER: uuid.uuid4().hex}
+        since = time.time() - SUBMIT_TIME_SKEW
+        for attempt in range(self.retries + 1):
+            error = None
+            try:
+                r = await self.request('POST', '/api/apps/' + job.app_id, headers=headers, data=json.dumps(req))
+                if r.status_code not in RETRY_STATUSES:
+                    break
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+                error = err
+            if attempt == self.retries:
+                break
+            await asyncio.sleep(retry_delay(attempt, self.backoff))
+            job_json = await self.findJob(req['name'], req['inputs'], since)
+            if job_json is not None:
+                job.id = job_json['id']
+                self.submitted.add(job.id)
+                job.times['submitted'] = time.time()
+                job.setState(job_json['state'])
+                print("Job submitted: " + job.id)
+                return
+        if error is not None:
+            raise error
         if r.status_code == 201:
             resp = r.json()
-            job_id = resp['id']
-            job.id = job_id
-            job_state = resp['state']
-            job.state = job_state
-            print("Job submitted: " + job_id)
+            job.id = resp['id']
+            self.submitted.add(job.id)
+            job.times['submitted'] = time.time()
+            job.setState(resp['state'])
+            print("Job submitted: " + job.id)
         else:
-            #r.raise_for_status()
-            job.state = 'FAILED'
+            job.setState('FAILED')
             print("Failed to submit job! %d(%s) %s" % (r.status_code, r.reason, r.text))
 
-    def __checkJobs(self):
+    async def findJob(self, name, inputs=None, since=None):
+        # Description of the job with the name, None if there is no such job;
+        # if inputs are given, the job has the same inputs, was submitted after since (seconds since epoch)
+        # and is not submitted by the session earlier
+        for job_json in (await self.getJobsJson()):
+            if job_json['name'] != name:
+                continue
+            if inputs is not None:
+                if job_json.get('inputs') != inputs or job_json['id'] in self.submitted:
+                    continue
+                if since is not None and job_json.get('submitted', since * 1000) < since * 1000:
+                    continue
+            return job_json
+        return None
+
+    def watch(self, job, deferred=False):
+        # Deferred job is submitted by its own coroutine when outputs of other jobs are ready,
+        # state of submitted job is checked by the poller
+        job.watched = True
+        if deferred:
+            task = asyncio.ensure_future(self.submitDeferred(job))
+            self.watchers.add(task)
+            task.add_done_callback(self.watchers.discard)
+        else:
+            self.track(job)
+
+    async def submitDeferred(self, job):
         try:
-            # check state of submitted jobs
-            for job in self.submitted_jobs[:]:
-                if job.state == 'DONE' or job.state == 'FAILED' or job.state == 'CANCELLED':
-                    self.submitted_jobs.remove(job)
-                else:
-                    job_status = self.getJobStatus(job.id)
-                    job_state = job_status['state']
-                    if job_state != job.state:
-                        print("Job " + job.id + " state: " + job_state)
-                        job.state = job_state
-                        if job.state == 'DONE' or job.state == 'FAILED':
-                            job._result = job_status['result']
-
-            # check readiness of deferred jobs
-            for job in self.deferred_jobs[:]:
-                if job.isReady():
-                    self.deferred_jobs.remove(job)
-                    self.__submitJob(job)
-                    self.submitted_jobs.append(job)
+            # wait for outputs of other jobs
+            for output in job.outputs():
+                await output.job.done.wait()
+            if job.isBroken():
+                job.setState('BROKEN')
+                print('Found broken job')
+                return
+            await self.submitJob(job)
+            self.track(job)
+        finally:
+            if self.tracked.get(job.id) is not job:
+                job.done.set()
+
+    def track(self, job):
+        if job.id is None or job.state in FINAL_STATES:
+            job.done.set()
+            return
+        self.tracked[job.id] = job
+        if self.poller is None:
+            self.poll_delay = self.poll_interval
+            self.wakeup = asyncio.Event()
+            self.poller = asyncio.ensure_future(self.pollJobs())
+        elif self.poll_delay > self.poll_interval:
+            # new job is checked soon even if the poller has backed off
+            self.poll_delay = self.poll_interval
+            self.wakeup.set()
+
+    async def pollJobs(self):
+        try:
+            while self.tracked:
+                self.wakeup.clear()
+                delay = self.poll_delay * random.uniform(1. - POLL_JITTER, 1. + POLL_JITTER)
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+                if await self.checkJobs():
+                    self.poll_delay = self.poll_interval
                 else:
-                    if job.isBroken():
-                        self.deferred_jobs.remove(job)
-                        job.state = 'BROKEN'
-                        print('Found broken job')
+                    self.poll_delay = min(self.poll_delay * POLL_BACKOFF, self.max_poll_interval)
+        finally:
+            self.poller = None
+
+    async def checkJobs(self):
+        """
+        Updates states of tracked jobs by one request listing all jobs
+        :return: True if state of some job is changed
+        """
+        try:
+            listed = dict((job_json['id'], job_json) for job_json in (await self.getJobsJson()))
         except Exception as err:
             print("Got error while checking jobs:", err)
-        finally:
-            self.timer = threading.Timer(5, self.__checkJobs)
-            self.timer.start()
+            return False
+        changed = False
+        for job_id, job in list(self.tracked.items()):
+            job_status = listed.get(job_id)
+            try:
+                if job_status is None:
+                    # job is missing in the list, ask for it alone
+                    job_status = await self.getJobStatus(job_id)
+                job_state = job_status['state']
+                if job_state == job.state:
+                    continue
+                if (job_state == 'DONE' or job_state == 'FAILED') and 'result' not in job_status:
+                    job_status = await self.getJobStatus(job_id)
+            except Exception as err:
+                print("Got error while checking job %s:" % (job_id), err)
+                continue
+            print("Job " + job_id + " state: " + job_state)
+            if job_state == 'DONE' or job_state == 'FAILED':
+                job._result = job_status.get('result')
+            job.setState(job_state)
+            if job_state in FINAL_STATES:
+                del self.tracked[job_id]
+            changed = True
+        return changed
+
+    def getFileUrl(self, file_uri):
+        # Files of Everest are requested with the token, others - without it
+        if file_uri.startswith('/api/files/'):
+            return self.endpoint + file_uri, self.session
+        return file_uri, self.external
+
+    def probeSize(self, url, http):
+        # Size of the file if the server supports ranges, None otherwise (also if the probe fails)
+        try:
+            with http.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=self.timeout) as r:
+                r.raise_for_status()
+                return content_range_size(r) if r.status_code == 206 else None
+        except requests.exceptions.RequestException as err:
+            logging.debug("Size of %s is unknown: %s" % (url, err))
+            return None
 
-    def getFile(self, file_uri, path):
+    def fetch(self, url, http, path, start=None, end=None):
+        """
+        Writes the file url to path, broken transfer is resumed from the last written byte
+        :param start, end: range of bytes to fetch into the same place of existing file path,
+                           if start is None then whole file is appended to path (it may be partially downloaded
+                           by earlier call, then it is resumed only if the file of the server is not changed,
+                           i.e. its validator in path + VALIDATOR_EXT matches)
+        :return: size of the file given by the server, None if unknown
+        """
+        whole = start is None
+        mode = 'r+b' if os.path.exists(path) else 'w+b'
+        validator = None
+        if whole and os.path.exists(path + VALIDATOR_EXT):
+            with open(path + VALIDATOR_EXT) as v:
+                validator = v.read() or None
+        with open(path, mode) as f:
+            pos = f.seek(0, os.SEEK_END) if whole else f.seek(start)
+            if whole and pos > 0 and validator is None:
+                # contents of the file of the server can not be checked, it is fetched again
+                pos = f.seek(0)
+                f.truncate()
+            retries = 0
+            while True:
+                headers = {}
+                if not whole:
+                    headers['Range'] = 'bytes=%d-%d' % (pos, end)
+                elif pos > 0:
+                    headers['Range'] = 'bytes=%d-' % (pos)
+                    headers['If-Range'] = validator
+                try:
+                    with http.get(url, headers=headers, stream=True, timeout=self.timeout) as r:
+                        if r.status_code == 416 and whole:
+                            size = content_range_size(r)
+                            if size == pos and response_validator(r) == validator:
+                                return size
+                            # partial file does not match the file of the server
+                            pos = f.seek(0)
+                            f.truncate()
+                            continue
+                        r.raise_for_status()
+                        if 'Range' in headers and r.status_code != 206:
+                            if not whole:
+                                raise DownloadException('Server does not return range %s of %s' % (headers['Range'], url))
+                            # the file of the server is changed (If-Range) or ranges are not supported
+                            pos = f.seek(0)
+                            f.truncate()
+                        if whole and pos == 0:
+                            validator = response_validator(r)
+                            with open(path + VALIDATOR_EXT, 'w') as v:
+                                v.write(validator or '')
+                        if r.status_code == 206:
+                            size = content_range_size(r)
+                        elif 'Content-Length' in r.headers:
+                            size = int(r.headers['Content-Length'])
+                        else:
+                            size = None
+                        for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+                            pos += len(chunk)
+                        last = end + 1 if not whole else size
+                        if last is None or pos >= last:
+                            return size
+                        raise requests.exceptions.ChunkedEncodingError('Transfer of %s is broken at %d' % (url, pos))
+                except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                        requests.exceptions.Timeout, requests.exceptions.HTTPError) as err:
+                    if isinstance(err, requests.exceptions.HTTPError) and \
+                            err.response.status_code not in RETRY_STATUSES:
+                        raise
+                    if retries >= DOWNLOAD_RETRIES:
+                        raise
+                    logging.debug("Resuming download of %s from %d: %s" % (url, pos, err))
+                    f.flush()
+                    time.sleep(retry_delay(retries, self.backoff))
+                    retries += 1
+
+    async def download(self, url, path, http, parallel=1, sha256=None):
+        """
+        Downloads url to path through path + PARTIAL_EXT, the download is resumed if the last one is broken.
+        Large file is fetched by parallel ranges into path + RANGES_EXT preallocated by zeros,
+        it is removed if some range fails (such download is not resumed)
+        :param parallel: number of ranges of large file fetched at once
+        :param sha256: expected hex digest of the file, None - only size is checked
+        """
         dir = os.path.abspath(os.path.join(path, os.pardir))
         if not os.path.exists(dir):
             os.makedirs(dir)
-        if file_uri.startswith('/api/files/'):
-            r = self.session.get(self.endpoint + file_uri, stream=True)
+        part = path + PARTIAL_EXT
+        ranges = path + RANGES_EXT
+        # ranges left by killed process are not known to be fetched
+        remove_files(ranges)
+        size = None
+        if parallel > 1 and not os.path.exists(part):
+            size = await self.call(self.probeSize, url, http)
+        if size is not None and size >= PARALLEL_MIN_SIZE:
+            part = ranges
+            with open(part, 'wb') as f:
+                f.truncate(size)
+            step = -(-size // parallel)
+            fetched = await asyncio.gather(*[self.call(self.fetch, url, http, part, start, min(start + step, size) - 1)
+                                             for start in range(0, size, step)], return_exceptions=True)
+            errors = [err for err in fetched if isinstance(err, BaseException)]
+            if errors:
+                remove_files(part)
+                raise errors[0]
         else:
-            r = requests.get(file_uri, stream=True)
+            size = await self.call(self.fetch, url, http, part)
+        got = os.path.getsize(part)
+        if size is not None and got != size:
+            remove_files(part, part + VALIDATOR_EXT)
+            raise DownloadException('Size of %s is %d instead of %d' % (url, got, size))
+        if sha256 is not None:
+            digest = await self.call(file_sha256, part)
+            if digest != sha256.lower():
+                remove_files(part, part + VALIDATOR_EXT)
+                raise DownloadException('SHA-256 of %s is %s instead of %s' % (url, digest, sha256))
+        os.replace(part, path)
+        remove_files(part + VALIDATOR_EXT)
+
+    async def getFile(self, file_uri, path, parallel=1, sha256=None):
+        url, http = self.getFileUrl(file_uri)
+        await self.download(url, path, http, parallel, sha256)
+
+    async def readFile(self, file_uri):
+        url, http = self.getFileUrl(file_uri)
+        r = await self.call(http.get, url, timeout=self.timeout)
         r.raise_for_status()
-        with open(path, 'wb') as fd:
-            for chunk in r.iter_content(chunk_size=1024):
-                fd.write(chunk)
+        return r.text
+
+    async def close(self):
+        tasks = list(self.watchers)
+        if self.poller is not None:
+            tasks.append(self.poller)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # jobs are not watched any more
+        for job in self.tracked.values():
+            job.done.set()
+        self.tracked = {}
+        self.executor.shutdown(wait=False)
+        self.session.close()
+        self.external.close()
+
+class Session:
+
+    def __init__(self, *args, **kwargs):
+        """
+        Synchronous client of Everest, a thin wrapper around AsyncSession:
+        its coroutines run in the event loop of a separate thread, calls block till they are done
+        """
+        self.name = args[0]
+        self.endpoint = args[1]
+        self.asession = AsyncSession(*args, **kwargs)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='everest-' + self.name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def getTokenInfo(self):
+        return self.call(self.asession.getTokenInfo())
+
+    def app(self, app_id):
+        return App(app_id, self)
+
+    def getAppDesc(self, app_id):
+        return self.call(self.asession.getAppDesc(app_id))
+
+    def run(self, app_id, inputs, resources=[], job_name=None):
+        return Job(self, self.call(self.asession.run(app_id, inputs, resources, job_name)))
+
+    def runAll(self, app_id, tasks, resources=[], job_name_prefix=None):
+        return [Job(self, job) for job in self.call(self.asession.runAll(app_id, tasks, resources, job_name_prefix))]
+
+    def getJobs(self):
+        return [Job(self, job) for job in self.call(self.asession.getJobs())]
+
+    def wait(self, jobs, timeout=None, return_when=asyncio.FIRST_COMPLETED):
+        """
+        Blocks till some (FIRST_COMPLETED) or all (ALL_COMPLETED) of the jobs are in final state
+        :return: lists of done and pending jobs
+        """
+        done, pending = self.call(self.asession.wait([job.job for job in jobs], timeout, return_when))
+        done = set(id(job) for job in done)
+        return [job for job in jobs if id(job.job) in done], [job for job in jobs if id(job.job) not in done]
+
+    def getJobStatus(self, job_id):
+        return self.call(self.asession.getJobStatus(job_id))
+
+    def getJob(self, job_id):
+        return Job(self, self.call(self.asession.getJob(job_id)))
+
+    def getJobState(self, job_id):
+        return self.call(self.asession.getJobState(job_id))
+
+    def getJobLog(self, job_id, path):
+        self.call(self.asession.getJobLog(job_id, path))
+
+    def cancelJob(self, job_id):
+        self.call(self.asession.cancelJob(job_id))
+
+    def deleteJob(self, job_id):
+        self.call(self.asession.deleteJob(job_id))
+
+    def deleteJobs(self, name):
+        self.call(self.asession.deleteJobs(name))
+
+    def getFile(self, file_uri, path, parallel=1, sha256=None):
+        self.call(self.asession.getFile(file_uri, path, parallel, sha256))
 
     def readFile(self, file_uri):
-        if file_uri.startswith('/api/files/'):
-            r = self.session.get(self.endpoint + file_uri, stream=True)
-        else:
-            r = requests.get(file_uri, stream=True)
-        r.raise_for_status()
-        return r.text
+        return self.call(self.asession.readFile(file_uri))
 
     def close(self):
-        self.timer.cancel()
+        if self.loop.is_closed():
+            return
+        self.call(self.asession.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
 
 class App:
 
     def __init__(self, app_id, session):
+        """
+        :param session: Session or AsyncSession (then run, runAll are coroutines)
+        """
         self.session = session
         self.id = app_id
 
@@ -283,7 +797,7 @@ class App:
     def runAll(self, tasks, resources=[], job_name_prefix=None):
         return self.session.runAll(self.id, tasks, resources, job_name_prefix)
 
-class Job:
+class AsyncJob:
 
     def __init__(self, session, name, app_id, inputs, resources, id=None, state=None, result=None):
         self.session = session
@@ -294,6 +808,18 @@ class Job:
         self.id = id
         self.state = state
         self._result = result
+        # is set when the job is in final state or is not watched any more
+        self.done = asyncio.Event()
+        self.watched = False
+        # times of upload of inputs ('upload', 'uploaded'), of submission ('submitted')
+        # and of the first sight of every state of the job
+        self.times = {}
+        # bytes of input files sent to the server (files reused by upload cache are not counted)
+        self.uploaded_bytes = 0
+        if state is not None:
+            self.times[state] = time.time()
+        if state in FINAL_STATES:
+            self.done.set()
 
     @classmethod
     def fromjson(cls, session, job_json):
@@ -307,53 +833,104 @@ class Job:
         return cls(session, job_json['name'], app_id, job_json['inputs'],
                    None, job_json['id'], job_json['state'], result)
 
-    def isReady(self):
-        is_ready = True
+    def setState(self, state):
+        self.state = state
+        self.times.setdefault(state, time.time())
+        if state in FINAL_STATES:
+            self.done.set()
+
+    def outputs(self):
+        # Outputs of other jobs among inputs
         for param, value in iteritems(self.inputs):
             if isinstance(value, Output):
-                if not value.isReady():
-                    is_ready = False
-                    break
+                yield value
             elif isinstance(value, list):
                 for item in value:
                     if isinstance(item, Output):
-                        if not item.isReady():
-                            is_ready = False
-                            break
-        return is_ready
+                        yield item
+
+    def isReady(self):
+        return all(output.isReady() for output in self.outputs())
 
     def isBroken(self):
-        is_broken = False
-        for param, value in iteritems(self.inputs):
-            if isinstance(value, Output):
-                if value.isBroken():
-                    is_broken = True
-                    break
-        return is_broken
+        return any(output.isBroken() for output in self.outputs())
+
+    async def result(self):
+        if not self.done.is_set():
+            # e.g. job got by getJobs is watched on demand
+            if not self.watched and self.id is not None:
+                self.session.watch(self)
+            await self.done.wait()
+        if self.state == 'DONE':
+            return self._result
+        if self.state == 'FAILED':
+            raise JobException("Job is failed!")
+        if self.state == 'CANCELLED':
+            raise JobException("Job is cancelled!")
+        if self.state == 'BROKEN':
+            raise JobException("Job is broken!")
+        raise JobException("Job is not watched, session is closed")
+
+    def output(self, param):
+        return Output(self, param)
+
+    async def getLog(self, path):
+        await self.session.getJobLog(self.id, path)
+
+    def getOutput(self, output):
+        return self._result[output]
+
+    def getResult(self):
+        return self._result
+
+    async def cancel(self):
+        await self.session.cancelJob(self.id)
+
+    async def delete(self):
+        await self.session.deleteJob(self.id)
+
+    def __str__(self):
+        return "Job %s %s" % (self.id, self.state)
+
+class Job:
+
+    def __init__(self, session, job):
+        """
+        Synchronous wrapper of AsyncJob job run by Session session
+        """
+        self.session = session
+        self.job = job
+
+    name = property(lambda self: self.job.name)
+    app_id = property(lambda self: self.job.app_id)
+    inputs = property(lambda self: self.job.inputs)
+    resources = property(lambda self: self.job.resources)
+    id = property(lambda self: self.job.id)
+    state = property(lambda self: self.job.state)
+    _result = property(lambda self: self.job._result)
+    times = property(lambda self: self.job.times)
+    uploaded_bytes = property(lambda self: self.job.uploaded_bytes)
+
+    def isReady(self):
+        return self.job.isReady()
+
+    def isBroken(self):
+        return self.job.isBroken()
 
     def result(self):
-        while True:
-            if self.state == 'DONE':
-                return self._result
-            if self.state == 'FAILED':
-                raise JobException("Job is failed!")
-            if self.state == 'CANCELLED':
-                raise JobException("Job is cancelled!")
-            if self.state == 'BROKEN':
-                raise JobException("Job is broken!")
-            time.sleep(3)
+        return self.session.call(self.job.result())
 
     def output(self, param):
-        return Output(self, param)
+        return Output(self.job, param)
 
     def getLog(self, path):
         self.session.getJobLog(self.id, path)
 
     def getOutput(self, output):
-        return self._result[output]
+        return self.job.getOutput(output)
 
     def getResult(self):
-        return self._result
+        return self.job.getResult()
 
     def cancel(self):
         self.session.cancelJob(self.id)
@@ -362,13 +939,18 @@ class Job:
         self.session.deleteJob(self.id)
 
     def __str__(self):
-        return "Job %s %s" % (self.id, self.state)
+        return str(self.job)
 
 class JobException(Exception):
 
     def __init__(self, msg):
         super(JobException, self).__init__(msg)
 
+class DownloadException(Exception):
+
+    def __init__(self, msg):
+        super(DownloadException, self).__init__(msg)
+
 class Output:
 
     def __init__(self, job, param):
@@ -0,0 +1,390 @@
+"""
+Local stand-in of Everest server for testing and benchmarking of everest.py and ssop_session.py.
+
+Implements the part of Everest REST API used by the client:
+    POST /api/auth/access_token, GET /api/auth/access_token - new token, token info
+    GET /api/apps/<id>, POST /api/apps/<id> - description of the application, job submission
+    GET /api/jobs, DELETE /api/jobs?name=<name> - list of jobs, deletion by name
+    GET, DELETE /api/jobs/<id>, GET /api/jobs/<id>/log, POST /api/jobs/<id>/cancel
+    POST /api/files/temp - upload (multipart), GET /api/files/<path> - download (with Range and If-Range requests)
+Requests except getting of a new token need 'Authorization: Bearer <token>' header, any token is accepted.
+
+Jobs are not run: a job is SUBMITTED for queueTime seconds, RUNNING for jobTime + taskTime * <number of tasks>
+seconds (divided by the speed of its first resource), then DONE. Result of the job is {"results": <file URI>}:
+for SSOP plans (see ssop_session.makePlan) it is the zip of <nlname>.sol (solValues random primal values)
+and <nlname>.log.txt (with SCIP-like solving time taskTime) of every NL-file (<nlname>.err.txt instead of SOL-file for a share taskFailRate of them),
+otherwise resultSize random bytes.
+Every response is delayed by latency seconds (plus uniform jitter), a share failRate of requests is answered
+by 503 and a share dropRate of them is dropped (connection is closed without response).
+
+    python everest_mock.py -p 8765 -l 0.02 -f 0.05 -jt 5
+"""
+from __future__ import print_function
+
+import argparse
+import io
+import json
+import os
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+import zipfile
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+TOKEN = 'mock-token'
+SSOP_NLNAME = 'parameter nlname '
+# SOL-file of AMPL format without duals: name, number of primal values twice, the values
+SOL_TEMPLATE = 'Mock solution of %s\n\nOptions\n3\n1\n1\n0\n0\n0\n%d\n%d\n%sobjno 0 0\n'
+
+
+def makeParser():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+                                     description='Local stand-in of Everest server')
+    parser.add_argument('-H', '--host', default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=8765)
+    parser.add_argument('-l', '--latency', type=float, default=0., help='delay of every response, s')
+    parser.add_argument('-lj', '--latency-jitter', type=float, default=0., help='max random addition to latency, s')
+    parser.add_argument('-f', '--fail-rate', type=float, default=0., help='share of requests answered by 503')
+    parser.add_argument('-d', '--drop-rate', type=float, default=0., help='share of requests dropped')
+    parser.add_argument('-qt', '--queue-time', type=float, default=0.2, help='time of a job in the queue, s')
+    parser.add_argument('-jt', '--job-time', type=float, default=1., help='run time of a job, s')
+    parser.add_argument('-tt', '--task-time', type=float, default=0., help='run time of a task of SSOP job, s')
+    parser.add_argument('-tf', '--task-fail-rate', type=float, default=0., help='share of failed tasks of SSOP jobs')
+    parser.add_argument('-sv', '--sol-values', type=int, default=2, help='primal values in SOL-files of SSOP jobs')
+    parser.add_argument('-rs', '--result-size', type=int, default=1024, help='bytes of results of non-SSOP jobs')
+    parser.add_argument('-sp', '--speeds', default='{}', help='JSON of speeds of resources by their ids')
+    return parser
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MockEverest:
+    def __init__(self, host='127.0.0.1', port=0, latency=0., latencyJitter=0., failRate=0., dropRate=0.,
+                 queueTime=0.2, jobTime=1., taskTime=0., taskFailRate=0., solValues=2, resultSize=1024,
+                 speeds={}, seed=None):
+        """
+        :param port: port of the server, 0 - any free one (see endpoint)
+        :param latency: delay of every response, s
+        :param failRate: share of requests answered by 503 Service Unavailable
+        :param dropRate: share of requests dropped without response
+        :param queueTime: seconds of a job in SUBMITTED state
+        :param jobTime: seconds of a job in RUNNING state
+        :param taskTime: additional seconds of RUNNING state per task of SSOP job
+        :param taskFailRate: share of tasks of SSOP jobs without SOL-file
+        :param solValues: number of primal values in SOL-files of SSOP jobs
+        :param resultSize: bytes of results of non-SSOP jobs
+        :param speeds: speeds of resources by ids, run time of a job is divided by the speed of its resource
+        """
+        self.latency = latency
+        self.latencyJitter = latencyJitter
+        self.failRate = failRate
+        self.dropRate = dropRate
+        self.queueTime = queueTime
+        self.jobTime = jobTime
+        self.taskTime = taskTime
+        self.taskFailRate = taskFailRate
+        self.solValues = solValues
+        self.resultSize = resultSize
+        self.speeds = speeds
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.files = {}
+        # tasks of results files made when they are downloaded first
+        self.pending = {}
+        self.stats = dict.fromkeys(('requests', 'failed', 'dropped', 'submitted', 'uploads', 'bytesIn', 'bytesOut'), 0)
+        self.server = ThreadingServer((host, port), MockHandler)
+        self.server.mock = self
+        self.thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self.server.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def start(self):
+        """
+        Serves requests in a background thread
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, name='everest-mock')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def addFile(self, data, folder='temp'):
+        fileId = folder + '/' + uuid.uuid4().hex
+        with self.lock:
+            self.files[fileId] = data
+        return '/api/files/' + fileId
+
+    def getFile(self, fileId):
+        # Contents of the file, None if there is no such file
+        with self.lock:
+            if fileId in self.pending:
+                self.files[fileId] = self.makeResults(self.pending.pop(fileId))
+            return self.files.get(fileId)
+
+    def planTasks(self, inputs):
+        # Names of NL-files of SSOP plan among the inputs, None if the job is not SSOP one
+        plan = inputs.get('plan') if isinstance(inputs, dict) else None
+        if not isinstance(plan, str) or not plan.startswith('/api/files/'):
+            return None
+        data = self.getFile(plan[len('/api/files/'):])
+        if data is None:
+            return None
+        for line in data.decode('utf-8', 'replace').splitlines():
+            if line.startswith(SSOP_NLNAME):
+                return line[len(SSOP_NLNAME):].split()
+        return None
+
+    def makeResults(self, tasks):
+        if tasks is None:
+            return os.urandom(self.resultSize)
+        out = io.BytesIO()
+        with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as z:
+            for n, nlName in enumerate(tasks):
+                z.writestr('%d/%s.log.txt' % (n, nlName),
+                           'Mock log of %s\nSolving Time (sec) : %.2f\n' % (nlName, self.taskTime))
+                if self.random.random() < self.taskFailRate:
+                    z.writestr('%d/%s.err.txt' % (n, nlName), 'Mock failure of %s\n' % (nlName))
+                else:
+                    values = ''.join('%.17g\n' % (self.random.random()) for k in range(self.solValues))
+                    z.writestr('%d/%s.sol' % (n, nlName),
+                               SOL_TEMPLATE % (nlName, self.solValues, self.solValues, values))
+            z.writestr('stderr', '')
+        return out.getvalue()
+
+    def submit(self, appId, req):
+        tasks = self.planTasks(req.get('inputs', {}))
+        resources = req.get('resources') or [None]
+        runTime = (self.jobTime + self.taskTime * len(tasks or [])) / self.speeds.get(resources[0], 1.)
+        resultsId = 'results/' + uuid.uuid4().hex
+        job = {'id': uuid.uuid4().hex[:24], 'name': req['name'], 'appId': appId, 'appAlias': None,
+               'inputs': req.get('inputs', {}), 'state': 'SUBMITTED', 'submitted': time.time(),
+               'runTime': runTime, 'results': '/api/files/' + resultsId}
+        with self.lock:
+            self.pending[resultsId] = tasks
+            self.jobs[job['id']] = job
+            self.stats['submitted'] += 1
+        return job
+
+    def jobJson(self, job):
+        # Updates state of the job by its times
+        if job['state'] in ('SUBMITTED', 'RUNNING'):
+            age = time.time() - job['submitted']
+            if age >= self.queueTime + job['runTime']:
+                job['state'] = 'DONE'
+            elif age >= self.queueTime:
+                job['state'] = 'RUNNING'
+        desc = dict((key, job[key]) for key in ('id', 'name', 'appId', 'appAlias', 'inputs', 'state'))
+        desc['submitted'] = int(job['submitted'] * 1000)
+        if job['state'] == 'DONE':
+            desc['result'] = {'results': job['results']}
+        return desc
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, code, obj=None, body=None, headers={}):
+        if body is None:
+            body = json.dumps(obj).encode('utf-8') if obj is not None else b''
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json' if obj is not None else 'application/octet-stream')
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.mock.count('bytesOut', len(body))
+
+    def readBody(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.mock.count('bytesIn', len(body))
+        return body
+
+    def handle(self):
+        try:
+            BaseHTTPRequestHandler.handle(self)
+        except (ConnectionError, OSError):
+            pass
+
+    def dispatch(self, method):
+        mock = self.server.mock
+        mock.count('requests')
+        body = self.readBody() if method in ('POST', 'PUT') else b''
+        delay = mock.latency + mock.latencyJitter * mock.random.random()
+        if delay > 0:
+            time.sleep(delay)
+        path, _, query = self.path.partition('?')
+        tokenRequest = path == '/api/auth/access_token' and method == 'POST'
+        if not tokenRequest and not self.headers.get('Authorization', '').startswith('Bearer '):
+            return self.reply(401, {'message': 'Authorization is required'})
+        r = mock.random.random()
+        if r < mock.dropRate:
+            mock.count('dropped')
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        if r < mock.dropRate + mock.failRate:
+            mock.count('failed')
+            return self.reply(503, {'message': 'Injected failure'})
+        for pattern, handler in ROUTES.get(method, ()):
+            m = re.match(pattern + '$', path)
+            if m:
+                return handler(self, mock, body, query, *m.groups())
+        self.reply(404, {'message': 'Not found: %s %s' % (method, path)})
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def newToken(self, mock, body, query):
+        self.reply(200, {'access_token': TOKEN})
+
+    def tokenInfo(self, mock, body, query):
+        self.reply(200, {'label': 'mock', 'created': 0, 'lifetime': 7 * 24 * 3600})
+
+    def appDesc(self, mock, body, query, appId):
+        self.reply(200, {'id': appId, 'name': appId, 'inputs': {}, 'outputs': {}})
+
+    def submit(self, mock, body, query, appId):
+        try:
+            req = json.loads(body.decode('utf-8'))
+        except ValueError:
+            return self.reply(400, {'message': 'Invalid JSON'})
+        job = mock.submit(appId, req)
+        self.reply(201, {'id': job['id'], 'state': job['state']})
+
+    def listJobs(self, mock, body, query):
+        with mock.lock:
+            jobs = [mock.jobJson(job) for job in mock.jobs.values()]
+        self.reply(200, jobs)
+
+    def deleteJobs(self, mock, body, query):
+        name = dict(item.partition('=')[::2] for item in query.split('&')).get('name')
+        with mock.lock:
+            for jobId in [jobId for jobId, job in mock.jobs.items() if job['name'] == name]:
+                del mock.jobs[jobId]
+        self.reply(200, {})
+
+    def getJob(self, mock, body, query, jobId):
+        with mock.lock:
+            job = mock.jobs.get(jobId)
+            desc = mock.jobJson(job) if job is not None else None
+        if desc is None:
+            return self.reply(404, {'message': 'Job not found'})
+        self.reply(200, desc)
+
+    def deleteJob(self, mock, body, query, jobId):
+        with mock.lock:
+            job = mock.jobs.pop(jobId, None)
+        self.reply(200 if job is not None else 404, {})
+
+    def jobLog(self, mock, body, query, jobId):
+        with mock.lock:
+            job = mock.jobs.get(jobId)
+        if job is None:
+            return self.reply(404, {'message': 'Job not found'})
+        self.reply(200, body=('Mock log of job %s\n' % (jobId)).encode('utf-8'))
+
+    def cancelJob(self, mock, body, query, jobId):
+        with mock.lock:
+            job = mock.jobs.get(jobId)
+            if job is not None:
+                mock.jobJson(job)
+                if job['state'] in ('SUBMITTED', 'RUNNING'):
+                    job['state'] = 'CANCELLED'
+        self.reply(200 if job is not None else 404, {})
+
+    def upload(self, mock, body, query):
+        contentType = self.headers.get('Content-Type', '')
+        m = re.search(r'boundary="?([^";]+)"?', contentType)
+        if m is None:
+            return self.reply(400, {'message': 'Multipart body is expected'})
+        # the first part of the body is the file
+        part = body.split(b'--' + m.group(1).encode('ascii'))[1]
+        data = part.split(b'\r\n\r\n', 1)[1][:-2]
+        mock.count('uploads')
+        self.reply(200, {'uri': mock.addFile(data)})
+
+    def download(self, mock, body, query, fileId):
+        data = mock.getFile(fileId)
+        if data is None:
+            return self.reply(404, {'message': 'File not found'})
+        # files are never changed, so their ids are their entity tags
+        etag = '"%s"' % (fileId.replace('/', '-'))
+        m = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range', ''))
+        if m is None or self.headers.get('If-Range', etag) != etag:
+            return self.reply(200, body=data, headers={'Accept-Ranges': 'bytes', 'ETag': etag})
+        if m.group(1):
+            start = int(m.group(1))
+            end = min(int(m.group(2)), len(data) - 1) if m.group(2) else len(data) - 1
+        else:
+            start = max(len(data) - int(m.group(2)), 0)
+            end = len(data) - 1
+        if start >= len(data) or start > end:
+            return self.reply(416, body=b'', headers={'Content-Range': 'bytes */%d' % (len(data)), 'ETag': etag})
+        self.reply(206, body=data[start:end + 1], headers={'Accept-Ranges': 'bytes', 'ETag': etag,
+                                                           'Content-Range': 'bytes %d-%d/%d' % (start, end, len(data))})
+
+
+ROUTES = {
+    'GET': [(r'/api/auth/access_token', MockHandler.tokenInfo),
+            (r'/api/apps/([^/]+/?[^/]*)', MockHandler.appDesc),
+            (r'/api/jobs', MockHandler.listJobs),
+            (r'/api/jobs/([^/]+)', MockHandler.getJob),
+            (r'/api/jobs/([^/]+)/log', MockHandler.jobLog),
+            (r'/api/files/(.+)', MockHandler.download)],
+    'POST': [(r'/api/auth/access_token', MockHandler.newToken),
+             (r'/api/files/temp', MockHandler.upload),
+             (r'/api/jobs/([^/]+)/cancel', MockHandler.cancelJob),
+             (r'/api/apps/([^/]+/?[^/]*)', MockHandler.submit)],
+    'DELETE': [(r'/api/jobs', MockHandler.deleteJobs),
+               (r'/api/jobs/([^/]+)', MockHandler.deleteJob)],
+}
+
+
+if __name__ == "__main__":
+    parser = makeParser()
+    args = parser.parse_args()
+    mock = MockEverest(args.host, args.port, latency=args.latency, latencyJitter=args.latency_jitter,
+                       failRate=args.fail_rate, dropRate=args.drop_rate, queueTime=args.queue_time,
+                       jobTime=args.job_time, taskTime=args.task_time, taskFailRate=args.task_fail_rate,
+                       solValues=args.sol_values, resultSize=args.result_size, speeds=json.loads(args.speeds))
+    print('Mock Everest is listening at %s' % (mock.endpoint))
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    mock.server.server_close()
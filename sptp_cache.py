@@ -0,0 +1,130 @@
+"""
+On-disk cache of arrays parsed from CSV-files.
+
+Arrays are stored as raw *.npy files (loaded back by mmap) in the folder
+<cacheDir>/<key>, where key is made of the cache format version (CACHE_VERSION)
+and absolute paths to the CSV-files.
+The sidecar index.json keeps the version, the labels of rows/columns and a stamp
+(path, size, mtime, sha1 of content) of every source file.
+The cache is valid while every stamp matches its source file:
+if size and mtime are the same the file is not read at all,
+otherwise its content hash is compared with the stored one.
+"""
+import os
+import json
+import hashlib
+import numpy as np
+
+INDEX_FILE = 'index.json'
+# Version of layout of cached labels and arrays, it is increased when the layout is changed
+# (e.g. DATA_ARRAYS of SptpData_5 or their order), so files of former versions are never loaded
+CACHE_VERSION = 2
+HASH_CHUNK = 1 << 20
+
+
+def fileHash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def fileStamp(path, withHash=True):
+    st = os.stat(path)
+    stamp = {'path': os.path.abspath(path), 'size': st.st_size, 'mtime': st.st_mtime_ns}
+    if withHash:
+        stamp['sha1'] = fileHash(path)
+    return stamp
+
+
+def cacheFolder(cacheDir, paths, version=CACHE_VERSION):
+    key = '\n'.join(['v%d' % version] + [os.path.abspath(p) for p in paths])
+    key = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cacheDir, key)
+
+
+def isStampValid(stamp):
+    """
+    Returns True iff the file described by stamp has not been changed
+    """
+    path = stamp['path']
+    if not os.path.isfile(path):
+        return False
+    st = os.stat(path)
+    if st.st_size != stamp['size']:
+        return False
+    if st.st_mtime_ns == stamp['mtime']:
+        return True
+    # mtime changed (e.g. file touched or copied): compare contents
+    if fileHash(path) != stamp['sha1']:
+        return False
+    stamp['mtime'] = st.st_mtime_ns
+    return True
+
+
+def loadArrays(cacheDir, paths, version=CACHE_VERSION):
+    """
+    Returns (labels, arrays) stored for the files in paths or None if there is no valid cache
+    :param cacheDir: root folder of the cache
+    :param paths: list of paths to source files
+    :param version: version of the cache format, arrays of other versions are not loaded
+    :return: labels - dictionary {name: list of labels}, arrays - dictionary {name: read-only memory-mapped array}
+    """
+    folder = cacheFolder(cacheDir, paths, version)
+    indexFile = os.path.join(folder, INDEX_FILE)
+    if not os.path.isfile(indexFile):
+        return None
+    try:
+        with open(indexFile) as f:
+            index = json.load(f)
+        if index.get('version') != version:
+            return None
+        stamps = index['stamps']
+        if [s['path'] for s in stamps] != [os.path.abspath(p) for p in paths]:
+            return None
+        mtimes = [s['mtime'] for s in stamps]
+        if not all(isStampValid(s) for s in stamps):
+            return None
+        arrays = dict((name, np.load(os.path.join(folder, name + '.npy'), mmap_mode='r'))
+                      for name in index['arrays'])
+    except (ValueError, KeyError, IOError, OSError):
+        return None
+    # Refresh mtimes of files touched without changes, so they are not hashed next time
+    if mtimes != [s['mtime'] for s in stamps]:
+        writeIndex(indexFile, index)
+    return index['labels'], arrays
+
+
+def saveArrays(cacheDir, paths, labels, arrays, version=CACHE_VERSION):
+    """
+    Stores labels and arrays parsed from the files in paths
+    :param cacheDir: root folder of the cache
+    :param paths: list of paths to source files
+    :param labels: dictionary {name: list of labels}, labels must be JSON-serializable
+    :param arrays: dictionary {name: array}
+    :param version: version of the cache format
+    :return: folder with cached files
+    """
+    folder = cacheFolder(cacheDir, paths, version)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    indexFile = os.path.join(folder, INDEX_FILE)
+    # The index is written last, so it exists only with complete set of arrays
+    if os.path.exists(indexFile):
+        os.remove(indexFile)
+    for name, arr in arrays.items():
+        np.save(os.path.join(folder, name + '.npy'), np.ascontiguousarray(arr))
+    index = {'version': version,
+             'stamps': [fileStamp(p) for p in paths],
+             'labels': labels,
+             'arrays': sorted(arrays.keys())}
+    writeIndex(indexFile, index)
+    return folder
+
+
+def writeIndex(indexFile, index):
+    tmpFile = indexFile + '.tmp'
+    with open(tmpFile, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmpFile, indexFile)
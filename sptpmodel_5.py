@@ -17,6 +17,7 @@ from pyomo.core.base.objective import *
 from pyomo.core.base.constraint import *
 from pyomo.core.base.set_types import *
 
+from pyomo.core.expr.numeric_expr import LinearExpression
 from pyomo.opt import *
 from write import *
 
@@ -26,6 +27,7 @@ from read import read_sol_smap_var
 import matplotlib.pyplot as plt
 
 from collections import OrderedDict
+from itertools import product
 import threading # !!! Simplest way
 
 """ 
@@ -38,15 +40,45 @@ sum{i in I} t[i,k]*x[i,j]*p[i,j] <= d[k,j] {k in K, j in J}
 x[i,j] in Z (FOR i not in CASH) 
 
 """
+def unitCoefs(coefList):
+    # Pyomo reduces 1.0*x to x, so keep such coefficients as integer 1 (as they are written in NL)
+    return [1 if c == 1 else c for c in coefList]
+
+
+def linearRows(rowOf, nRows, coefs, xs):
+    """
+    Groups linear terms coefs[n]*xs[n] by rows rowOf[n], terms with zero coefficient are dropped
+    :return: list of nRows LinearExpressions (None for a row without terms), terms are kept in the given order
+    """
+    keep = np.nonzero(coefs != 0)[0]
+    order = keep[np.argsort(rowOf[keep], kind='stable')]
+    ptr = np.searchsorted(rowOf[order], np.arange(nRows + 1)).tolist()
+    coefList = unitCoefs(coefs[order].tolist())
+    order = order.tolist()
+    rows = []
+    for r in range(nRows):
+        lo, hi = ptr[r], ptr[r+1]
+        if lo == hi:
+            rows.append(None)
+        else:
+            rows.append(LinearExpression(constant=0, linear_coefs=coefList[lo:hi],
+                                         linear_vars=[xs[n] for n in order[lo:hi]]))
+    return rows
+
+
 class SPTPmodel_5:
 
-    def __init__(self, sptpData, isInteger=True, debug=False, options=None, model_options=None):
+    def __init__(self, sptpData, isInteger=True, debug=False, options=None, model_options=None, sparse=True, fast=False):
         """
         :param sptpData: structure containing all data
              .name (The Name of the dataset)
              .I (n-list with IDs of assets), .
              .J (m-list with IDs of requirements),
              .K (KK-list of asset types)
+             .getAArray(), .getBArray(), .getCArray(), .getSArray(), .getPArray(), .getDArray(), .getTArray()
+                        dense arrays of a, b, c, s, p, d, t ordered as I, J, K
+             .getPairIJ(sparse) (i,j)-positions of admissible (or all) pairs in COO format
+             .getPairs(sparse) list of (i,j) labels in the order of getPairIJ(sparse)
              .getC(i,j) = c_ij: i in I, j in J (Internal Costs of Lots (matrix, [ij])),
              .getA(i)   = a_i: i in I (available units of assets)
              .getB(j)   = b_j: j in J (min amounts to satisfy requirements}
@@ -54,12 +86,18 @@ class SPTPmodel_5:
              .getP(i,j) = p_ij: i in I, j in J (External costs of Lots)
              .getD(k,j) = d_kj maximum cost of requirement j that can be satisfied with assets of type k (matrix, [kj])
              .getT(i,k) = t_ik indicator of whether asset i has type k(0 or 1). There is exactly one 1 in each row (matrix, [ik])
-             .isXinteger(i,j) returns True iff x_ij MUST BE Integer
+             .getUpperBoundArray() [ij]-array of upper bounds on x_ij
+             .getIntegerArray() [ij]-array, True iff x_ij MUST BE Integer
              .getInitX(i,j) returns initial solution x_ij; =0 by default
+             .getInitXArray() [ij]-array of initial solution x_ij
         :param isInteger: if True then some x_ij will be NonNegativeIntegers (!!!???), else - NonNegativeReals
         :param debug: reserved
         :param options: reserved, e.g. to modify NL-generation
         :param model_options: reserved, to modify constraints
+        :param sparse: if True then x_ij, c_ij, s_ij, p_ij are declared for admissible pairs (i,j) only
+                       (see SptpData_5.getAdmissibleMask), else for all pairs of I x J
+        :param fast: if True then the model is built by buildFast(), else by buildByRules(); both make the same NL-file,
+                     but parameters C, S, P of pairs (i,j) are declared by buildByRules() only
         """
         self.name = sptpData.name
         self.M = len(sptpData.I)
@@ -82,91 +120,187 @@ class SPTPmodel_5:
             return (k for k in sptpData.K)
         self.model.K = Set(initialize=initK)
 
-        def initA(model, i):
-            return sptpData.getA(i)
-        self.model.A = Param(self.model.I, initialize=initA, within=NonNegativeReals)
+        # Pairs (i,j) to declare x_ij over
+        iIdx, jIdx = sptpData.getPairIJ(sparse)
+        pairs = sptpData.getPairs(sparse)
+        self.model.IJ = Set(dimen=2, initialize=pairs, ordered=True)
+
+        # Parameters are initialized in bulk from the arrays of sptpData
+        self.model.A = Param(self.model.I, initialize=dict(zip(sptpData.I, sptpData.getAArray().tolist())),
+                             within=NonNegativeReals)
+        self.model.B = Param(self.model.J, initialize=dict(zip(sptpData.J, sptpData.getBArray().tolist())),
+                             within=NonNegativeReals)
+        self.model.D = Param(self.model.K, self.model.J,
+                             initialize=dict(zip(product(sptpData.K, sptpData.J), sptpData.getDArray().ravel().tolist())),
+                             within=NonNegativeReals)
+        self.model.T = Param(self.model.I, self.model.K,
+                             initialize=dict(zip(product(sptpData.I, sptpData.K), sptpData.getTArray().ravel().tolist())),
+                             within=Binary)
 
-        def initB(model, j):
-            return sptpData.getB(j)
-        self.model.B = Param(self.model.J, initialize=initB, within=NonNegativeReals)
+        if fast:
+            self.buildFast(sptpData, isInteger, sparse, iIdx, jIdx)
+        else:
+            self.buildByRules(sptpData, isInteger, sparse, iIdx, jIdx)
 
-        def initC(model, i, j):
-            return sptpData.getC(i,j)
-        self.model.C = Param(self.model.I, self.model.J, initialize=initC, within=NonNegativeReals)
+        if debug:
+            self.model.pprint()
+
+        # Fixed constraints
+        # def cons_fixed_xij(model, ij, b):
+        #     return (model.x[ij[0], ij[1]] == b)
+        # if ij_to_be_fixed <> None and xij_fixed_values <> None:
+        #     if len(ij_to_be_fixed) <> len(xij_fixed_values):
+        #         raise ValueError('Fixed mismatch: len(xj)=' + str(len(ij_to_be_fixed)) + ' <> len(fix_values)=' + str(len(xij_fixed_values)) )
+        #     self.model.fixedIJ = Set(dimen=2, initialize=ij_to_be_fixed)
+        #     self.model.cons_fixed_xij = Constraint(self.model.fixedIJ)
 
-        def initS(model, i, j):
-            return sptpData.getS(i,j)
-        self.model.S = Param(self.model.I, self.model.J, initialize=initS, within=NonNegativeReals)
+    def declareX(self, sptpData, isInteger, iIdx, jIdx):
+        """
+        Declares variables x_ij over the set IJ, upper bounds and integrality are taken from
+        SptpData.getUpperBoundArray(), SptpData.getIntegerArray() (ALL i except CASH are integer !!!)
+        Bounds, domains and initial values are set to VarData directly, that is much faster than rules or dicts
+        :param iIdx, jIdx: positions of pairs (i,j) of the set IJ (see SptpData_5.getPairIJ)
+        :return: list of VarData ordered as IJ
+        """
+        uBound = sptpData.getUpperBoundArray()[iIdx, jIdx]
+        xInit = sptpData.getInitXArray()[iIdx, jIdx].astype(int)
+        self.model.x = Var(self.model.IJ, domain=NonNegativeReals, bounds=(0, None), initialize=0, dense=True)
+        xs = list(self.model.x.values())
+        # Only variables differing from the common template are visited. Bounds and domains are set
+        # to the attributes directly, as Var.construct does: both are valid (float, global Set) already
+        bounded = np.nonzero(np.isfinite(uBound))[0]
+        for n, ub in zip(bounded.tolist(), uBound[bounded].tolist()):
+            xs[n]._ub = ub
+        if isInteger:
+            for n in np.nonzero(sptpData.getIntegerArray()[iIdx, jIdx])[0].tolist():
+                xs[n]._domain = NonNegativeIntegers
+        for n in np.nonzero(xInit)[0].tolist():
+            xs[n].set_value(int(xInit[n]))
+        return xs
 
-        def initP(model, i, j):
-            return sptpData.getP(i,j)
-        self.model.P = Param(self.model.I, self.model.J, initialize=initP, within=NonNegativeReals)
+    def buildByRules(self, sptpData, isInteger, sparse, iIdx, jIdx):
+        """
+        Declares parameters C, S, P of pairs, variables (see declareX), constraints and objective
+        by rules called for each index
+        """
+        pairs = list(self.model.IJ)
+        self.model.C = Param(self.model.IJ, initialize=dict(zip(pairs, sptpData.getCArray()[iIdx, jIdx].tolist())),
+                             within=NonNegativeReals)
+        self.model.S = Param(self.model.IJ, initialize=dict(zip(pairs, sptpData.getSArray()[iIdx, jIdx].tolist())),
+                             within=NonNegativeReals)
+        self.model.P = Param(self.model.IJ, initialize=dict(zip(pairs, sptpData.getPArray()[iIdx, jIdx].tolist())),
+                             within=NonNegativeReals)
 
-        def initD(model, k, j):
-            return sptpData.getD(k,j)
-        self.model.D = Param(self.model.K, self.model.J, initialize=initD, within=NonNegativeReals)
+        # Requirements j paired with asset i and assets i paired with requirement j (both ordered as I, J),
+        # pairs with s_ij = 0 (p_ij = 0) are dropped from the rows as in buildFast()
+        S = sptpData.getSArray()[iIdx, jIdx].tolist()
+        P = sptpData.getPArray()[iIdx, jIdx].tolist()
+        JofI = dict((i, []) for i in sptpData.I)
+        IofJ = dict((j, []) for j in sptpData.J)
+        for (i, j), s, p in zip(self.model.IJ, S, P):
+            if s != 0:
+                JofI[i].append(j)
+            if p != 0:
+                IofJ[j].append(i)
 
-        def initT(model, i, k):
-            return sptpData.getT(i, k)
-        self.model.T = Param(self.model.I, self.model.K, initialize=initT, within=Binary)
+        # Assets i of type k paired with requirement j (ordered as I)
+        typesOfI = dict((i, []) for i in sptpData.I)
+        for nk, assets in enumerate(sptpData.getTypeAssets()):
+            for i in sptpData.I[assets]:
+                typesOfI[i].append(sptpData.K[nk])
+        IofKJ = {}
+        for j in sptpData.J:
+            for i in IofJ[j]:
+                for k in typesOfI[i]:
+                    IofKJ.setdefault((k, j), []).append(i)
+        tpSum = sptpData.getTypePSum(sparse)
 
         # Declaration of variables
-        # Detect upper bound on x_ij
-        # Is x_ij integer or not is defined by SptpData.isXinteger() function (ALL i except CASH !!!)
-        def initX(model, i, j):
-            return int(sptpData.getInitX(i,j))
-
-        def XijDomain_rule(model, i, j):
-            if sptpData.isXinteger(i,j) and isInteger:
-                return NonNegativeIntegers
-            else:
-                return NonNegativeReals
-
-        def XijBounds_rule(model, i, j):
-            uBound = model.A[i]/model.S[i,j]
-            if model.P[i,j] >= 1.e-6:
-                for k in (k for k in model.K if model.T[i,k] > 0): # in (e for e in arr if e >= 0)
-                    uBound = min(uBound, model.D[k, j]/model.P[i, j])
-            return (0, uBound)
-        self.model.x = Var(self.model.I, self.model.J, domain=XijDomain_rule, bounds=XijBounds_rule, initialize=initX)
+        self.declareX(sptpData, isInteger, iIdx, jIdx)
 
         # Constraints
         # sum{j in J} s[i,j]*x[i,j] <= a[i] {i in I};
         def cons_Assets_rule(model, i):
-            return( sum(model.S[i,j]*model.x[i,j] for j in model.J) <= model.A[i])
+            if len(JofI[i]) == 0:
+                return Constraint.Skip
+            return( sum(model.S[i,j]*model.x[i,j] for j in JofI[i]) <= model.A[i])
         self.model.cons_Assets = Constraint(self.model.I, rule = cons_Assets_rule)
 
         # sum{i in I} p[i,j]*x[i,j] >= b[j] {j in J};
         def cons_Requirements_rule(model, j):
-            return( sum(model.P[i,j]*model.x[i,j] for i in model.I) >= model.B[j])
+            if len(IofJ[j]) == 0:
+                if model.B[j] > 0:
+                    raise ValueError('Requirement %s can not be satisfied: no admissible assets' % (str(j)))
+                return Constraint.Skip
+            return( sum(model.P[i,j]*model.x[i,j] for i in IofJ[j]) >= model.B[j])
         self.model.cons_Requirements = Constraint(self.model.J, rule = cons_Requirements_rule)
 
         # sum{i in I} t[i,k]*x[i,j]*p[i,j] <= d[k,j] {k in K, j in J}
-        # !!! Skip for if p[i,j] = ZERO !!!
+        # is taken over assets of type k only
+        # !!! Skip for if sum{i in I} t[i,k]*p[i,j] = ZERO !!!
         def cons_MaxCostReq_rule(model, k, j):
-            # tmp = sum(model.T[i,k]*model.P[i,j] for i in model.I)
-            if sum(model.T[i,k]*model.P[i,j] for i in model.I) <= 1.e-7:
+            if tpSum[sptpData.kPos[k], sptpData.jPos[j]] <= 1.e-7:
                 return Constraint.Skip
-            return (sum(model.T[i,k]*model.x[i,j]*model.P[i,j] for i in model.I) <= model.D[k, j])
+            return (sum(model.x[i,j]*model.P[i,j] for i in IofKJ[k, j]) <= model.D[k, j])
         self.model.cons_MaxCostReq = Constraint(self.model.K, self.model.J, rule = cons_MaxCostReq_rule)
 
         ## Objective
-        # minimize  sum{i in I, j in J} c[i,j] * x[i,j]
+        # minimize  sum{(i,j) in IJ} c[i,j] * x[i,j]
         def obj_rule(model):
-            return (sum(model.C[i,j]*model.x[i,j] for i in model.I for j in model.J))
+            return (sum(model.C[i,j]*model.x[i,j] for (i,j) in model.IJ if model.C[i,j] != 0))
         self.model.obj = Objective(rule=obj_rule, sense=minimize)
 
-        if debug:
-            self.model.pprint()
+    def buildFast(self, sptpData, isInteger, sparse, iIdx, jIdx):
+        """
+        Declares variables (see declareX) and the same constraints and objective as buildByRules(),
+        but coefficients are grouped by NumPy beforehand and each expression is created at once as LinearExpression;
+        constraints are initialized by dictionaries of their rows (ordered as I, J, K x J), skipped rows are absent
+        :param iIdx, jIdx: positions of pairs (i,j) of the set IJ (see SptpData_5.getPairIJ)
+        """
+        A = sptpData.getAArray()
+        B = sptpData.getBArray().tolist()
+        D = sptpData.getDArray()
+        T = sptpData.getTArray()
+        C = sptpData.getCArray()[iIdx, jIdx]
+        S = sptpData.getSArray()[iIdx, jIdx]
+        P = sptpData.getPArray()[iIdx, jIdx]
 
-        # Fixed constraints
-        # def cons_fixed_xij(model, ij, b):
-        #     return (model.x[ij[0], ij[1]] == b)
-        # if ij_to_be_fixed <> None and xij_fixed_values <> None:
-        #     if len(ij_to_be_fixed) <> len(xij_fixed_values):
-        #         raise ValueError('Fixed mismatch: len(xj)=' + str(len(ij_to_be_fixed)) + ' <> len(fix_values)=' + str(len(xij_fixed_values)) )
-        #     self.model.fixedIJ = Set(dimen=2, initialize=ij_to_be_fixed)
-        #     self.model.cons_fixed_xij = Constraint(self.model.fixedIJ)
+        # Declaration of variables
+        xs = self.declareX(sptpData, isInteger, iIdx, jIdx)
+
+        # Constraints
+        # sum{j in J} s[i,j]*x[i,j] <= a[i] {i in I};
+        rows = linearRows(iIdx, self.M, S, xs)
+        self.model.cons_Assets = Constraint(self.model.I, rule=dict(
+            (i, (None, row, a)) for i, row, a in zip(sptpData.I.tolist(), rows, A.tolist()) if row is not None))
+
+        # sum{i in I} p[i,j]*x[i,j] >= b[j] {j in J};
+        cols = linearRows(jIdx, self.N, P, xs)
+        for j, col, b in zip(sptpData.J.tolist(), cols, B):
+            if col is None and b > 0:
+                raise ValueError('Requirement %s can not be satisfied: no admissible assets' % (str(j)))
+        self.model.cons_Requirements = Constraint(self.model.J, rule=dict(
+            (j, (b, col, None)) for j, col, b in zip(sptpData.J.tolist(), cols, B) if col is not None))
+
+        # sum{i in I} t[i,k]*x[i,j]*p[i,j] <= d[k,j] {k in K, j in J}
+        # !!! Skip for if sum{i in I} t[i,k]*p[i,j] = ZERO !!!
+        tpSum = sptpData.getTypePSum(sparse)
+        J = sptpData.J.tolist()
+        typeCols = {}
+        for k, nk in zip(sptpData.K.tolist(), range(self.NK)):
+            sel = np.nonzero(T[iIdx, nk] > 0)[0]
+            kCols = linearRows(jIdx[sel], self.N, P[sel], [xs[n] for n in sel.tolist()])
+            for j, col, d, tp in zip(J, kCols, D[nk].tolist(), tpSum[nk].tolist()):
+                if col is not None and tp > 1.e-7:
+                    typeCols[k, j] = (None, col, d)
+        self.model.cons_MaxCostReq = Constraint(self.model.K, self.model.J, rule=typeCols)
+
+        ## Objective
+        # minimize  sum{(i,j) in IJ} c[i,j] * x[i,j]
+        nz = np.nonzero(C != 0)[0]
+        self.model.obj = Objective(expr=LinearExpression(constant=0, linear_coefs=unitCoefs(C[nz].tolist()),
+                                                         linear_vars=[xs[n] for n in nz.tolist()]),
+                                   sense=minimize)
 
     # ||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||
     # |||||||||||||||||||||||||| DO NOT USE BELOW FUNCTIONS ||||||||||||||||||||||||||||||||||||||||||
@@ -0,0 +1,292 @@
+"""
+Direct writer of NL-files for the "Special" Transportation Problem (see sptpmodel_5.py)
+
+The files .nl, .row and .col are written straight from the arrays of SptpData_5, no Pyomo model is built.
+They are the same (byte to byte) as the files written by
+    write_nl_only(SPTPmodel_5(sptpData, isInteger, sparse=True).model, ..., symbolic_solver_labels=True)
+with NL writer (v2) of Pyomo, i.e. rows, columns, their order and labels are the same:
+ - rows: cons_Assets[i], cons_Requirements[j], cons_MaxCostReq[k,j], obj; terms with zero coefficients are dropped
+   and rows left without terms are omitted, as in both builders of SPTPmodel_5 (e.g. assets with all s_ij = 0)
+ - columns: x[i,j] met in the rows or objective ordered as IJ,
+   continuous columns go first, then binary (integer with bounds [0, 1]), then integer ones
+Segments are formatted and written by chunks, so the whole text is never kept in memory.
+J-segments (the largest part of the file) may be formatted by a pool of processes, see SptpNl_5.write()
+Order-based symbol map (see asl_io/write.py, write_nl_omap) is saved as well
+"""
+from __future__ import print_function
+
+from multiprocessing import Pool
+
+import numpy as np
+
+from pyomo.core.base.component_namer import name_repr
+
+from write import save_order_map, ORDER_MAP_EXT
+
+NL_EXT = '.nl'
+# Number of rows (columns) formatted at once
+CHUNK_SIZE = 20000
+# cons_MaxCostReq[k,j] is skipped if sum{i in I} t[i,k]*p[i,j] is not greater (as in SPTPmodel_5)
+TPSUM_MIN = 1.e-7
+
+
+def modelName(sptpData):
+    # The same as SPTPmodel_5.name
+    return sptpData.name + '_M_' + str(sptpData.M) + '_N_' + str(sptpData.N) + '_K_' + str(sptpData.NK) + "_v5"
+
+
+def coefRepr(c):
+    # Pyomo reduces 1.0*x to x, so such coefficients are written as 1
+    return '1' if c == 1 else repr(c)
+
+
+def formatLinear(prefix, first, ptr, cols, coefs, labels):
+    """
+    Returns text of linear segments (J or G) of the rows first, first+1, ...
+    :param ptr: CSR pointer to the terms of the rows (starts with 0)
+    :param cols, coefs: arrays of columns and coefficients of the terms, ordered by rows, then by columns
+    :param labels: labels of the rows
+    """
+    cols = cols.tolist()
+    coefs = [coefRepr(c) for c in coefs.tolist()]
+    ptr = ptr.tolist()
+    lines = []
+    for r, label in enumerate(labels):
+        lo, hi = ptr[r], ptr[r+1]
+        lines.append('%s%d %d\t#%s\n' % (prefix, first + r, hi - lo, label))
+        lines.extend('%d %s\n' % t for t in zip(cols[lo:hi], coefs[lo:hi]))
+    return ''.join(lines)
+
+
+def formatLinearArgs(args):
+    return formatLinear(*args)
+
+
+class SptpNl_5:
+
+    def __init__(self, sptpData, isInteger=True):
+        """
+        Computes rows, columns and Jacobian of SPTPmodel_5(sptpData, isInteger, sparse=True) in the order of NL-file
+        :param sptpData: SptpData_5
+        :param isInteger: if False then all x_ij are continuous
+        """
+        self.sptpData = sptpData
+        self.name = modelName(sptpData)
+        N = sptpData.N
+
+        iIdx, jIdx = sptpData.getPairIJ(True)
+        self.iIdx, self.jIdx = iIdx, jIdx
+        C = sptpData.getPairValues(sptpData.getCArray())
+        S = sptpData.getPairValues(sptpData.getSArray())
+        P = sptpData.getPairValues(sptpData.getPArray())
+        T = sptpData.getTArray()
+        B = sptpData.getBArray()
+
+        # Terms of the rows: pairs ordered as IJ within each row, rows are keyed by positions of i, j or (k, j),
+        # pairs with zero coefficient are not terms, so rows of such pairs only are not written at all
+        # sum{j in J} s[i,j]*x[i,j] <= a[i] {i in I};
+        termsA = np.nonzero(S != 0)[0]
+        keysA = iIdx[termsA]
+        # sum{i in I} p[i,j]*x[i,j] >= b[j] {j in J};
+        termsB = np.nonzero(P != 0)[0]
+        termsB = termsB[np.argsort(jIdx[termsB], kind='stable')]
+        keysB = jIdx[termsB]
+        noAssets = np.nonzero((np.bincount(keysB, minlength=N) == 0) & (B > 0))[0]
+        if len(noAssets) > 0:
+            raise ValueError('Requirement %s can not be satisfied: no admissible assets' % (str(sptpData.J[noAssets[0]])))
+        # sum{i in I} t[i,k]*x[i,j]*p[i,j] <= d[k,j] {k in K, j in J}
+        # !!! Skip for if sum{i in I} t[i,k]*p[i,j] = ZERO !!!
+        tpSum = sptpData.getTypePSum(True)
+        termsD = [termsB[:0]]
+        for k in range(sptpData.NK):
+            sel = termsB[T[iIdx[termsB], k] > 0]
+            termsD.append(sel[tpSum[k, jIdx[sel]] > TPSUM_MIN])
+        keysD = np.concatenate([k * N + jIdx[sel] for k, sel in enumerate(termsD[1:])] + [keysB[:0]])
+        termsD = np.concatenate(termsD)
+
+        self.rowsA, rowA = np.unique(keysA, return_inverse=True)
+        self.rowsB, rowB = np.unique(keysB, return_inverse=True)
+        self.rowsD, rowD = np.unique(keysD, return_inverse=True)
+        self.nCons = len(self.rowsA) + len(self.rowsB) + len(self.rowsD)
+        termRow = np.concatenate((rowA, len(self.rowsA) + rowB, len(self.rowsA) + len(self.rowsB) + rowD))
+        termPair = np.concatenate((termsA, termsB, termsD))
+        termCoef = np.concatenate((S[termsA], P[termsB], P[termsD]))
+        objPair = np.nonzero(C != 0)[0]
+
+        # Columns: pairs met in the objective or rows. Pyomo records all x_ij at the first met one,
+        # so columns are ordered as IJ within each group
+        nPairs = len(iIdx)
+        used = np.zeros(nPairs, dtype=bool)
+        used[termPair] = True
+        used[objPair] = True
+        # Continuous, then binary, then integer columns
+        uBound = sptpData.getPairValues(sptpData.getUpperBoundArray())
+        xInteger = sptpData.getPairValues(sptpData.getIntegerArray()) & isInteger
+        category = np.where(xInteger, np.where(uBound == 1, 1, 2), 0)
+        pairs = np.nonzero(used)[0]
+        self.colPair = pairs[np.argsort(category[pairs], kind='stable')]
+        self.nBinary = int(np.count_nonzero(category[self.colPair] == 1))
+        self.nInteger = int(np.count_nonzero(category[self.colPair] == 2))
+        colOf = np.full(nPairs, -1, dtype=np.int64)
+        colOf[self.colPair] = np.arange(len(self.colPair))
+        self.uBound = uBound[self.colPair]
+
+        # Jacobian in CSR format, terms of a row are ordered by columns
+        termCol = colOf[termPair]
+        order = np.lexsort((termCol, termRow))
+        self.jacCol = termCol[order]
+        self.jacCoef = termCoef[order]
+        self.jacPtr = np.searchsorted(termRow[order], np.arange(self.nCons + 1))
+        # Gradient of the objective
+        order = np.argsort(colOf[objPair])
+        self.objCol = colOf[objPair][order]
+        self.objCoef = C[objPair][order]
+        # Right-hand sides of the rows
+        self.rhs = np.concatenate((sptpData.getAArray()[self.rowsA], B[self.rowsB],
+                                   sptpData.getDArray().ravel()[self.rowsD]))
+
+    def labelReprs(self):
+        # Labels of I, J, K as they are written in indices of names (see pyomo.core.base.component_namer.index_repr)
+        data = self.sptpData
+        return [[name_repr(v) for v in labels.tolist()] for labels in (data.I, data.J, data.K)]
+
+    def rowLabels(self):
+        """
+        Returns list of labels of the rows (constraints, then objective) as written to .row file
+        """
+        N = self.sptpData.N
+        I, J, K = self.labelReprs()
+        return (['cons_Assets[%s]' % (I[n]) for n in self.rowsA.tolist()] +
+                ['cons_Requirements[%s]' % (J[n]) for n in self.rowsB.tolist()] +
+                ['cons_MaxCostReq[%s,%s]' % (K[n // N], J[n % N]) for n in self.rowsD.tolist()] +
+                ['obj'])
+
+    def colLabels(self):
+        """
+        Returns list of labels of the columns as written to .col file
+        """
+        I, J, K = self.labelReprs()
+        iCol, jCol = self.colPairs()
+        return ['x[%s,%s]' % (I[i], J[j]) for i, j in zip(iCol.tolist(), jCol.tolist())]
+
+    def colPairs(self):
+        """
+        Returns (i, j)-positions of the pairs of the columns, see SptpData_5.getPairIJ()
+        """
+        return self.iIdx[self.colPair], self.jIdx[self.colPair]
+
+    def orderMap(self):
+        """
+        Returns order-based symbol map of NL-file (see write.order_map): positions of x_ij in model.x.values()
+        are positions of pairs in IJ, rows of each constraint are in the order of their component
+        """
+        rows = [(name, len(r)) for name, r in (('cons_Assets', self.rowsA), ('cons_Requirements', self.rowsB),
+                                               ('cons_MaxCostReq', self.rowsD)) if len(r) > 0]
+        return {'v': (['x'], np.zeros(len(self.colPair), dtype=np.int32), self.colPair),
+                'c': ([name for name, n in rows],
+                      np.repeat(np.arange(len(rows), dtype=np.int32), [n for name, n in rows]),
+                      np.concatenate([np.arange(n) for name, n in rows])),
+                'o': (['obj'], np.zeros(1, dtype=np.int32), np.zeros(1, dtype=np.int64))}
+
+    def write(self, nl_filename, chunkSize=CHUNK_SIZE, nProcesses=0):
+        """
+        Writes files nl_filename.nl, .row, .col and symbol map nl_filename.order_map.npz
+        :param nl_filename: path to NL-file, suffix '.nl' may be omitted
+        :param chunkSize: number of rows (columns) formatted at once
+        :param nProcesses: number of processes to format J-segments; 0 or 1 - format in this process
+        :return: path to NL-file
+        """
+        # Remove possible suffix '.nl' if any
+        if nl_filename.endswith(NL_EXT): nl_filename = nl_filename[:-len(NL_EXT)]
+
+        rowLabels = self.rowLabels()
+        colLabels = self.colLabels()
+        with open(nl_filename + '.row', 'w', newline='') as f:
+            f.write('\n'.join(rowLabels) + '\n')
+        with open(nl_filename + '.col', 'w', newline='') as f:
+            f.write('\n'.join(colLabels) + '\n')
+        save_order_map(nl_filename + ORDER_MAP_EXT, self.orderMap())
+
+        nCons = self.nCons
+        nVars = len(colLabels)
+        with open(nl_filename + NL_EXT, 'w', newline='') as f:
+            f.write('g3 1 1 0\t# problem %s\n' % (self.name))
+            f.write(' %d %d 1 0 0 \t# vars, constraints, objectives, ranges, eqns\n' % (nVars, nCons))
+            f.write(' 0 0 0 0 0 0\t# nonlinear constrs, objs; ccons: lin, nonlin, nd, nzlb\n')
+            f.write(' 0 0\t# network constraints: nonlinear, linear\n')
+            f.write(' 0 0 0 \t# nonlinear vars in constraints, objectives, both\n')
+            f.write(' 0 0 0 1\t# linear network variables; functions; arith, flags\n')
+            f.write(' %d %d 0 0 0 \t# discrete variables: binary, integer, nonlinear (b,c,o)\n'
+                    % (self.nBinary, self.nInteger))
+            f.write(' %d %d \t# nonzeros in Jacobian, obj. gradient\n' % (len(self.jacCol), len(self.objCol)))
+            f.write(' %d %d\t# max name lengths: constraints, variables\n'
+                    % (max(map(len, rowLabels)), max(map(len, colLabels), default=0)))
+            f.write(' 0 0 0 0 0\t# common exprs: b,c,o,c1,o1\n')
+
+            # Constraints and objective are linear
+            for lo in range(0, nCons, chunkSize):
+                f.write(''.join('C%d\t#%s\nn0\n' % (r, rowLabels[r]) for r in range(lo, min(lo + chunkSize, nCons))))
+            f.write('O0 0\t#obj\nn0\n')
+
+            # Initial values of x_ij (see SptpData_5.getInitX)
+            data = self.sptpData
+            I, J = data.I.tolist(), data.J.tolist()
+            iCol, jCol = self.colPairs()
+            f.write('x%d\t# initial guess\n' % (nVars))
+            for lo in range(0, nVars, chunkSize):
+                hi = min(lo + chunkSize, nVars)
+                f.write(''.join('%d %s\t#%s\n' % (n, int(data.getInitX(I[i], J[j])), colLabels[n])
+                                for n, i, j in zip(range(lo, hi), iCol[lo:hi].tolist(), jCol[lo:hi].tolist())))
+
+            # Right-hand sides: (1) c <= rhs for assets and max cost, (2) c >= rhs for requirements
+            f.write("r\t#%d ranges (rhs's)\n" % (nCons))
+            nA, nB = len(self.rowsA), len(self.rowsB)
+            rhs = self.rhs.tolist()
+            for lo in range(0, nCons, chunkSize):
+                f.write(''.join('%d %r\t#%s\n' % (2 if nA <= r < nA + nB else 1, rhs[r], rowLabels[r])
+                                for r in range(lo, min(lo + chunkSize, nCons))))
+
+            # Bounds: (0) 0 <= x <= ub, (2) x >= 0
+            f.write('b\t#%d bounds (on variables)\n' % (nVars))
+            uBound = self.uBound.tolist()
+            for lo in range(0, nVars, chunkSize):
+                f.write(''.join(('0 0 %r\t#%s\n' % (uBound[n], colLabels[n]) if uBound[n] != np.inf
+                                 else '2 0\t#%s\n' % (colLabels[n]))
+                                for n in range(lo, min(lo + chunkSize, nVars))))
+
+            # Cumulative numbers of nonzeros in the columns of the Jacobian
+            f.write('k%d\t#intermediate Jacobian column lengths\n' % (nVars - 1))
+            kTotal = np.cumsum(np.bincount(self.jacCol, minlength=nVars))[:-1].tolist()
+            for lo in range(0, len(kTotal), chunkSize):
+                f.write(''.join('%d\n' % k for k in kTotal[lo:lo + chunkSize]))
+
+            # J-segments by chunks of rows
+            ptr = self.jacPtr
+            chunks = ((lo, min(lo + chunkSize, nCons)) for lo in range(0, nCons, chunkSize))
+            chunks = (('J', lo, ptr[lo:hi+1] - ptr[lo], self.jacCol[ptr[lo]:ptr[hi]], self.jacCoef[ptr[lo]:ptr[hi]],
+                       rowLabels[lo:hi]) for lo, hi in chunks)
+            if nProcesses > 1:
+                pool = Pool(nProcesses)
+                try:
+                    for text in pool.imap(formatLinearArgs, chunks):
+                        f.write(text)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                for args in chunks:
+                    f.write(formatLinearArgs(args))
+
+            # G-segment
+            if len(self.objCol) > 0:
+                f.write(formatLinear('G', 0, np.array([0, len(self.objCol)]), self.objCol, self.objCoef, ['obj']))
+
+        return nl_filename + NL_EXT
+
+
+def writeNlDirect(sptpData, nl_filename, isInteger=True, chunkSize=CHUNK_SIZE, nProcesses=0):
+    """
+    Writes NL-file of SPTPmodel_5(sptpData, isInteger, sparse=True) and its .row, .col files without the model
+    :return: path to NL-file
+    """
+    return SptpNl_5(sptpData, isInteger).write(nl_filename, chunkSize=chunkSize, nProcesses=nProcesses)
@@ -0,0 +1,163 @@
+"""
+Local cache of solutions of NL-files, used by SsopSession.runJob to skip solving of the same problems again.
+
+The key of a problem is sha256 of the solver name and digests of the options file and the NL-file contents,
+so regenerated but identical NL-files are found whatever their names are.
+Only problems solved by the solver are cached (solve result code of SOL-file, see solveResult).
+Output files of the solved task (SOL-file, log and errors, see ssop_zip.RESULT_KINDS) are kept in the cache folder
+as <key>.sol, <key>.log.txt, <key>.err.txt; SOL-file is written last, so the entry exists iff it has SOL-file.
+Problems without SOL-file are not cached: they are solved again.
+Entries are evicted in least recently used order (by modification time of SOL-file, touched on every hit)
+when total size or number of entries exceeds the limits.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from ssop_zip import RESULT_KINDS
+
+HASH_CHUNK = 1 << 20
+TEMP_EXT = '.tmp'
+# Solve result codes below this one are solved (see is_solved in asl_io/read.py)
+SOLVE_RESULT_FAILED = 200
+
+
+def fileDigest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.digest()
+
+
+def solveKey(nlDigest, optionsDigest, solver):
+    """
+    Returns key of the problem
+    :param nlDigest, optionsDigest: fileDigest of the NL-file and the options file
+    """
+    return hashlib.sha256(solver.encode('utf-8') + b'\0' + optionsDigest + b'\0' + nlDigest).hexdigest()
+
+
+def solveResult(sol):
+    """
+    Returns solve result code of SOL-file (the last number of its objno line, 0 if there is no such line)
+    :param sol: contents of SOL-file
+    """
+    for line in reversed(sol.splitlines()):
+        t = line.split()
+        if len(t) == 3 and t[0] == b'objno':
+            return int(t[2])
+    return 0
+
+
+def isSolved(sol):
+    """
+    Returns True iff SOL-file is a solution of the problem (not e.g. infeasible or failed one)
+    """
+    try:
+        return 0 <= solveResult(sol) < SOLVE_RESULT_FAILED
+    except ValueError:
+        return False
+
+
+class SolveCache:
+    def __init__(self, folder, maxBytes, maxEntries=None):
+        """
+        :param folder: folder of the cache, it is created if missing
+        :param maxBytes: max total size of cached files
+        :param maxEntries: max number of cached problems, None - no limit
+        """
+        self.folder = folder
+        self.maxBytes = maxBytes
+        self.maxEntries = maxEntries
+        self.lock = threading.Lock()
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        # sizes of entries by keys, least recently used first
+        self.entries = OrderedDict()
+        self.size = 0
+        stamps = []
+        for f in os.listdir(folder):
+            if f.endswith(RESULT_KINDS[0][1]):
+                key = f[:-len(RESULT_KINDS[0][1])]
+                stamps.append((os.stat(os.path.join(folder, f)).st_mtime, key))
+        for mtime, key in sorted(stamps):
+            self.entries[key] = sum(os.path.getsize(path) for path in self.files(key).values())
+            self.size += self.entries[key]
+
+    def path(self, key, kind):
+        return os.path.join(self.folder, key + dict(RESULT_KINDS)[kind])
+
+    def files(self, key):
+        # Existing files of the entry by kinds
+        files = {}
+        for kind, suffix in RESULT_KINDS:
+            path = os.path.join(self.folder, key + suffix)
+            if os.path.exists(path):
+                files[kind] = path
+        return files
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key):
+        """
+        Returns paths to cached files of the problem by kinds ('sol', 'log', 'err'), None if it is not cached,
+        marks the entry as recently used
+        """
+        with self.lock:
+            if key not in self.entries:
+                return None
+            try:
+                os.utime(self.path(key, 'sol'))
+            except OSError:
+                # evicted by another process
+                self.size -= self.entries.pop(key)
+                return None
+            self.entries.move_to_end(key)
+            return self.files(key)
+
+    def put(self, key, outputs):
+        """
+        Caches output files of solved problem
+        :param outputs: contents of files by kinds, 'sol' is required
+        """
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)
+            size = 0
+            for kind, suffix in RESULT_KINDS[::-1]:
+                path = os.path.join(self.folder, key + suffix)
+                data = outputs.get(kind)
+                if data is None:
+                    if os.path.exists(path):
+                        os.remove(path)
+                    continue
+                with open(path + TEMP_EXT, 'wb') as f:
+                    f.write(data)
+                os.replace(path + TEMP_EXT, path)
+                size += len(data)
+            self.entries[key] = size
+            self.size += size
+            self.evict()
+
+    def evict(self):
+        # Removes least recently used entries till the cache fits its limits
+        while self.entries and (self.size > self.maxBytes or
+                                (self.maxEntries is not None and len(self.entries) > self.maxEntries)):
+            key, size = self.entries.popitem(last=False)
+            self.size -= size
+            # SOL-file first: the entry is absent even if removing of other files fails
+            for kind, suffix in RESULT_KINDS:
+                try:
+                    os.remove(os.path.join(self.folder, key + suffix))
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self.lock:
+            maxBytes, self.maxBytes = self.maxBytes, -1
+            self.evict()
+            self.maxBytes = maxBytes
@@ -30,6 +30,7 @@ SOLVER_OPTIONS_DELIMETER = {"ipopt" : " ", "scip" : " = "}
 PARAMETER_SWEEP_ID = "530f36d73d00002d04548b0e"
 SOLVE_AMPL_STUB_ID = "vladimirv/solve-ampl-stub" #"531f44233e0000c015f09ad3"
 SSOP_ID = "vladimirv/SSOP" #"5bb2783e420000772e1049fd"
+SSOP_ENDPOINT = "https://optmod.distcomp.org"
 
 
 # Add your Everest login and password here to make token update automatically
@@ -41,5 +42,44 @@ UPDATE_TOKEN_PERIOD_IN_SEC = 7*24*3600 - 5*3600
 # Working dirs
 SSOP_DEFAULT_WORKING_DIR = "./temp"
 
+# Compression of NL-files sent to SSOP: zlib level (0 - store only) and number of threads reading them
+SSOP_ZIP_LEVEL = 6
+SSOP_ZIP_THREADS = 1
+
+# Number of ranges of large results fetched at once
+SSOP_DOWNLOAD_PARALLEL = 4
+
+# Limits of jobs made by ssop_scheduler.JobPipeline: bytes and number of NL-files, predicted seconds,
+# number of jobs in flight
+SSOP_MAX_JOB_BYTES = 256 * 1024 * 1024
+SSOP_MAX_JOB_FILES = 1000
+SSOP_MAX_JOB_TIME = 3600
+SSOP_PIPELINE_DEPTH = 2
+
+# Throughput of resources measured by ssop_scheduler.ShardScheduler (file in the working dir)
+SSOP_THROUGHPUT_FILE = "ssop_throughput.json"
+
+# Journal of submitted jobs resumed by SsopSession after restart (SQLite file in the working dir, None - no journal)
+SSOP_JOURNAL_FILE = "ssop_journal.sqlite"
+# Jobs running when the script is interrupted (Ctrl-C) are cancelled, otherwise they are left running
+# and resumed by the next run with the journal
+SSOP_CANCEL_ON_INTERRUPT = False
+
+# Cache of solutions of SsopSession.runJob: folder in the working dir (None - no cache), max bytes and entries (None - no limit)
+SSOP_CACHE_DIR = None
+SSOP_CACHE_SIZE = 1024 * 1024 * 1024
+SSOP_CACHE_ENTRIES = None
+
+# Metrics of jobs collected by SsopSession: JSON lines file and Prometheus text file in the working dir (None - no file)
+SSOP_METRICS_FILE = "ssop_metrics.jsonl"
+SSOP_PROMETHEUS_FILE = None
+
+# ssop_local.LocalSession: number of tasks at once (None - number of CPUs), seconds and megabytes of a task
+# (None - no limit), folder of run-<solver>.sh scripts (None - PATH)
+SSOP_LOCAL_WORKERS = None
+SSOP_LOCAL_TIME_LIMIT = None
+SSOP_LOCAL_MEMORY_LIMIT = None
+SSOP_LOCAL_SCRIPTS_DIR = None
+
 # Run miscellaneous
 SSOP_RUN_SH_PREFIX = "run-" # run-ipopt.sh, run-scip.sh, run-fscip.sh ...
@@ -0,0 +1,151 @@
+"""
+Journal of SSOP jobs in SQLite database, kept by SsopSession to resume interrupted runs.
+
+Every submitted job is recorded with its NL-files (names and hash of their contents, each file separately),
+hash of the options file, solver, Everest job id, state and URI of results. The state is the state of Everest job
+(SUBMITTED, RUNNING, DONE, FAILED, CANCELLED...) or COLLECTED when results are downloaded and saved,
+LOST when Everest does not know the job any more.
+Journaled jobs are matched to NL-files one by one (see JobJournal.findTasks), not by the whole set of the job,
+as jobs of a batch are packed again after a restart (by new sizes and throughput). Entry points which resume:
+ - SsopSession.runJob and submitJob reattach to a live journaled job only if it solves all NL-files of the job;
+ - JobPipeline.run and ShardScheduler.run (ssop_scheduler.py) reattach to all live journaled jobs solving
+   some NL-files of the batch, only the rest of the batch is packed into new jobs.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+# Jobs in these states are not reattached: their problems are submitted again
+DEAD_STATES = ('FAILED', 'CANCELLED', 'BROKEN', 'LOST')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    session TEXT NOT NULL,
+    solver TEXT NOT NULL,
+    nl_names TEXT NOT NULL,
+    nl_hash TEXT NOT NULL,
+    options_hash TEXT NOT NULL,
+    state TEXT NOT NULL,
+    result_uri TEXT,
+    results_file TEXT,
+    submitted REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_inputs ON jobs (nl_hash, options_hash, solver);
+CREATE TABLE IF NOT EXISTS tasks (
+    job_id TEXT NOT NULL,
+    nl_name TEXT NOT NULL,
+    nl_hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_inputs ON tasks (nl_hash);
+"""
+# Max number of parameters of SQLite query
+QUERY_CHUNK = 500
+
+
+def inputHash(name, digest):
+    """
+    Returns hash of input file of a job: sha256 of its name and digest of its contents
+    :param digest: sha256 digest (bytes) of the contents, e.g. ssop_cache.fileDigest
+    """
+    return hashlib.sha256(name.encode('utf-8') + b'\0' + digest).hexdigest()
+
+
+class JobJournal:
+    def __init__(self, filename):
+        """
+        :param filename: path to SQLite database, it is created if missing
+        """
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.lock, self.db:
+            self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def record(self, jobId, name, session, solver, nlNames, nlHashes, optionsHash, state='SUBMITTED'):
+        """
+        Records submitted job
+        :param nlHashes: inputHash of every NL-file of nlNames
+        """
+        now = time.time()
+        nlHash = hashlib.sha256(''.join(nlHashes).encode('utf-8')).hexdigest()
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO jobs (id, name, session, solver, nl_names, nl_hash, options_hash, '
+                            'state, submitted, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            (jobId, name, session, solver, json.dumps(nlNames), nlHash, optionsHash, state, now, now))
+            self.db.execute('DELETE FROM tasks WHERE job_id = ?', (jobId,))
+            self.db.executemany('INSERT INTO tasks (job_id, nl_name, nl_hash) VALUES (?, ?, ?)',
+                                [(jobId, nlName, h) for nlName, h in zip(nlNames, nlHashes)])
+
+    def update(self, jobId, state, resultUri=None, resultsFile=None):
+        """
+        Sets state of the job, URI of its results and path to downloaded results if they are given
+        """
+        with self.lock, self.db:
+            self.db.execute('UPDATE jobs SET state = ?, result_uri = COALESCE(?, result_uri), '
+                            'results_file = COALESCE(?, results_file), updated = ? WHERE id = ?',
+                            (state, resultUri, resultsFile, time.time(), jobId))
+
+    def get(self, jobId):
+        """
+        Returns record of the job as dict, None if the job is not journaled
+        """
+        with self.lock:
+            row = self.db.execute('SELECT * FROM jobs WHERE id = ?', (jobId,)).fetchone()
+        return self.toDict(row) if row is not None else None
+
+    def findTasks(self, nlHashes, optionsHash, solver, exclude=()):
+        """
+        Returns live jobs (not in DEAD_STATES) solving some of the NL-files with the same options,
+        every NL-file is given to the latest of such jobs
+        :param nlHashes: inputHash of NL-files by their names
+        :param exclude: ids of jobs to skip, e.g. already attached by the session
+        :return: list of (record of the job, list of names of its NL-files of nlHashes), the latest jobs first
+        """
+        byHash = dict((h, nlName) for nlName, h in nlHashes.items())
+        hashes = list(byHash)
+        rows = []
+        with self.lock:
+            for n in range(0, len(hashes), QUERY_CHUNK):
+                chunk = hashes[n:n + QUERY_CHUNK]
+                rows.extend(self.db.execute('SELECT jobs.*, tasks.nl_hash AS task_hash FROM tasks '
+                                            'JOIN jobs ON jobs.id = tasks.job_id WHERE tasks.nl_hash IN (%s) '
+                                            'AND jobs.options_hash = ? AND jobs.solver = ?' % (','.join('?' * len(chunk))),
+                                            chunk + [optionsHash, solver]).fetchall())
+        jobs = {}
+        for row in sorted(rows, key=lambda row: -row['submitted']):
+            if row['state'] in DEAD_STATES or row['id'] in exclude or row['task_hash'] not in byHash:
+                continue
+            if row['id'] not in jobs:
+                job = self.toDict(row)
+                del job['task_hash']
+                jobs[row['id']] = (job, [])
+            jobs[row['id']][1].append(byHash.pop(row['task_hash']))
+        # NL-files of a job are kept in the given order
+        position = dict((nlName, n) for n, nlName in enumerate(nlHashes))
+        for job, nlNames in jobs.values():
+            nlNames.sort(key=position.get)
+        return sorted(jobs.values(), key=lambda item: -item[0]['submitted'])
+
+    def jobs(self, session=None, states=None):
+        """
+        Returns records of jobs of the session (None - all sessions) in the states (None - any state)
+        in order of submission
+        """
+        with self.lock:
+            rows = self.db.execute('SELECT * FROM jobs ORDER BY submitted').fetchall()
+        return [self.toDict(row) for row in rows
+                if (session is None or row['session'] == session) and (states is None or row['state'] in states)]
+
+    def toDict(self, row):
+        job = dict(row)
+        job['nl_names'] = json.loads(job['nl_names'])
+        return job
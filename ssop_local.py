@@ -0,0 +1,175 @@
+"""
+Local solving of NL-files, drop-in alternative to SsopSession for small instances (no network round trip).
+
+Every NL-file is solved in its own temporary folder as SSOP task of the plan made by SsopSession:
+by run-<solver>.sh script (SSOP_RUN_SH_PREFIX) with arguments <nlname> <options> if it is found
+in scriptsDir (or PATH), otherwise by AMPL executable of the solver (<solver> <nlname>.nl -AMPL),
+then the options file is copied to the file read by the solver by default (ipopt.opt, scip.set).
+Output of the task is saved as <nlname>.log.txt, its errors as <nlname>.err.txt.
+SOL-files of solved problems and logs of unsolved ones are moved to the workdir.
+Tasks run in a bounded pool of processes with limits of time and memory (memory by ulimit of POSIX shell).
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
+import ssop_config
+
+# Files of options read by AMPL executables of solvers
+OPTION_FILES = {"ipopt": "ipopt.opt", "scip": "scip.set"}
+
+
+class LocalSession:
+    def __init__(self, name='problem', workdir=ssop_config.SSOP_DEFAULT_WORKING_DIR,
+                 workers=ssop_config.SSOP_LOCAL_WORKERS, timeLimit=ssop_config.SSOP_LOCAL_TIME_LIMIT,
+                 memoryLimit=ssop_config.SSOP_LOCAL_MEMORY_LIMIT, scriptsDir=ssop_config.SSOP_LOCAL_SCRIPTS_DIR,
+                 executables={}, debug=False):
+        """
+        :param workers: max number of tasks running at once, None - number of CPUs
+        :param timeLimit: max seconds of a task, None - no limit
+        :param memoryLimit: max megabytes of virtual memory of a task, None - no limit
+        :param scriptsDir: folder of run-<solver>.sh scripts, None - they are looked for in PATH
+        :param executables: paths to AMPL executables of solvers {solver: path}, default - solver name in PATH
+        """
+        self.name = name
+        self.workdir = workdir
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.timeLimit = timeLimit
+        self.memoryLimit = memoryLimit
+        self.scriptsDir = scriptsDir
+        self.executables = executables
+        self.debug = debug
+        self.nJobs = 0
+        self.listJobsId = []
+        self.nProblems = 0
+        self.processes = set()
+        self.lock = threading.Lock()
+        self.cancelled = False
+
+    def makeFileName(self, fname, suffix=""):
+        return os.path.join(self.workdir, fname + suffix)
+
+    def makeCommand(self, nlName, optFile, solver, taskDir):
+        """
+        Returns command of the task, copies options file to taskDir
+        """
+        script = shutil.which(ssop_config.SSOP_RUN_SH_PREFIX + solver + '.sh', path=self.scriptsDir)
+        if script is not None:
+            shutil.copy(self.makeFileName(optFile), os.path.join(taskDir, optFile))
+            command = ['sh', os.path.abspath(script), nlName, optFile]
+        else:
+            shutil.copy(self.makeFileName(optFile), os.path.join(taskDir, OPTION_FILES.get(solver, optFile)))
+            command = [self.executables.get(solver, solver), nlName + '.nl', '-AMPL']
+        if self.memoryLimit is not None:
+            command = ['sh', '-c', 'ulimit -v %d && exec "$@"' % (self.memoryLimit * 1024), 'sh'] + command
+        return command
+
+    def runTask(self, nlName, optFile, solver):
+        """
+        Solves NL-file in temporary folder
+        :return: True if SOL-file is made
+        """
+        if self.cancelled:
+            return False
+        taskDir = tempfile.mkdtemp(prefix=nlName + '-')
+        try:
+            nlFile = os.path.join(taskDir, nlName + '.nl')
+            try:
+                os.symlink(os.path.abspath(self.makeFileName(nlName, '.nl')), nlFile)
+            except OSError:
+                shutil.copy(self.makeFileName(nlName, '.nl'), nlFile)
+            command = self.makeCommand(nlName, optFile, solver, taskDir)
+            if self.debug:
+                print("Task %s: %s" % (nlName, ' '.join(command)))
+            timedOut = False
+            with open(os.path.join(taskDir, nlName + '.log.txt'), 'wb') as out, \
+                    open(os.path.join(taskDir, nlName + '.err.txt'), 'wb') as err:
+                try:
+                    proc = subprocess.Popen(command, cwd=taskDir, stdout=out, stderr=err, start_new_session=True)
+                except OSError as e:
+                    err.write(('Task %s is not started: %s\n' % (nlName, e)).encode('utf-8'))
+                    proc = None
+                if proc is not None:
+                    with self.lock:
+                        self.processes.add(proc)
+                    try:
+                        proc.wait(timeout=self.timeLimit)
+                    except subprocess.TimeoutExpired:
+                        timedOut = True
+                        self.kill(proc)
+                        proc.wait()
+                        err.write(('Time limit %g s is exceeded\n' % (self.timeLimit)).encode('utf-8'))
+                    finally:
+                        with self.lock:
+                            self.processes.discard(proc)
+            solFile = os.path.join(taskDir, nlName + '.sol')
+            if os.path.exists(solFile) and not timedOut and not self.cancelled:
+                shutil.move(solFile, self.makeFileName(nlName, '.sol'))
+                return True
+            for suffix in ('.log.txt', '.err.txt'):
+                shutil.move(os.path.join(taskDir, nlName + suffix), self.makeFileName(nlName, suffix))
+            return False
+        finally:
+            shutil.rmtree(taskDir, ignore_errors=True)
+
+    def kill(self, proc):
+        # Task is killed with its children (the task is leader of its process group)
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    def runJob(self, nlNames, optFile, solver="ipopt"):
+        """
+        Solves the list of NL-files like SsopSession.runJob, but on the local machine
+        :param nlNmes: list of NL-files without .nl extension, should be placed in the workdir
+        :param optFile: file with solver options, should be placed in the workdir
+        :param solver: {ipopt|scip|...}
+        :return: list of solved problems, list of unsolved, JobId
+        """
+        jobId = 'local-%s-%d' % (self.name, self.nJobs + 1)
+        self.nJobs = self.nJobs + 1
+        self.listJobsId.append(jobId)
+        self.cancelled = False
+
+        print("Job " + jobId + " is starting")
+        startTime = timer()
+        pool = ThreadPoolExecutor(self.workers)
+        try:
+            solvedFlags = list(pool.map(lambda nlName: self.runTask(nlName, optFile, solver), nlNames))
+        except KeyboardInterrupt:
+            print('Cancelling the job...')
+            self.cancelled = True
+            with self.lock:
+                for proc in self.processes:
+                    self.kill(proc)
+            pool.shutdown(wait=True)
+            return (None, None, jobId)
+        pool.shutdown()
+
+        solved = [nlName for nlName, flag in zip(nlNames, solvedFlags) if flag]
+        unsolved = [nlName for nlName, flag in zip(nlNames, solvedFlags) if not flag]
+        self.nProblems = self.nProblems + len(nlNames)
+
+        stopTime = timer()
+        print('Job %s took: %g s' % (jobId, stopTime - startTime))
+        return solved, unsolved, jobId
+
+    def deleteAllJobs(self):
+        self.listJobsId = []
+        return
+
+    def deleteWorkFiles(self, patterns):
+        files = os.listdir(self.workdir)
+        for f in files:
+            for p in patterns:
+                if p in f:
+                    os.remove(os.path.join(self.workdir, f))
+        return
@@ -0,0 +1,145 @@
+"""
+Metrics of SSOP jobs: where the wall-clock time of a job goes and how many bytes it moves.
+
+Every job collected by SsopSession is one JSON line of the metrics file with timestamps (seconds since epoch)
+of its phases, their durations, bytes of the uploaded inputs (inputs reused by upload cache of everest.py
+are not counted) and of the downloaded results, and solve time of every task parsed from its log
+(see SOLVE_TIME_PATTERNS).
+Phases (PHASES) are: zip - making of plan and zip of NL-files, upload - upload of them, submit - request of the job,
+queue - waiting of the job for a resource, execution - run of the job, download - download of results,
+extraction - saving of SOL-files and logs. Queue and execution are measured by the states of the job
+seen by the poller of everest.py, i.e. with precision of its poll interval.
+Resumed jobs (reattached through the journal, see ssop_journal.py) are marked in their records:
+they have no zip, upload and submit phases and upload nothing.
+Totals of all jobs are optionally written in Prometheus text format (e.g. for textfile collector of node_exporter)
+with numbers of jobs timed in every phase, so the average of a phase is its seconds divided by its jobs.
+"""
+import json
+import os
+import re
+import threading
+
+# Phases of a job: name, timestamps of its start and stop
+PHASES = (('zip', 'zipStart', 'zipStop'),
+          ('upload', 'uploadStart', 'uploadStop'),
+          ('submit', 'uploadStop', 'submitted'),
+          ('queue', 'submitted', 'running'),
+          ('execution', 'running', 'finished'),
+          ('download', 'downloadStart', 'downloadStop'),
+          ('extraction', 'downloadStop', 'extracted'))
+
+# Solve time of a task in its log: Ipopt (3.14 and older), SCIP
+SOLVE_TIME_PATTERNS = (re.compile(br'Total seconds in IPOPT\s*=\s*([0-9.eE+-]+)'),
+                       re.compile(br'Total CPU secs in IPOPT \(w/o function evaluations\)\s*=\s*([0-9.eE+-]+)\s*'
+                                  br'Total CPU secs in NLP function evaluations\s*=\s*([0-9.eE+-]+)'),
+                       re.compile(br'Solving Time \(sec\)\s*:\s*([0-9.eE+-]+)'))
+
+PROMETHEUS_PREFIX = 'ssop'
+
+
+def solveTime(log):
+    """
+    Returns seconds of solving printed to log (bytes) by the solver, None if they are not found
+    """
+    if log is None:
+        return None
+    for pattern in SOLVE_TIME_PATTERNS:
+        m = pattern.search(log)
+        if m is not None:
+            return sum(float(value) for value in m.groups())
+    return None
+
+
+def jobRecord(jobId, jobName, timestamps, uploadBytes=0, downloadBytes=0, taskTimes={}, resumed=False, **info):
+    """
+    Returns metrics of the job as dict
+    :param timestamps: dict of times of the job (see PHASES), missing ones are skipped
+    :param taskTimes: solve seconds of tasks by names of NL-files (None - unknown)
+    :param resumed: the job is reattached, not submitted by the session
+    :param info: other fields of the record, e.g. solver, numbers of solved and unsolved problems
+    """
+    phases = {}
+    for phase, start, stop in PHASES:
+        if timestamps.get(start) is not None and timestamps.get(stop) is not None:
+            phases[phase] = max(timestamps[stop] - timestamps[start], 0.)
+    known = [t for t in taskTimes.values() if t is not None]
+    record = {'jobId': jobId, 'jobName': jobName, 'timestamps': timestamps, 'phases': phases,
+              'uploadBytes': uploadBytes, 'downloadBytes': downloadBytes, 'taskTimes': taskTimes, 'resumed': resumed,
+              'taskTimeTotal': sum(known), 'taskTimeMax': max(known) if known else None}
+    record.update(info)
+    return record
+
+
+class MetricsLog:
+    def __init__(self, filename, prometheusFile=None):
+        """
+        Appends records of jobs to JSON lines file filename
+        :param prometheusFile: file rewritten with totals of the records in Prometheus text format, None - no file
+        """
+        self.filename = filename
+        self.prometheusFile = prometheusFile
+        self.lock = threading.Lock()
+        self.jobs = 0
+        self.resumedJobs = 0
+        self.tasks = 0
+        self.phaseSeconds = dict((phase, 0.) for phase, start, stop in PHASES)
+        self.phaseJobs = dict((phase, 0) for phase, start, stop in PHASES)
+        self.bytes = {'upload': 0, 'download': 0}
+        self.solveSeconds = 0.
+        self.last = None
+
+    def write(self, record):
+        with self.lock:
+            with open(self.filename, 'a') as f:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+            self.jobs += 1
+            if record.get('resumed'):
+                self.resumedJobs += 1
+            self.tasks += len(record['taskTimes'])
+            for phase, seconds in record['phases'].items():
+                self.phaseSeconds[phase] += seconds
+                self.phaseJobs[phase] += 1
+            self.bytes['upload'] += record['uploadBytes']
+            self.bytes['download'] += record['downloadBytes']
+            self.solveSeconds += record['taskTimeTotal']
+            self.last = record
+            if self.prometheusFile is not None:
+                self.writePrometheus()
+
+    def prometheusText(self):
+        p = PROMETHEUS_PREFIX
+        lines = ['# HELP %s_jobs_total Collected SSOP jobs.' % p, '# TYPE %s_jobs_total counter' % p,
+                 '%s_jobs_total %d' % (p, self.jobs),
+                 '# HELP %s_resumed_jobs_total Collected SSOP jobs reattached through the journal.' % p,
+                 '# TYPE %s_resumed_jobs_total counter' % p,
+                 '%s_resumed_jobs_total %d' % (p, self.resumedJobs),
+                 '# HELP %s_tasks_total Tasks (NL-files) of collected jobs.' % p, '# TYPE %s_tasks_total counter' % p,
+                 '%s_tasks_total %d' % (p, self.tasks),
+                 '# HELP %s_phase_seconds_total Seconds of phases of jobs.' % p,
+                 '# TYPE %s_phase_seconds_total counter' % p]
+        for phase, start, stop in PHASES:
+            lines.append('%s_phase_seconds_total{phase="%s"} %.6f' % (p, phase, self.phaseSeconds[phase]))
+        lines.extend(['# HELP %s_phase_jobs_total Jobs timed in phases (resumed jobs miss the first ones).' % p,
+                      '# TYPE %s_phase_jobs_total counter' % p])
+        for phase, start, stop in PHASES:
+            lines.append('%s_phase_jobs_total{phase="%s"} %d' % (p, phase, self.phaseJobs[phase]))
+        lines.extend(['# HELP %s_bytes_total Bytes of uploaded inputs and downloaded results.' % p,
+                      '# TYPE %s_bytes_total counter' % p])
+        for direction in ('upload', 'download'):
+            lines.append('%s_bytes_total{direction="%s"} %d' % (p, direction, self.bytes[direction]))
+        lines.extend(['# HELP %s_task_solve_seconds_total Solve seconds of tasks found in their logs.' % p,
+                      '# TYPE %s_task_solve_seconds_total counter' % p,
+                      '%s_task_solve_seconds_total %.6f' % (p, self.solveSeconds)])
+        if self.last is not None:
+            lines.extend(['# HELP %s_last_job_phase_seconds Seconds of phases of the last collected job.' % p,
+                          '# TYPE %s_last_job_phase_seconds gauge' % p])
+            for phase, start, stop in PHASES:
+                if phase in self.last['phases']:
+                    lines.append('%s_last_job_phase_seconds{phase="%s"} %.6f' % (p, phase, self.last['phases'][phase]))
+        return '\n'.join(lines) + '\n'
+
+    def writePrometheus(self):
+        # the file is replaced at once, so collectors never read it half-written
+        with open(self.prometheusFile + '.tmp', 'w') as f:
+            f.write(self.prometheusText())
+        os.replace(self.prometheusFile + '.tmp', self.prometheusFile)
@@ -0,0 +1,447 @@
+"""
+Running of a batch of NL-files by several SSOP jobs at once.
+
+JobPipeline packs NL-files into jobs bounded by total bytes, number of files and predicted solve time
+(by throughput below) and keeps `depth` jobs in flight: the next job is uploaded while the previous ones run.
+
+ShardScheduler splits the batch over several Everest resources of SSOP. Every resource runs one job (shard of the batch) at a time. Shards are cut from the rest of the batch
+when resources become free, so the remaining work is rebalanced as jobs finish:
+a resource gets its share of the rest by throughput divided by SHARD_SPLIT (the shards shrink
+to the end of the batch and fast resources take more of them), but no more than it solves in targetTime.
+Throughput of a resource is bytes of NL-files per second of its jobs (from submission to results),
+it is smoothed over past runs and saved to SSOP_THROUGHPUT_FILE in the workdir.
+Resources without statistics are assumed to be as fast as the average known one.
+When the whole batch is given out and some resources are free, stragglers are re-executed speculatively:
+the shard running `speculation` times longer than expected by the seconds per byte of finished shards
+of the batch is copied to the fastest free resource, the first finished copy wins, the other one is cancelled.
+Resource failing to take a shard is backed off for a while (see SUBMIT_BACKOFF) and dropped after several failures.
+Both of them reattach first to live jobs of the journal of the session solving some NL-files of the batch
+(e.g. submitted before restart of the script, see JobBatch.resume), only the rest of the batch is packed into new jobs.
+Before that problems solved already are taken from the cache of the session (if it has one, see SsopSession.takeCached),
+solutions of collected jobs are put to the cache.
+"""
+from __future__ import print_function
+
+import json
+import os
+import time
+from collections import deque
+from timeit import default_timer as timer
+
+import ssop_config
+
+# Weight of the last measurement in the smoothed throughput
+SMOOTHING = 0.3
+# Shard takes 1/SHARD_SPLIT of the share of the resource in the remaining work
+SHARD_SPLIT = 2
+# Max seconds of a shard for the resource with known throughput
+TARGET_TIME = 1800
+# Shard is straggler if it runs SPECULATION times longer than expected and at least MIN_STRAGGLER_TIME seconds,
+# stragglers are looked for every SPECULATION_INTERVAL seconds
+SPECULATION = 2.
+MIN_STRAGGLER_TIME = 60
+SPECULATION_INTERVAL = 10
+# Resource which failed to take a job is given shards again in SUBMIT_BACKOFF seconds,
+# the delay is doubled after every failure in a row, the resource is dropped after SUBMIT_FAILURES of them
+SUBMIT_BACKOFF = 30
+SUBMIT_FAILURES = 3
+
+
+def resourceName(resourceIds):
+    """
+    Returns name of the resource (key of SSOP_RESOURCES) if resourceIds is the only known resource, else None
+    """
+    names = [name for name, rid in ssop_config.SSOP_RESOURCES.items() if rid in resourceIds]
+    return names[0] if len(resourceIds) == 1 and len(names) == 1 else None
+
+
+def packJobs(nlNames, sizes, maxBytes, maxFiles, maxTime=None, throughput=None):
+    """
+    Packs NL-files into jobs, the largest files go first
+    :param sizes: dictionary {nlName: bytes}
+    :param maxBytes, maxFiles: max total bytes and number of NL-files of a job
+    :param maxTime: max predicted seconds (bytes / throughput) of a job, None - no limit
+    :return: list of lists of NL-files, the file exceeding limits makes its own job
+    """
+    maxSize = maxBytes
+    if maxTime is not None and throughput is not None:
+        maxSize = min(maxSize, maxTime * throughput)
+    jobs = []
+    jobSize = 0
+    for nlName in sorted(nlNames, key=lambda nlName: -sizes[nlName]):
+        if not jobs or len(jobs[-1]) >= maxFiles or jobSize + sizes[nlName] > maxSize:
+            jobs.append([])
+            jobSize = 0
+        jobs[-1].append(nlName)
+        jobSize += sizes[nlName]
+    return jobs
+
+
+class ThroughputStats:
+    def __init__(self, filename):
+        """
+        Throughput of resources (bytes/s) saved in JSON-file filename
+        """
+        self.filename = filename
+        self.stats = {}
+        if os.path.exists(filename):
+            with open(filename) as f:
+                self.stats = json.load(f)
+
+    def known(self, resource):
+        return resource in self.stats
+
+    def get(self, resource):
+        """
+        Returns throughput of the resource, average of known ones for the new resource (1 if nothing is known)
+        """
+        if resource in self.stats:
+            return self.stats[resource]['throughput']
+        if len(self.stats) == 0:
+            return 1.
+        return sum(stat['throughput'] for stat in self.stats.values()) / len(self.stats)
+
+    def update(self, resource, size, seconds):
+        """
+        Adds the job of the resource which solved size bytes of NL-files in seconds
+        """
+        throughput = size / max(seconds, 1.e-3)
+        stat = self.stats.get(resource)
+        if stat is None:
+            self.stats[resource] = {'throughput': throughput, 'jobs': 1}
+        else:
+            stat['throughput'] = (1. - SMOOTHING) * stat['throughput'] + SMOOTHING * throughput
+            stat['jobs'] += 1
+
+    def save(self):
+        with open(self.filename + '.tmp', 'w') as f:
+            json.dump(self.stats, f, indent=1, sort_keys=True)
+        os.replace(self.filename + '.tmp', self.filename)
+
+
+class JobBatch:
+    def __init__(self, session, statsFile=None):
+        """
+        Jobs of SsopSession running at once, their results are merged
+        :param session: SsopSession
+        :param statsFile: file of throughput statistics, default - SSOP_THROUGHPUT_FILE in the workdir of session
+        """
+        self.session = session
+        if statsFile is None:
+            statsFile = session.makeFileName(ssop_config.SSOP_THROUGHPUT_FILE)
+        self.stats = ThroughputStats(statsFile)
+        self.sizes = {}
+        self.optFile = None
+        self.solver = None
+        self.running = {}
+        self.solved = []
+        self.unsolved = []
+        self.jobIds = []
+        # dictionaries of finished jobs: jobId, resource, state, nlNames, bytes, seconds, solved, unsolved
+        self.report = []
+
+    def start(self, nlNames, optFile, solver):
+        """
+        Starts the batch, problems solved already are taken from the cache of the session
+        :return: list of NL-files not found in the cache
+        """
+        self.sizes = dict((nlName, os.path.getsize(self.session.makeFileName(nlName, '.nl'))) for nlName in nlNames)
+        self.optFile = optFile
+        self.solver = solver
+        self.running = {}
+        self.unsolved = []
+        self.jobIds = []
+        self.report = []
+        self.solved, nlNames = self.session.takeCached(nlNames, optFile, solver)
+        return nlNames
+
+    def resume(self, nlNames, optFile, solver):
+        """
+        Reattaches to live journaled jobs of the session solving some of NL-files (see SsopSession.resumeJobs),
+        they run with no resource, so they are not counted in statistics
+        :return: list of NL-files not solved by the jobs
+        """
+        resumed = set()
+        for job, jobName, jobNlNames in self.session.resumeJobs(nlNames, optFile, solver):
+            self.running[job] = {'resource': None, 'jobName': jobName, 'nlNames': jobNlNames,
+                                 'bytes': sum(self.sizes[nlName] for nlName in jobNlNames), 'start': timer()}
+            resumed.update(jobNlNames)
+        if resumed:
+            print("%d of %d NL-files are solved by %d resumed jobs" % (len(resumed), len(nlNames), len(self.running)))
+        return [nlName for nlName in nlNames if nlName not in resumed]
+
+    def submit(self, nlNames, optFile, solver, resource=None, resourceIds=None):
+        """
+        Submits job of NL-files to resources resourceIds (None - resources of the session)
+        :param resource: name of the resource for statistics, None - not collected
+        :return: job, None if it is not submitted
+        """
+        job, jobName = self.session.submitJob(nlNames, optFile, solver, resourceIds)
+        if job is not None:
+            self.running[job] = {'resource': resource, 'jobName': jobName, 'nlNames': nlNames,
+                                 'bytes': sum(self.sizes[nlName] for nlName in nlNames), 'start': timer()}
+        return job
+
+    def waitDone(self, timeout=None):
+        """
+        Waits for some of running jobs, collects their results
+        :param timeout: max seconds to wait, None - till some job is finished
+        :return: list of finished jobs, list of reports of jobs which do not run any more
+        """
+        done, pending = self.session.session.wait(list(self.running), timeout)
+        finished = []
+        for job in done:
+            if job in self.running:
+                finished.extend(self.finish(job))
+        return done, finished
+
+    def finish(self, job):
+        """
+        Collects results of finished job
+        :return: list of reports of jobs which do not run any more
+        """
+        info = self.collect(job)
+        self.solved.extend(info['solved'])
+        self.unsolved.extend(info['unsolved'])
+        return [info]
+
+    def collect(self, job):
+        """
+        Collects results of finished job, adds it to ids of jobs, report and statistics
+        :return: report of the job
+        """
+        info = self.running.pop(job)
+        solved, unsolved = self.session.collectJob(job, info.pop('jobName'), info['nlNames'])
+        self.session.storeCached(job.id, solved, self.optFile, self.solver)
+        solvedSet = set(solved)
+        info.update(jobId=job.id, state=job.state, seconds=timer() - info.pop('start'), solved=solved,
+                    unsolved=[nlName for nlName in info['nlNames'] if nlName not in solvedSet])
+        self.jobIds.append(job.id)
+        self.report.append(info)
+        if job.state == 'DONE' and info['resource'] is not None:
+            self.stats.update(info['resource'], info['bytes'], info['seconds'])
+        return info
+
+    def cancelRunning(self):
+        """
+        Cancels running jobs, their states are journaled
+        """
+        print('Cancelling the jobs...')
+        for job in list(self.running):
+            self.session.cancelJob(job)
+
+    def interrupt(self):
+        """
+        Cancels running jobs on KeyboardInterrupt if cancelOnInterrupt of the session is set,
+        otherwise leaves them running to be resumed by the next run (see SsopSession.detach)
+        """
+        if self.session.cancelOnInterrupt:
+            self.cancelRunning()
+        else:
+            self.session.detach(list(self.running))
+
+
+class JobPipeline(JobBatch):
+    def __init__(self, session, maxJobBytes=ssop_config.SSOP_MAX_JOB_BYTES, maxJobFiles=ssop_config.SSOP_MAX_JOB_FILES,
+                 maxJobTime=ssop_config.SSOP_MAX_JOB_TIME, depth=ssop_config.SSOP_PIPELINE_DEPTH, statsFile=None):
+        """
+        :param session: SsopSession, jobs are submitted to its resources
+        :param maxJobBytes, maxJobFiles: max total bytes and number of NL-files of a job
+        :param maxJobTime: max predicted seconds of a job, used if throughput of the resource is known
+        :param depth: max number of jobs in flight
+        """
+        JobBatch.__init__(self, session, statsFile)
+        self.maxJobBytes = maxJobBytes
+        self.maxJobFiles = maxJobFiles
+        self.maxJobTime = maxJobTime
+        self.depth = depth
+
+    def run(self, nlNames, optFile, solver="ipopt"):
+        """
+        Solves NL-files by bounded jobs of SsopSession.runJob format, merges their results
+        :param nlNames: list of NL-files without .nl extension, should be placed in the workdir
+        :return: list of solved problems, list of unsolved, list of ids of jobs (see also report)
+        """
+        nlNames = self.resume(self.start(nlNames, optFile, solver), optFile, solver)
+        resource = resourceName(self.session.resources)
+        throughput = None
+        if resource is not None and self.stats.known(resource):
+            throughput = self.stats.get(resource)
+        jobs = packJobs(nlNames, self.sizes, self.maxJobBytes, self.maxJobFiles, self.maxJobTime, throughput)
+        print("%d NL-files are packed into %d jobs" % (len(nlNames), len(jobs)))
+        try:
+            while jobs or self.running:
+                while jobs and len(self.running) < self.depth:
+                    shard = jobs.pop(0)
+                    if self.submit(shard, optFile, solver, resource) is None:
+                        self.unsolved.extend(shard)
+                if self.running:
+                    self.waitDone()
+        except KeyboardInterrupt:
+            self.interrupt()
+            raise
+        finally:
+            self.stats.save()
+        return self.solved, self.unsolved, self.jobIds
+
+
+class ShardScheduler(JobBatch):
+    def __init__(self, session, resources=None, targetTime=TARGET_TIME, statsFile=None, speculation=SPECULATION):
+        """
+        :param session: SsopSession, its jobs are submitted to one resource each
+        :param resources: names of resources (keys of SSOP_RESOURCES) or dictionary {name: id},
+                          None - all SSOP_RESOURCES
+        :param targetTime: max seconds of a shard for the resource with known throughput
+        :param statsFile: file of throughput statistics, default - SSOP_THROUGHPUT_FILE in the workdir of session
+        :param speculation: shard running speculation times longer than expected is copied to free resource,
+                            None - no speculative copies
+        """
+        JobBatch.__init__(self, session, statsFile)
+        if resources is None:
+            resources = ssop_config.SSOP_RESOURCES
+        if not isinstance(resources, dict):
+            resources = dict((name, ssop_config.SSOP_RESOURCES[name]) for name in resources)
+        self.resources = resources
+        self.targetTime = targetTime
+        self.speculation = speculation
+        self.queue = deque()
+        # speculative copy of the job and the job itself are partners of each other
+        self.partners = {}
+
+    def shardSize(self, resource, active):
+        """
+        Returns bytes of NL-files for the next shard of the resource
+        :param active: names of resources taking the rest of the batch
+        """
+        throughput = self.stats.get(resource)
+        total = sum(self.stats.get(r) for r in active)
+        remaining = sum(self.sizes[nlName] for nlName in self.queue)
+        size = remaining * throughput / total / SHARD_SPLIT
+        if self.stats.known(resource):
+            size = min(size, throughput * self.targetTime)
+        return size
+
+    def nextShard(self, resource, active):
+        # The largest NL-files go first, a shard has one NL-file at least
+        size = self.shardSize(resource, active)
+        shard = [self.queue.popleft()]
+        shardSize = self.sizes[shard[0]]
+        while self.queue and shardSize + self.sizes[self.queue[0]] <= size:
+            shard.append(self.queue.popleft())
+            shardSize += self.sizes[shard[-1]]
+        return shard, shardSize
+
+    def finish(self, job):
+        # The first finished of partners wins, the other one is cancelled
+        partner = self.partners.pop(job, None)
+        if partner is None or partner not in self.running:
+            return JobBatch.finish(self, job)
+        del self.partners[partner]
+        if job.state != 'DONE':
+            # the partner solves the rest of the shard, unsolved NL-files of the job are left to it
+            print("Job %s is %s, its copy %s is running" % (job.id, job.state, partner.id))
+            info = self.collect(job)
+            self.solved.extend(info['solved'])
+            solvedSet = set(info['solved'])
+            self.running[partner]['nlNames'] = [nlName for nlName in self.running[partner]['nlNames']
+                                                if nlName not in solvedSet]
+            return [info]
+        print("Job %s is done first, cancelling its copy %s" % (job.id, partner.id))
+        try:
+            self.session.session.cancelJob(partner.id)
+        except Exception as e:
+            print("Job %s is not cancelled: %s" % (partner.id, e))
+        self.session.listJobsId.append(partner.id)
+        return JobBatch.finish(self, job) + [self.running.pop(partner)]
+
+    def speculate(self, free, optFile, solver):
+        """
+        Copies stragglers to free resources
+        :return: True if some of running jobs may become stragglers (so they should be checked later)
+        """
+        rates = sorted(info['seconds'] / max(info['bytes'], 1) for info in self.report
+                       if info['state'] == 'DONE' and info['resource'] is not None)
+        if not rates or self.speculation is None:
+            return False
+        rate = rates[len(rates) // 2]
+        now = timer()
+        candidates = False
+        for job, info in sorted(self.running.items(), key=lambda item: item[1]['start']):
+            if job in self.partners:
+                continue
+            elapsed = now - info['start']
+            if elapsed < max(self.speculation * rate * info['bytes'], MIN_STRAGGLER_TIME):
+                candidates = True
+                continue
+            others = [resource for resource in free if resource != info['resource']]
+            if not others:
+                candidates = True
+                continue
+            resource = max(others, key=self.stats.get)
+            copy = self.submit(info['nlNames'], optFile, solver, resource, [self.resources[resource]])
+            if copy is None:
+                continue
+            print("Job %s on %s is straggler (%g s), copy %s -> %s" % (job.id, info['resource'], elapsed, copy.id, resource))
+            free.remove(resource)
+            self.partners[job] = copy
+            self.partners[copy] = job
+        return candidates
+
+    def run(self, nlNames, optFile, solver="ipopt"):
+        """
+        Solves NL-files by jobs of SsopSession.runJob format on several resources at once
+        :param nlNames: list of NL-files without .nl extension, should be placed in the workdir
+        :return: list of solved problems, list of unsolved, list of ids of jobs (see also report)
+        """
+        nlNames = self.resume(self.start(nlNames, optFile, solver), optFile, solver)
+        self.queue = deque(sorted(nlNames, key=lambda nlName: -self.sizes[nlName]))
+        active = list(self.resources)
+        free = list(active)
+        # failures of submission in a row and time of the next attempt of backed off resources
+        failures = dict.fromkeys(active, 0)
+        backoff = {}
+        try:
+            while self.queue or self.running:
+                now = timer()
+                for resource in [resource for resource, retryTime in backoff.items() if retryTime <= now]:
+                    del backoff[resource]
+                    free.append(resource)
+                # new shards for free resources
+                while self.queue and free:
+                    resource = free.pop(0)
+                    shard, shardSize = self.nextShard(resource, active)
+                    if self.submit(shard, optFile, solver, resource, [self.resources[resource]]) is None:
+                        # the resource does not take jobs, its shard goes back
+                        self.queue.extendleft(reversed(shard))
+                        failures[resource] += 1
+                        if failures[resource] >= SUBMIT_FAILURES:
+                            print("Resource %s does not take jobs, it is dropped" % (resource))
+                            active.remove(resource)
+                        else:
+                            delay = SUBMIT_BACKOFF * 2 ** (failures[resource] - 1)
+                            print("Resource %s does not take jobs, retry in %g s" % (resource, delay))
+                            backoff[resource] = timer() + delay
+                        continue
+                    failures[resource] = 0
+                    print("Shard of %d NL-files, %d bytes -> %s" % (len(shard), shardSize, resource))
+                if not self.running:
+                    if not backoff:
+                        # no resource takes jobs
+                        self.unsolved.extend(self.queue)
+                        self.queue.clear()
+                        break
+                    time.sleep(max(min(backoff.values()) - timer(), 0))
+                    continue
+                timeout = None
+                if backoff:
+                    timeout = max(min(backoff.values()) - timer(), 0)
+                if not self.queue and self.speculate(free, optFile, solver):
+                    timeout = SPECULATION_INTERVAL if timeout is None else min(timeout, SPECULATION_INTERVAL)
+                done, finished = self.waitDone(timeout)
+                free.extend(info['resource'] for info in finished if info['resource'] in active)
+        except KeyboardInterrupt:
+            self.interrupt()
+            raise
+        finally:
+            self.stats.save()
+        return self.solved, self.unsolved, self.jobIds
@@ -1,10 +1,14 @@
 from __future__ import print_function
 # from future.utils import iteritems
 
+import hashlib
+import io
 import os
+import shutil
 import sys
+import time
 import argparse
-from zipfile import ZipFile, ZIP_DEFLATED
+from zipfile import ZipFile, BadZipFile
 # import shutil
 # import tempfile
 # from collections import defaultdict, OrderedDict
@@ -19,7 +23,11 @@ import everest
 
 from timeit import default_timer as timer
 
+import ssop_cache
 import ssop_config
+import ssop_journal
+import ssop_metrics
+import ssop_zip
 
 def makeParser():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -73,14 +81,47 @@ def makeSolverOptionsFile(optFilePath, solver="ipopt", dictOptVal={}, **optvals)
 
     return f
 
+def makePlan(nlNames, optFile, solver="ipopt"):
+    """
+    Returns text of SSOP plan solving NL-files nlNames (without .nl extension) with options file optFile
+    """
+    nlFIles2str = "".join(nlNames[i]+" " for i in range(len(nlNames)))
+    return ('parameter nlname %s\n' % (nlFIles2str) +
+            'parameter options %s \n' % (optFile) +
+            'parameter solver %s \n' % (solver) +
+            'input_files ${nlname}.nl ${options}\n' +
+            'command run-%s.sh ${nlname} ${options}\n' % (solver) +
+            'output_files ${nlname}.sol ${nlname}.log.txt ${nlname}.err.txt stderr\n')
+
 class SsopSession:
     def __init__(self, name='problem', token=ssop_config.SSOP_TOKEN_FILE, appId=ssop_config.SSOP_ID, resources=[], \
-                 workdir=ssop_config.SSOP_DEFAULT_WORKING_DIR, debug=False):
+                 workdir=ssop_config.SSOP_DEFAULT_WORKING_DIR, debug=False,
+                 downloadParallel=ssop_config.SSOP_DOWNLOAD_PARALLEL,
+                 zipLevel=ssop_config.SSOP_ZIP_LEVEL, zipThreads=ssop_config.SSOP_ZIP_THREADS,
+                 extractResults=True, journal=ssop_config.SSOP_JOURNAL_FILE,
+                 cancelOnInterrupt=ssop_config.SSOP_CANCEL_ON_INTERRUPT,
+                 cacheDir=ssop_config.SSOP_CACHE_DIR, cacheSize=ssop_config.SSOP_CACHE_SIZE,
+                 cacheEntries=ssop_config.SSOP_CACHE_ENTRIES, endpoint=ssop_config.SSOP_ENDPOINT,
+                 metrics=ssop_config.SSOP_METRICS_FILE, prometheus=ssop_config.SSOP_PROMETHEUS_FILE):
+        """
+        :param zipLevel: compression level of NL-files sent to SSOP, 0 - store only
+        :param zipThreads: number of threads reading NL-files while they are compressed
+        :param extractResults: extract SOL-files and logs to the workdir, otherwise they are read by openResults
+        :param journal: file of ssop_journal.JobJournal in the workdir, None - jobs are not journaled
+        :param cancelOnInterrupt: cancel running jobs on KeyboardInterrupt, otherwise they are left running (see detach)
+        :param cacheDir: folder of ssop_cache.SolveCache in the workdir, None - solutions are not cached;
+                         SOL-files of cached problems are copied to the workdir whatever extractResults is
+        :param cacheSize: max bytes of the cache
+        :param cacheEntries: max number of problems in the cache, None - no limit
+        :param endpoint: Everest server, e.g. everest_mock.MockEverest for tests
+        :param metrics: JSON lines file of ssop_metrics.MetricsLog in the workdir, None - no metrics
+        :param prometheus: file of the metrics in Prometheus text format in the workdir, None - no file
+        """
         self.name = name
         print("token file: " + token)
         with open(token) as f:
             self.token = f.read().strip()
-        self.session = everest.Session('ssop-' + name, 'https://optmod.distcomp.org', token=self.token)
+        self.session = everest.Session('ssop-' + name, endpoint, token=self.token)
         # self.ssop = everest.App(ssop_config.SSOP_ID, self.session)
         self.ssopApp = everest.App(appId, self.session)
         self.workdir = workdir
@@ -89,85 +130,238 @@ class SsopSession:
         self.listJobsId = []
         self.nProblems = 0
         self.debug = debug
+        self.downloadParallel = downloadParallel
+        self.zipLevel = zipLevel
+        self.zipThreads = zipThreads
+        self.extractResults = extractResults
+        # Downloaded results zip of jobs by id
+        self.resultFiles = {}
+        # sha256 of input files by paths: (size, mtime, digest), see fileDigest
+        self.digests = {}
+        self.journal = None
+        self.cancelOnInterrupt = cancelOnInterrupt
+        # Ids of jobs submitted or reattached by the session
+        self.attached = set()
+        if journal is not None:
+            self.journal = ssop_journal.JobJournal(self.makeFileName(journal))
+            # names of new jobs differ from names of jobs of earlier runs
+            self.nJobs = len(self.journal.jobs(session=name))
+        self.cache = None
+        self.nCached = 0
+        if cacheDir is not None:
+            self.cache = ssop_cache.SolveCache(self.makeFileName(cacheDir), cacheSize, cacheEntries)
+        self.metrics = None
+        # times of making of inputs of jobs submitted by the session by id
+        self.jobInputs = {}
+        if metrics is not None:
+            self.metrics = ssop_metrics.MetricsLog(self.makeFileName(metrics),
+                                                   self.makeFileName(prometheus) if prometheus is not None else None)
 
 
     def makeFileName(self, fname, suffix=""):
         return os.path.join(self.workdir, fname + suffix)
 
+    def fileDigest(self, fname, suffix=""):
+        """
+        Returns ssop_cache.fileDigest of the file in the workdir, it is hashed again only if its size or mtime
+        is changed, so the digest is shared by the cache, the journal and the upload of the job
+        """
+        path = self.makeFileName(fname, suffix)
+        st = os.stat(path)
+        entry = self.digests.get(path)
+        if entry is None or entry[:2] != (st.st_size, st.st_mtime_ns):
+            entry = (st.st_size, st.st_mtime_ns, ssop_cache.fileDigest(path))
+            self.digests[path] = entry
+        return entry[2]
+
+    def makeJobFiles(self, nlNames, optFile, solver="ipopt"):
+        """
+        Makes plan and zip of NL-files and options file of the job in memory
+        :return: plan, zip as file objects named <name>.plan, <name>.zip;
+                 sha256 of the zip (for the upload cache of everest) is made of digests of its members
+        """
+        plan = io.BytesIO(makePlan(nlNames, optFile, solver).encode('utf-8'))
+        plan.name = self.name + '.plan'
+        files = io.BytesIO()
+        files.name = self.name + '.zip'
+        members = [(f + ".nl", self.makeFileName(f, ".nl")) for f in nlNames]
+        members.append((optFile, self.makeFileName(optFile)))
+        ssop_zip.writeZip(files, members, self.zipLevel, self.zipThreads)
+        files.seek(0)
+        h = hashlib.sha256(b'%d\0' % self.zipLevel)
+        for arcname, path in members:
+            h.update(arcname.encode('utf-8') + b'\0' + self.fileDigest(arcname))
+        files.sha256 = h.hexdigest()
+        return plan, files
+
     def saveResults(self, zipFilePath, nlNames):
-        solList = []
-        errList = []
-        with ZipFile(zipFilePath, 'r') as z:
-            infoList = z.infolist()
-            # print("infoList : ", infoList)
-            for finfo in infoList:
-                if '.sol' in finfo.filename:
-                    finfo.filename = os.path.basename(finfo.filename)
-                    z.extract(finfo, self.workdir)
-                    solList.append(os.path.splitext(finfo.filename)[0])
-            # check whether all SOL are here
-            for nln in nlNames:
-                if nln in solList:
-                    continue
-                # extract log and err
-                errList.append(nln)
-                for finfo in infoList:
-                    if (nln + ".err.txt" in finfo.filename) or (nln + ".log.txt" in finfo.filename):
-                        finfo.filename = os.path.basename(finfo.filename)
-                        z.extract(finfo, self.workdir)
+        """
+        Indexes results zip of the job, extracts SOL-files and logs of unsolved problems to the workdir
+        if extractResults is set (otherwise read them by openResults)
+        :return: list of solved problems (SOL-files of the zip), list of unsolved of nlNames;
+                 other problems of the zip (e.g. of a resumed job solving more NL-files) are skipped
+        """
+        with ssop_zip.ResultArchive(zipFilePath) as results:
+            nlSet = set(nlNames)
+            solList = [nln for nln in results.solved() if nln in nlSet]
+            solSet = set(solList)
+            errList = [nln for nln in nlNames if nln not in solSet]
+            if self.extractResults:
+                for nln in solList:
+                    results.extract(nln, ['sol'], self.workdir)
+                for nln in errList:
+                    results.extract(nln, ['err', 'log'], self.workdir)
         return solList, errList
 
-    def runJob(self, nlNames, optFile, solver="ipopt"):
+    def downloadResults(self, fileUri, zipFilePath):
         """
-        Run job with the list of NL-files
-        :param nlNmes: list of NL-files without .nl extension, should be placed in the workdir
-        :param optFile: file with solver options, should be placed in the workdir
-        :param solver: {ipopt|scip|...}
-        :return: list of solved problems, list of unsolved, JobId
+        Downloads results zip of the job, checks CRC-32 of all its members (Everest gives no digest of the file),
+        corrupted zip is downloaded once more
         """
-        nlFIles2str = "".join(nlNames[i]+" " for i in range(len(nlNames)))
+        for attempt in range(2):
+            self.session.getFile(fileUri, zipFilePath, parallel=self.downloadParallel)
+            try:
+                with ZipFile(zipFilePath) as z:
+                    if z.testzip() is None:
+                        return
+            except BadZipFile:
+                pass
+            os.remove(zipFilePath)
+            print('Results %s are corrupted' % (fileUri))
+        raise everest.DownloadException('Results %s are corrupted' % (fileUri))
 
-        with open(self.makeFileName(self.name, '.plan'), 'w') as f:
-            f.write('parameter nlname %s\n' % (nlFIles2str))
-            f.write('parameter options %s \n' % (optFile))
-            f.write('parameter solver %s \n' % (solver))
-            f.write('input_files ${nlname}.nl ${options}\n')
-            f.write('command run-%s.sh ${nlname} ${options}\n' % (solver))
-            f.write('output_files ${nlname}.sol ${nlname}.log.txt ${nlname}.err.txt stderr\n')
-            f.close()
+    def openResults(self, jobId):
+        """
+        Returns ssop_zip.ResultArchive of downloaded results of the job,
+        e.g. for (nlName, sol_bytes, log_bytes) in session.openResults(jobId).results(): ...
+        """
+        return ssop_zip.ResultArchive(self.resultFiles[jobId])
 
-        with ZipFile(self.makeFileName(self.name, '.zip'), 'w', ZIP_DEFLATED) as z:
-            for f in nlNames:
-                z.write(self.makeFileName(f,".nl"), arcname=f + ".nl")
-            z.write(self.makeFileName(optFile), arcname=optFile)
-            z.close()
+    def inputHashes(self, nlNames, optFile):
+        """
+        Returns hashes of NL-files (dict by names) and options file of the job for the journal
+        """
+        return (dict((f, ssop_journal.inputHash(f, self.fileDigest(f, ".nl"))) for f in nlNames),
+                ssop_journal.inputHash(optFile, self.fileDigest(optFile)))
 
-        jobName = self.name + "-" + solver + "-" + str(self.nJobs+1)
-        jobId = ""
-        solved = []
-        unsolved = []
+    def attachJob(self, entry):
+        """
+        Reattaches to journaled job, e.g. submitted before restart of the script
+        :param entry: record of the job in the journal
+        :return: job, None if it is dead or lost (the journal is updated then)
+        """
+        try:
+            job = self.session.getJob(entry['id'])
+        except requests.exceptions.HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            self.journal.update(entry['id'], 'LOST')
+            return None
+        if job.state in ssop_journal.DEAD_STATES and entry['state'] != 'COLLECTED':
+            self.journal.update(entry['id'], job.state)
+            return None
+        self.attached.add(job.id)
+        print("Job " + entry['name'] + ", " + job.id + " is resumed, state: " + job.state)
+        return job
 
-        startTime = timer()
+    def resumeJobs(self, nlNames, optFile, solver, nlHashes=None, optionsHash=None, partial=True):
+        """
+        Reattaches to live journaled jobs solving the NL-files with the same options and solver
+        :param nlHashes, optionsHash: hashes of the inputs (see inputHashes), None - computed
+        :param partial: if False then only a job solving all the NL-files is reattached
+        :return: list of (job, name of the job, list of its NL-files of nlNames)
+        """
+        if self.journal is None:
+            return []
+        if nlHashes is None:
+            nlHashes, optionsHash = self.inputHashes(nlNames, optFile)
+        resumed = []
+        rest = dict(nlHashes)
+        dead = set()
+        while rest:
+            found = self.journal.findTasks(rest, optionsHash, solver, exclude=self.attached | dead)
+            if not partial:
+                found = [(entry, names) for entry, names in found if len(names) == len(rest)][:1]
+            lost = False
+            for entry, names in found:
+                job = self.attachJob(entry)
+                if job is None:
+                    # its NL-files may be solved by older jobs
+                    dead.add(entry['id'])
+                    lost = True
+                    break
+                resumed.append((job, entry['name'], names))
+                for nlName in names:
+                    del rest[nlName]
+            if not lost:
+                break
+        return resumed
+
+    def submitJob(self, nlNames, optFile, solver="ipopt", resources=None):
+        """
+        Submits job with the list of NL-files (see runJob),
+        reattaches to a live journaled job solving all of the NL-files with the same options and solver instead
+        :param resources: list of Everest resources for the job, None - resources of the session
+        :return: job (None if it is not submitted), name of the job
+        """
+        if self.journal is not None:
+            nlHashes, optionsHash = self.inputHashes(nlNames, optFile)
+            resumed = self.resumeJobs(nlNames, optFile, solver, nlHashes, optionsHash, partial=False)
+            if resumed:
+                return resumed[0][0], resumed[0][1]
+
+        zipStart = time.time()
+        plan, files = self.makeJobFiles(nlNames, optFile, solver)
+        inputs = {'zipStart': zipStart, 'zipStop': time.time()}
+
+        jobName = self.name + "-" + solver + "-" + str(self.nJobs+1)
 
         if self.debug:
-            print("plan: %s" % (self.makeFileName(self.name, '.plan')))
-            print("files: %s" % (self.makeFileName(self.name, '.zip')))
+            print("plan: %s" % (plan.getvalue().decode('utf-8')))
+            print("files: %s, %d bytes" % (files.name, len(files.getvalue())))
         try:
             # ssop = everest.App(ssop_config.SSOP_ID, self.session)
             job = self.ssopApp.run({
-                "plan": open(self.makeFileName(self.name, '.plan'), 'rb'),
-                "files": open(self.makeFileName(self.name, '.zip'), 'rb')
-            }, resources=self.resources, job_name=jobName)
-            jobId = job.id
+                "plan": plan,
+                "files": files
+            }, resources=self.resources if resources is None else resources, job_name=jobName)
             # print("JobId" + jobId)
         except Exception as e:
             print("Job[" + jobName + "] caused: ", e)
-            self.session.close()
-            return
+            return None, jobName
+        finally:
+            plan.close()
+            files.close()
+        if job.id is None:
+            # the job is rejected by Everest (see everest.AsyncSession.submitJob)
+            print("Job[" + jobName + "] is not accepted, state: " + str(job.state))
+            return None, jobName
 
         self.nJobs = self.nJobs + 1
+        self.attached.add(job.id)
+        if self.metrics is not None:
+            self.jobInputs[job.id] = inputs
+        if self.journal is not None:
+            self.journal.record(job.id, jobName, self.name, solver, nlNames,
+                                [nlHashes[f] for f in nlNames], optionsHash)
 
-        print("Job " + jobName + ", " + jobId + " is starting")
+        print("Job " + jobName + ", " + job.id + " is starting")
+        return job, jobName
+
+    def collectJob(self, job, jobName, nlNames):
+        """
+        Waits for the job submitted by submitJob, downloads and saves its results
+        :return: list of solved problems, list of unsolved
+        """
+        solved = []
+        unsolved = []
+        resultsFile = self.makeFileName(jobName + '-results.zip')
+        entry = self.journal.get(job.id) if self.journal is not None else None
+        if entry is not None and entry['state'] == 'COLLECTED' and os.path.exists(resultsFile):
+            print('Job results are downloaded already')
+            self.resultFiles[job.id] = resultsFile
+            self.listJobsId.append(job.id)
+            return self.saveResults(resultsFile, nlNames)
 
         try:
             result = job.result()
@@ -175,42 +369,174 @@ class SsopSession:
             result = self.session.getJobStatus(job.id)
             if 'result' in result:
                 print('Job failed, result downloaded')
-                self.session.getFile(result['result']['results'], self.makeFileName(jobName + '-results.zip'))
-                solved, unsolved = self.saveResults(self.makeFileName(jobName + '-results.zip'), nlNames)
-                if self.debug:
-                    print("Downloading job's log...")
-                    self.session.getJobLog(job.id, jobName + '.log')
+                result = result['result']
             else:
                 print('Job failed, no result available')
-            self.listJobsId.append(jobId)
-            return solved, unsolved, jobId
+                if self.journal is not None:
+                    self.journal.update(job.id, job.state)
+                if self.metrics is not None:
+                    self.writeMetrics(job, jobName, nlNames, solved, unsolved, {}, 0)
+                self.listJobsId.append(job.id)
+                return solved, unsolved
+        if self.journal is not None:
+            self.journal.update(job.id, job.state, resultUri=result['results'])
+
+        downloadStart = time.time()
+        self.downloadResults(result['results'], resultsFile)
+        downloadStop = time.time()
+        self.resultFiles[job.id] = resultsFile
+        solved, unsolved = self.saveResults(resultsFile, nlNames)
+        if self.metrics is not None:
+            self.writeMetrics(job, jobName, nlNames, solved, unsolved,
+                              {'downloadStart': downloadStart, 'downloadStop': downloadStop, 'extracted': time.time()},
+                              os.path.getsize(resultsFile))
+        if self.journal is not None:
+            self.journal.update(job.id, 'COLLECTED', resultsFile=resultsFile)
+        if self.debug:
+            print("Downloading job's log...")
+            self.session.getJobLog(job.id, self.makeFileName(jobName + '.log'))
+
+        self.listJobsId.append(job.id)
+        return solved, unsolved
+
+    def writeMetrics(self, job, jobName, nlNames, solved, unsolved, timestamps, downloadBytes):
+        """
+        Writes metrics of the collected job: phases timed by the session and by the job, solve times of tasks;
+        resumed job (submitted before by another session) has no phases before the queue and no uploaded bytes
+        :param timestamps: times of download of the results and their extraction
+        """
+        inputs = self.jobInputs.pop(job.id, None)
+        resumed = inputs is None
+        if resumed:
+            inputs = {}
+        finished = [t for state, t in job.times.items() if state in everest.FINAL_STATES]
+        timestamps.update(zipStart=inputs.get('zipStart'), zipStop=inputs.get('zipStop'),
+                          uploadStart=job.times.get('upload'), uploadStop=job.times.get('uploaded'),
+                          submitted=job.times.get('submitted'), running=job.times.get('RUNNING'),
+                          finished=min(finished) if finished else None)
+        taskTimes = {}
+        if job.id in self.resultFiles:
+            with self.openResults(job.id) as results:
+                taskTimes = dict((nln, ssop_metrics.solveTime(results.read(nln, 'log'))) for nln in nlNames)
+        self.metrics.write(ssop_metrics.jobRecord(job.id, jobName, timestamps, job.uploaded_bytes,
+                                                  downloadBytes, taskTimes, resumed=resumed, state=job.state,
+                                                  tasks=len(nlNames), solved=len(solved), unsolved=len(unsolved)))
+
+    def cacheKeys(self, nlNames, optFile, solver):
+        """
+        Returns keys of the problems in the cache by names of NL-files
+        """
+        optionsDigest = self.fileDigest(optFile)
+        return dict((nln, ssop_cache.solveKey(self.fileDigest(nln, '.nl'), optionsDigest, solver)) for nln in nlNames)
+
+    def loadCached(self, keys):
+        """
+        Copies cached SOL-files of the problems to the workdir
+        :param keys: keys of the problems by names of NL-files
+        :return: list of found problems
+        """
+        found = []
+        for nln, key in keys.items():
+            files = self.cache.get(key)
+            if files is None:
+                continue
+            shutil.copyfile(files['sol'], self.makeFileName(nln, '.sol'))
+            found.append(nln)
+        return found
+
+    def takeCached(self, nlNames, optFile, solver):
+        """
+        Takes solved problems from the cache (see loadCached)
+        :return: list of cached problems, list of the rest of nlNames
+        """
+        if self.cache is None:
+            return [], nlNames
+        cached = self.loadCached(self.cacheKeys(nlNames, optFile, solver))
+        print("%d of %d problems are cached" % (len(cached), len(nlNames)))
+        cachedSet = set(cached)
+        return cached, [nln for nln in nlNames if nln not in cachedSet]
+
+    def storeCached(self, jobId, solved, optFile, solver):
+        """
+        Puts output files of problems of the collected job solved by the solver to the cache
+        (SOL-files of infeasible or failed problems are not cached, see ssop_cache.isSolved)
+        """
+        if self.cache is None or jobId not in self.resultFiles:
+            return
+        keys = self.cacheKeys(solved, optFile, solver)
+        with self.openResults(jobId) as results:
+            for nln in solved:
+                outputs = dict((kind, results.read(nln, kind)) for kind, suffix in ssop_zip.RESULT_KINDS)
+                if ssop_cache.isSolved(outputs['sol']):
+                    self.cache.put(keys[nln], outputs)
+
+    def runJob(self, nlNames, optFile, solver="ipopt"):
+        """
+        Run job with the list of NL-files, problems solved already are taken from the cache,
+        job is submitted with the rest of them (submitJob and collectJob do not use the cache)
+        :param nlNmes: list of NL-files without .nl extension, should be placed in the workdir
+        :param optFile: file with solver options, should be placed in the workdir
+        :param solver: {ipopt|scip|...}
+        :return: list of solved problems, list of unsolved, JobId
+        """
+        startTime = timer()
+
+        cached, nlNames = self.takeCached(nlNames, optFile, solver)
+        if cached and not nlNames:
+            self.nCached = self.nCached + 1
+            cachedName = self.name + "-" + solver + "-cached-" + str(self.nCached)
+            stopTime = timer()
+            print('Job %s took: %g s' % (cachedName, stopTime - startTime))
+            return cached, [], cachedName
+
+        job, jobName = self.submitJob(nlNames, optFile, solver)
+        if job is None:
+            self.session.close()
+            return
+
+        try:
+            solved, unsolved = self.collectJob(job, jobName, nlNames)
         except KeyboardInterrupt:
-            print('Cancelling the job...')
-            try:
-                job.cancel()
-            except requests.exceptions.HTTPError as e:
-                sys.stderr.write('Response from the server: %s\n' % e.response.content)
-                sys.stderr.write('Headers of the request: %s\n' % e.request.headers)
+            if not self.cancelOnInterrupt:
+                self.detach([job])
                 raise
-            try:
-                result = job.result()
-            except everest.JobException as e:
-                print(e)
+            self.cancelJob(job)
             return (None, None, job.id)
 
-        self.session.getFile(result['results'], self.makeFileName(jobName + '-results.zip'))
-        solved, unsolved = self.saveResults(self.makeFileName(jobName + '-results.zip'), nlNames)
-        # tasksRes = saveResults(makeName('-results.zip'), stubNames, args)
-        if self.debug:
-            print("Downloading job's log...")
-            self.session.getJobLog(job.id, args.out_prefix + '.log')
-            # parseJobLog(args.out_prefix + '.log', tasksRes, args)
+        self.storeCached(job.id, solved, optFile, solver)
+        solved = cached + solved
 
         stopTime = timer()
-        print('Job %s took: %g s' % (jobId, stopTime - startTime))
+        print('Job %s took: %g s' % (job.id, stopTime - startTime))
 
-        self.listJobsId.append(jobId)
-        return solved, unsolved, jobId
+        return solved, unsolved, job.id
+
+    def cancelJob(self, job):
+        """
+        Cancels the job and waits for its final state, the state is journaled
+        """
+        print('Cancelling the job...')
+        try:
+            job.cancel()
+        except requests.exceptions.HTTPError as e:
+            sys.stderr.write('Response from the server: %s\n' % e.response.content)
+            sys.stderr.write('Headers of the request: %s\n' % e.request.headers)
+            raise
+        try:
+            job.result()
+        except everest.JobException as e:
+            print(e)
+        if self.journal is not None:
+            self.journal.update(job.id, job.state)
+
+    def detach(self, jobs):
+        """
+        Leaves the jobs running (e.g. on KeyboardInterrupt), their journal records stay live
+        so the next run reattaches to them (see resumeJobs); the session is closed
+        """
+        print("Jobs %s are left running" % (', '.join(job.id for job in jobs)) +
+              (", they are resumed by the next run" if self.journal is not None else ""))
+        self.session.close()
 
     def deleteAllJobs(self):
         for jid in self.listJobsId:
@@ -0,0 +1,129 @@
+"""
+Zip archives of SSOP jobs: inputs made without temporary files and index of results.
+
+Members (NL-files, options file) are written by zipfile.ZipFile to a binary file object,
+e.g. io.BytesIO uploaded to Everest as the 'files' input of SSOP job.
+Files of members are read by a pool of threads while read ones are compressed and written.
+Compression level 0 stores members as is (e.g. when NL-files are compressed already).
+
+Results of SSOP job are indexed by ResultArchive once, SOL-files and logs of tasks are read from the zip
+when they are requested, e.g. to parse solutions in memory (see read_sol_bytes in asl_io/read.py).
+"""
+import os
+import posixpath
+import time
+from concurrent.futures import ThreadPoolExecutor
+from zipfile import ZipFile, ZipInfo, ZIP_STORED, ZIP_DEFLATED
+
+DEFAULT_LEVEL = 6
+
+# Kinds of output files of SSOP task <nlName> and their suffixes (see output_files of the plan)
+RESULT_KINDS = (('sol', '.sol'), ('log', '.log.txt'), ('err', '.err.txt'))
+
+
+def readMember(member):
+    """
+    Reads member of archive
+    :param member: (arcname, path to the file or bytes)
+    :return: zipfile.ZipInfo of the member, its contents
+    """
+    arcname, source = member
+    if isinstance(source, bytes):
+        data, mtime = source, time.time()
+    else:
+        with open(source, 'rb') as f:
+            data, mtime = f.read(), os.fstat(f.fileno()).st_mtime
+    info = ZipInfo(arcname, max(time.localtime(mtime)[:6], (1980, 1, 1, 0, 0, 0)))
+    info.external_attr = 0o644 << 16
+    return info, data
+
+
+def writeZip(out, members, level=DEFAULT_LEVEL, nThreads=1):
+    """
+    Writes zip archive of members to binary file object out
+    :param members: list of (arcname, path to the file or bytes)
+    :param level: level of compression, 0 - store only
+    :param nThreads: number of threads reading members at once
+    :return: number of bytes written
+    """
+    start = out.tell()
+    method = ZIP_DEFLATED if level > 0 else ZIP_STORED
+    with ZipFile(out, 'w', method, compresslevel=level if level > 0 else None) as zf:
+        if nThreads > 1 and len(members) > 1:
+            with ThreadPoolExecutor(nThreads) as pool:
+                for info, data in pool.map(readMember, members):
+                    zf.writestr(info, data, method, zf.compresslevel)
+        else:
+            for member in members:
+                info, data = readMember(member)
+                zf.writestr(info, data, method, zf.compresslevel)
+    return out.tell() - start
+
+
+class ResultArchive:
+    def __init__(self, source):
+        """
+        Index of results zip of SSOP job: output files of tasks by names of NL-files, read on demand
+        :param source: path to the zip or binary file object
+        """
+        self.zip = ZipFile(source, 'r')
+        self.index = {}
+        for info in self.zip.infolist():
+            base = posixpath.basename(info.filename)
+            for kind, suffix in RESULT_KINDS:
+                if base.endswith(suffix):
+                    self.index.setdefault(base[:-len(suffix)], {})[kind] = info
+                    break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.zip.close()
+
+    def solved(self):
+        """
+        Returns names of NL-files with SOL-files in the archive
+        """
+        return [nlName for nlName, files in self.index.items() if 'sol' in files]
+
+    def read(self, nlName, kind='sol'):
+        """
+        Returns contents of output file of the task, None if there is no such file
+        :param kind: 'sol', 'log' or 'err' (see RESULT_KINDS)
+        """
+        info = self.index.get(nlName, {}).get(kind)
+        return self.zip.read(info) if info is not None else None
+
+    def results(self, nlNames=None):
+        """
+        Yields (nlName, sol_bytes, log_bytes) of tasks, files are read when the tuple is yielded
+        :param nlNames: names of NL-files, None - all tasks of the archive
+        :return: sol_bytes is None if the task is not solved,
+                 log_bytes is contents of log followed by error output, None if both are absent
+        """
+        if nlNames is None:
+            nlNames = list(self.index)
+        for nlName in nlNames:
+            logs = [data for data in (self.read(nlName, 'log'), self.read(nlName, 'err')) if data is not None]
+            yield nlName, self.read(nlName, 'sol'), b''.join(logs) if logs else None
+
+    def extract(self, nlName, kinds, path):
+        """
+        Writes output files of the task to folder path (without subfolders of the archive)
+        :param kinds: list of kinds of files (see read)
+        :return: list of paths to written files
+        """
+        written = []
+        for kind in kinds:
+            data = self.read(nlName, kind)
+            if data is None:
+                continue
+            filename = os.path.join(path, posixpath.basename(self.index[nlName][kind].filename))
+            with open(filename, 'wb') as f:
+                f.write(data)
+            written.append(filename)
+        return written
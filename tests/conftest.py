@@ -0,0 +1,8 @@
+import os
+import sys
+
+# modules of the repository are imported flat, as by its scripts
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'asl_io')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
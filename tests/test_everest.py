@@ -0,0 +1,68 @@
+import asyncio
+import json
+import socket
+
+import pytest
+import requests
+
+import everest
+import everest_mock
+
+
+def freePort():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+@pytest.mark.parametrize('method', ['GET', 'POST'])
+def test_connect_retries(method):
+    # refused connection is repeated by AsyncSession.request only, for any method (the request is not sent)
+    async def run():
+        session = everest.AsyncSession('test', 'http://127.0.0.1:%d' % freePort(), token='x', retries=3, backoff=0.01)
+        sent = []
+        request = session.session.request
+        def counting(*args, **kwargs):
+            sent.append(args)
+            return request(*args, **kwargs)
+        session.session.request = counting
+        try:
+            with pytest.raises(requests.exceptions.ConnectionError) as e:
+                await session.request(method, '/api/jobs')
+            assert everest.is_not_sent(e.value)
+        finally:
+            session.session.close()
+            session.external.close()
+            session.executor.shutdown()
+        return len(sent)
+    assert asyncio.run(run()) == 4
+
+
+def test_lost_submit_response(monkeypatch):
+    # the job is created but the response is lost: it is found by the retry, the name is kept
+    with everest_mock.MockEverest(jobTime=0.1) as mock:
+        session = everest.Session('test', mock.endpoint, token=everest_mock.TOKEN, poll_interval=0.05, backoff=0.01)
+        try:
+            old = session.run('app', {'a': 1}, job_name='same')
+            old.result()
+            posts = []
+            def lossy(handler, mock, body, query, appId):
+                posts.append(appId)
+                job = mock.submit(appId, json.loads(body.decode('utf-8')))
+                if len(posts) == 1:
+                    return handler.reply(503, {})
+                handler.reply(201, {'id': job['id'], 'state': job['state']})
+            routes = [(pattern, lossy if handler is everest_mock.MockHandler.submit else handler)
+                      for pattern, handler in everest_mock.ROUTES['POST']]
+            monkeypatch.setitem(everest_mock.ROUTES, 'POST', routes)
+            new = session.run('app', {'a': 1}, job_name='same')
+            new.result()
+            assert len(posts) == 1
+            assert new.id != old.id
+            assert sorted(job['name'] for job in mock.jobs.values()) == ['same', 'same']
+            session.deleteJobs('same')
+            assert not mock.jobs
+        finally:
+            session.close()
@@ -0,0 +1,26 @@
+import numpy as np
+
+from read import read_sol_bytes, is_solved
+
+
+def solText(x, y, code, message='Ipopt 3.14.4: Optimal Solution Found'):
+    lines = [message, '', 'Options', '3', '1', '1', '0',
+             str(len(y)), str(len(y)), str(len(x)), str(len(x))]
+    lines += [repr(v) for v in y] + [repr(v) for v in x] + ['objno 0 %d' % (code)]
+    return '\n'.join(lines) + '\n'
+
+
+def test_solved():
+    x, y, message, code = read_sol_bytes(solText([1.5, 0., 2.], [0.25], 0).encode('utf-8'), duals=True)
+    assert np.array_equal(x, [1.5, 0., 2.])
+    assert np.array_equal(y, [0.25])
+    assert message == 'Ipopt 3.14.4: Optimal Solution Found'
+    assert code == 0 and is_solved(code)
+
+
+def test_failed():
+    # failed solve gives no primal values
+    x, y, message, code = read_sol_bytes(solText([], [], 200, 'Converged to a locally infeasible point.'))
+    assert len(x) == 0 and y is None
+    assert code == 200 and not is_solved(code)
+    assert not is_solved(500) and is_solved(100)
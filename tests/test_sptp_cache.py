@@ -0,0 +1,44 @@
+import json
+import os
+
+import numpy as np
+
+import sptp_cache
+
+
+def makeFiles(tmpdir):
+    paths = []
+    for name in ('a.csv', 'b.csv'):
+        path = str(tmpdir.join(name))
+        with open(path, 'w') as f:
+            f.write(name + '\n1,2\n')
+        paths.append(path)
+    return paths
+
+
+def test_round_trip(tmpdir):
+    paths = makeFiles(tmpdir)
+    cacheDir = str(tmpdir.join('cache'))
+    assert sptp_cache.loadArrays(cacheDir, paths) is None
+    sptp_cache.saveArrays(cacheDir, paths, {'I': ['x', 1]}, {'A': np.arange(6.).reshape(2, 3)})
+    labels, arrays = sptp_cache.loadArrays(cacheDir, paths)
+    assert labels == {'I': ['x', 1]}
+    assert np.array_equal(arrays['A'], np.arange(6.).reshape(2, 3))
+    # changed source file
+    with open(paths[1], 'a') as f:
+        f.write('3,4\n')
+    assert sptp_cache.loadArrays(cacheDir, paths) is None
+
+
+def test_version(tmpdir):
+    paths = makeFiles(tmpdir)
+    cacheDir = str(tmpdir.join('cache'))
+    folder = sptp_cache.saveArrays(cacheDir, paths, {}, {'A': np.zeros(3)}, version=sptp_cache.CACHE_VERSION - 1)
+    assert folder != sptp_cache.cacheFolder(cacheDir, paths)
+    assert sptp_cache.loadArrays(cacheDir, paths) is None
+    # index of another version in the folder of this version (e.g. written before versions were kept)
+    os.rename(folder, sptp_cache.cacheFolder(cacheDir, paths))
+    assert sptp_cache.loadArrays(cacheDir, paths) is None
+    index = os.path.join(sptp_cache.cacheFolder(cacheDir, paths), sptp_cache.INDEX_FILE)
+    with open(index) as f:
+        assert json.load(f)['version'] == sptp_cache.CACHE_VERSION - 1
@@ -0,0 +1,40 @@
+import filecmp
+
+import pandas as pd
+import pytest
+
+import benchSptp_5
+from SptpData_5 import SptpData_5
+from sptpmodel_5 import SPTPmodel_5
+from sptpnl_5 import writeNlDirect
+from write import write_nl_only
+
+
+@pytest.fixture(scope='module')
+def data(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('sptp')
+    paths = benchSptp_5.makeRandomCsv(str(folder), 30, 12, 3, 0.3, 1)
+    # empty row and column of costs, zero requirements of some pairs
+    C = pd.read_csv(paths['path2C_csv'], index_col=0)
+    C.iloc[2, :] = 0.
+    C.iloc[:, 3] = 0.
+    C.to_csv(paths['path2C_csv'])
+    S = pd.read_csv(paths['path2S_csv'], index_col=0)
+    S.iloc[5, ::2] = 0.
+    S.to_csv(paths['path2S_csv'])
+    return folder, SptpData_5('t', debug=False, **paths)
+
+
+@pytest.mark.parametrize('isInteger', [True, False])
+def test_nl_identity(data, isInteger):
+    # models built by rules and by arrays and NL-file written without the model are the same byte by byte
+    folder, sptpData = data
+    stubs = {}
+    for fast in (False, True):
+        model = SPTPmodel_5(sptpData, isInteger=isInteger, sparse=True, fast=fast)
+        stubs[fast] = write_nl_only(model.model, str(folder / ('m%d%d' % (isInteger, fast))),
+                                    symbolic_solver_labels=True)[:-len('.nl')]
+    stubs['direct'] = writeNlDirect(sptpData, str(folder / ('d%d' % isInteger)), isInteger, chunkSize=7)[:-len('.nl')]
+    for stub in (stubs[True], stubs['direct']):
+        for ext in ('.nl', '.row', '.col'):
+            assert filecmp.cmp(stubs[False] + ext, stub + ext, shallow=False), stub + ext
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from SptpData_5 import SptpData_5, frameToArray
+
+
+def writeCsv(folder, J, K):
+    I = ['EUR', 'USD', 'Asset 2']
+    frames = {'a': pd.DataFrame({'Units': [10., 20., 30.]}, index=I),
+              'b': pd.DataFrame({'Amount': [1., 2.]}, index=J),
+              'C': pd.DataFrame([[1., 2.], [3., 4.], [5., 6.]], index=I, columns=J),
+              'D': pd.DataFrame([[10., 20.], [30., 40.]], index=K, columns=J),
+              'P': pd.DataFrame([[1., 0.], [0., 2.], [3., 4.]], index=I, columns=J),
+              'S': pd.DataFrame([[1., 1.], [2., 2.], [3., 3.]], index=I, columns=J),
+              'T': pd.DataFrame([[1, 0], [0, 1], [1, 0]], index=I, columns=K)}
+    paths = {}
+    for key, frame in frames.items():
+        path = str(folder.join(key + '.csv'))
+        frame.to_csv(path)
+        paths['path2' + key + '_csv'] = path
+    return paths
+
+
+@pytest.mark.parametrize('J, K', [(['R1', 'R2'], ['T1', 'T2']), ([1, 2], [7, 9])])
+def test_labels(tmpdir, J, K):
+    # numeric J and K are ints in the index of b.csv and D.csv, but strings in headers of C.csv and T.csv
+    data = SptpData_5('t', **writeCsv(tmpdir, J, K))
+    assert data.J.tolist() == J
+    assert data.K.tolist() == K
+    assert np.array_equal(data.C, [[1., 2.], [3., 4.], [5., 6.]])
+    assert np.array_equal(data.D, [[10., 20.], [30., 40.]])
+    assert np.array_equal(data.T, [[1, 0], [0, 1], [1, 0]])
+    assert data.getC('USD', J[1]) == 4.
+
+
+def test_missing_label():
+    frame = pd.DataFrame([[1., 2.]], index=['a'], columns=['1', '2'])
+    assert np.array_equal(frameToArray(frame, ['a'], [2, 1], 'C'), [[2., 1.]])
+    with pytest.raises(ValueError):
+        frameToArray(frame, ['a'], [1, 3], 'C')
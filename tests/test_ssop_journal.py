@@ -0,0 +1,28 @@
+import time
+
+import ssop_journal
+
+
+def hashes(names, version=0):
+    return dict((name, ssop_journal.inputHash(name, b'%s %d' % (name.encode('utf-8'), version))) for name in names)
+
+
+def test_find_tasks(tmp_path):
+    journal = ssop_journal.JobJournal(str(tmp_path / 'journal.sqlite'))
+    nlHashes = hashes(['p1', 'p2', 'p3', 'p4'])
+    journal.record('old', 'j1', 's', 'ipopt', ['p1', 'p2', 'p3'], [nlHashes[n] for n in ('p1', 'p2', 'p3')], 'o')
+    time.sleep(0.01)
+    journal.record('new', 'j2', 's', 'ipopt', ['p2'], [nlHashes['p2']], 'o')
+    journal.record('other', 'j3', 's', 'scip', ['p4'], [nlHashes['p4']], 'o')
+    journal.record('dead', 'j4', 's', 'ipopt', ['p4'], [nlHashes['p4']], 'o', state='FAILED')
+    # every NL-file goes to the latest live job with the same solver and options
+    found = journal.findTasks(nlHashes, 'o', 'ipopt')
+    assert [(entry['id'], names) for entry, names in found] == [('new', ['p2']), ('old', ['p1', 'p3'])]
+    assert journal.findTasks(nlHashes, 'o', 'ipopt', exclude={'new'})[0][1] == ['p1', 'p2', 'p3']
+    assert journal.findTasks(nlHashes, 'o2', 'ipopt') == []
+    # changed NL-file is not matched
+    assert journal.findTasks(hashes(['p1'], 1), 'o', 'ipopt') == []
+    journal.update('old', 'COLLECTED', resultsFile='r.zip')
+    assert journal.get('old')['results_file'] == 'r.zip'
+    assert [entry['id'] for entry in journal.jobs(states=ssop_journal.DEAD_STATES)] == ['dead']
+    journal.close()
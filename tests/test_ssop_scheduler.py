@@ -0,0 +1,109 @@
+import pytest
+
+import ssop_scheduler
+
+
+class FakeJob:
+    def __init__(self, jobId, state='RUNNING'):
+        self.id = jobId
+        self.state = state
+
+
+class FakeSession:
+    # SsopSession solving the NL-files of jobs given in solves (None - all NL-files), the jobs are journaled in live;
+    # resources given in rejects fail to take so many jobs
+    def __init__(self, solves=None, rejects={}):
+        self.solves = solves
+        self.rejects = dict(rejects)
+        self.submitted = []
+        self.live = set()
+        self.listJobsId = []
+        self.cancelled = []
+        self.session = self
+        self.stored = []
+
+    def makeFileName(self, fname, suffix=''):
+        return fname + suffix
+
+    def takeCached(self, nlNames, optFile, solver):
+        return [], nlNames
+
+    def storeCached(self, jobId, solved, optFile, solver):
+        self.stored.extend(solved)
+
+    def resumeJobs(self, nlNames, optFile, solver):
+        return []
+
+    def submitJob(self, nlNames, optFile, solver, resources=None):
+        self.submitted.append(resources[0])
+        if self.rejects.get(resources[0], 0) > 0:
+            self.rejects[resources[0]] -= 1
+            return None, None
+        job = FakeJob('job%d' % len(self.submitted))
+        self.live.add(job.id)
+        return job, job.id
+
+    def wait(self, jobs, timeout=None):
+        for job in jobs:
+            job.state = 'DONE'
+        return jobs, []
+
+    def collectJob(self, job, jobName, nlNames):
+        self.live.discard(job.id)
+        self.listJobsId.append(job.id)
+        solved = [nlName for nlName in nlNames if self.solves is None or nlName in self.solves.get(job.id, ())]
+        return solved, [nlName for nlName in nlNames if nlName not in solved]
+
+    def cancelJob(self, jobId):
+        self.cancelled.append(jobId)
+
+
+def makeScheduler(tmp_path, solves):
+    session = FakeSession(solves)
+    scheduler = ssop_scheduler.ShardScheduler(session, {'r1': 'id1', 'r2': 'id2'},
+                                              statsFile=str(tmp_path / 'stats.json'))
+    nlNames = ['p1', 'p2', 'p3']
+    scheduler.sizes = dict((nlName, 10) for nlName in nlNames)
+    job = scheduler.submit(nlNames, 'opt', 'ipopt', 'r1', ['id1'])
+    copy = scheduler.submit(nlNames, 'opt', 'ipopt', 'r2', ['id2'])
+    scheduler.partners = {job: copy, copy: job}
+    return session, scheduler, job, copy
+
+
+def test_failed_job_with_running_copy(tmp_path):
+    session, scheduler, job, copy = makeScheduler(tmp_path, {'job1': ['p2'], 'job2': ['p1', 'p2', 'p3']})
+    job.state = 'FAILED'
+    scheduler.finish(job)
+    # the failed job is collected, its solved NL-files are not solved by the copy again
+    assert session.listJobsId == ['job1'] and session.live == {'job2'}
+    assert scheduler.solved == ['p2'] and scheduler.unsolved == []
+    copy.state = 'DONE'
+    scheduler.finish(copy)
+    assert sorted(scheduler.solved) == ['p1', 'p2', 'p3'] and scheduler.unsolved == []
+    assert scheduler.jobIds == ['job1', 'job2'] and not session.live
+
+
+def test_done_job_cancels_copy(tmp_path):
+    session, scheduler, job, copy = makeScheduler(tmp_path, {'job1': ['p1', 'p2', 'p3']})
+    job.state = 'DONE'
+    finished = scheduler.finish(job)
+    assert len(finished) == 2
+    assert session.cancelled == ['job2'] and not scheduler.running
+    assert sorted(scheduler.solved) == ['p1', 'p2', 'p3']
+
+
+@pytest.mark.parametrize('rejects, dropped', [(2, False), (3, True)])
+def test_submit_backoff(tmp_path, monkeypatch, rejects, dropped):
+    # the resource failing to take jobs is given shards again later, it is dropped after SUBMIT_FAILURES in a row
+    monkeypatch.setattr(ssop_scheduler, 'SUBMIT_BACKOFF', 0.01)
+    monkeypatch.setattr(ssop_scheduler.os.path, 'getsize', lambda path: 10)
+    session = FakeSession(rejects={'id1': rejects})
+    scheduler = ssop_scheduler.ShardScheduler(session, {'r1': 'id1'}, statsFile=str(tmp_path / 'stats.json'))
+    nlNames = ['p%d' % n for n in range(4)]
+    solved, unsolved, jobIds = scheduler.run(nlNames, 'opt')
+    if dropped:
+        assert session.submitted == ['id1'] * 3
+        assert solved == [] and sorted(unsolved) == nlNames
+    else:
+        assert session.submitted[:3] == ['id1'] * 3
+        assert sorted(solved) == nlNames and unsolved == []
@@ -0,0 +1,159 @@
+import json
+
+import pytest
+
+import everest_mock
+import ssop_scheduler
+import ssop_session
+
+NL_NAMES = ['p1', 'p2', 'p3']
+
+
+@pytest.fixture
+def mock():
+    with everest_mock.MockEverest(jobTime=0.2, seed=1) as mock:
+        yield mock
+
+
+@pytest.fixture
+def workdir(tmp_path):
+    for n, nlName in enumerate(NL_NAMES):
+        (tmp_path / (nlName + '.nl')).write_bytes(b'g3 1 1 0\n' + b'%d\n' % n * 100)
+    (tmp_path / 'o.opt').write_bytes(b'tol 1e-8\n')
+    (tmp_path / 'token').write_text(everest_mock.TOKEN)
+    return tmp_path
+
+
+def makeSession(mock, workdir, **kwargs):
+    kwargs.setdefault('cacheDir', None)
+    session = ssop_session.SsopSession('t', token=str(workdir / 'token'), workdir=str(workdir),
+                                       endpoint=mock.endpoint, metrics=None, **kwargs)
+    session.session.asession.poll_interval = 0.05
+    return session
+
+
+def interrupt(*args):
+    raise KeyboardInterrupt()
+
+
+@pytest.mark.parametrize('cancelOnInterrupt', [False, True])
+def test_interrupt_resume(mock, workdir, monkeypatch, cancelOnInterrupt):
+    # interrupted job is left running and resumed by the next run, unless it is cancelled on interrupt
+    session = makeSession(mock, workdir, cancelOnInterrupt=cancelOnInterrupt)
+    with monkeypatch.context() as m:
+        m.setattr(session, 'collectJob', interrupt)
+        if cancelOnInterrupt:
+            solved, unsolved, jobId = session.runJob(NL_NAMES, 'o.opt')
+            assert solved is None and session.journal.get(jobId)['state'] == 'CANCELLED'
+        else:
+            with pytest.raises(KeyboardInterrupt):
+                session.runJob(NL_NAMES, 'o.opt')
+            assert session.session.loop.is_closed()
+    session.session.close()
+    [entry] = session.journal.jobs()
+    session = makeSession(mock, workdir)
+    try:
+        solved, unsolved, jobId = session.runJob(NL_NAMES, 'o.opt')
+    finally:
+        session.session.close()
+    assert sorted(solved) == NL_NAMES and unsolved == []
+    assert (jobId == entry['id']) != cancelOnInterrupt
+    assert mock.stats['submitted'] == (2 if cancelOnInterrupt else 1)
+    assert (workdir / 'p1.sol').exists()
+
+
+def test_cache(mock, workdir, monkeypatch):
+    # solutions are cached by the first run (every input file is hashed once), the second run submits nothing
+    hashed = []
+    fileDigest = ssop_session.ssop_cache.fileDigest
+    monkeypatch.setattr(ssop_session.ssop_cache, 'fileDigest', lambda path: hashed.append(path) or fileDigest(path))
+    session = makeSession(mock, workdir, cacheDir='cache')
+    try:
+        solved, unsolved, jobId = session.runJob(NL_NAMES, 'o.opt')
+    finally:
+        session.session.close()
+    assert sorted(solved) == NL_NAMES and mock.stats['submitted'] == 1
+    assert len(hashed) == len(set(hashed)) == len(NL_NAMES) + 1
+    assert sorted(session.resultFiles) == [jobId] and isinstance(session.resultFiles[jobId], str)
+    for nlName in NL_NAMES:
+        (workdir / (nlName + '.sol')).unlink()
+    (workdir / 'p4.nl').write_bytes(b'g3 1 1 0\n4\n')
+    session = makeSession(mock, workdir, cacheDir='cache')
+    try:
+        solved, unsolved, jobId = session.runJob(NL_NAMES, 'o.opt')
+        assert sorted(solved) == NL_NAMES and unsolved == [] and mock.stats['submitted'] == 1
+        assert all((workdir / (nlName + '.sol')).exists() for nlName in NL_NAMES)
+        assert not list(workdir.glob('*cached*'))
+        # a miss is submitted alone
+        solved, unsolved, jobId = session.runJob(NL_NAMES + ['p4'], 'o.opt')
+        assert sorted(solved) == NL_NAMES + ['p4'] and mock.stats['submitted'] == 2
+    finally:
+        session.session.close()
+
+
+@pytest.mark.parametrize('objno, cached', [(b'objno 0 0\n', True), (b'objno 0 102\n', True),
+                                           (b'objno 0 200\n', False), (b'objno 0 520\n', False), (b'', True)])
+def test_cache_solved_only(objno, cached):
+    sol = b'Solver message\n\nOptions\n3\n1\n1\n0\n0\n0\n1\n1\n0.5\n' + objno
+    assert ssop_session.ssop_cache.isSolved(sol) == cached
+
+
+@pytest.mark.parametrize('batchClass', [ssop_scheduler.JobPipeline, ssop_scheduler.ShardScheduler])
+def test_batch_cache(mock, workdir, batchClass):
+    # batches take solved problems from the cache and put solutions of their jobs to it
+    for run in range(2):
+        session = makeSession(mock, workdir, cacheDir='cache', journal=None)
+        try:
+            batch = batchClass(session, statsFile=str(workdir / 'stats.json'))
+            if batchClass is ssop_scheduler.JobPipeline:
+                batch.maxJobFiles = 2
+            solved, unsolved, jobIds = batch.run(NL_NAMES, 'o.opt')
+        finally:
+            session.session.close()
+        assert sorted(solved) == NL_NAMES and unsolved == []
+        assert len(jobIds) == (0 if run else len(set(mock.jobs)))
+    assert mock.stats['submitted'] > 0
+
+
+def test_batch_resume(mock, workdir):
+    # jobs of a crashed run are reattached by the batch, only the rest of its NL-files is submitted
+    (workdir / 'p4.nl').write_bytes(b'g3 1 1 0\n4\n')
+    session = makeSession(mock, workdir)
+    ids = [session.submitJob(nlNames, 'o.opt')[0].id for nlNames in (NL_NAMES[:1], NL_NAMES[1:])]
+    session.session.close()
+    session = makeSession(mock, workdir)
+    try:
+        solved, unsolved, jobIds = ssop_scheduler.JobPipeline(session, statsFile=str(workdir / 'stats.json')).run(
+            NL_NAMES + ['p4'], 'o.opt')
+    finally:
+        session.session.close()
+    assert sorted(solved) == NL_NAMES + ['p4'] and unsolved == []
+    assert set(ids) < set(jobIds) and len(jobIds) == 3 and mock.stats['submitted'] == 3
+    assert [entry['state'] for entry in session.journal.jobs()] == ['COLLECTED'] * 3
+
+
+def test_metrics(mock, workdir):
+    # inputs reused by the upload cache are not counted, resumed jobs are marked
+    session = makeSession(mock, workdir, journal=None)
+    try:
+        jobs = [session.submitJob(NL_NAMES, 'o.opt')[0] for n in range(2)]
+    finally:
+        session.session.close()
+    assert jobs[0].id != jobs[1].id
+    assert jobs[0].uploaded_bytes > 0 and jobs[1].uploaded_bytes == 0
+    session = makeSession(mock, workdir)
+    try:
+        job = session.submitJob(NL_NAMES, 'o.opt')[0]
+    finally:
+        session.session.close()
+    session = makeSession(mock, workdir)
+    session.metrics = ssop_session.ssop_metrics.MetricsLog(str(workdir / 'metrics.jsonl'))
+    try:
+        solved, unsolved, jobId = session.runJob(NL_NAMES, 'o.opt')
+    finally:
+        session.session.close()
+    assert jobId == job.id
+    with open(str(workdir / 'metrics.jsonl')) as f:
+        [record] = [json.loads(line) for line in f]
+    assert record['resumed'] and record['uploadBytes'] == 0 and record['solved'] == len(NL_NAMES)
+    assert 'zip' not in record['phases'] and 'download' in record['phases']
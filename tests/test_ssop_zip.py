@@ -0,0 +1,57 @@
+import io
+import zipfile
+
+import pytest
+
+import everest_mock
+import ssop_zip
+
+
+@pytest.mark.parametrize('level, nThreads', [(0, 1), (6, 1), (6, 3)])
+def test_round_trip(tmp_path, level, nThreads):
+    path = tmp_path / 'p1.nl'
+    path.write_bytes(b'g3 1 1 0\n' * 1000)
+    members = [('p1.nl', str(path)), ('p2.nl', b'g3 2 1 0\n' * 100), ('opt', b''), ('d/ü.txt', b'x')]
+    out = io.BytesIO(b'head')
+    out.seek(0, io.SEEK_END)
+    size = ssop_zip.writeZip(out, members, level, nThreads)
+    assert size == len(out.getvalue()) - 4
+    with zipfile.ZipFile(io.BytesIO(out.getvalue()[4:])) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == [arcname for arcname, source in members]
+        assert zf.read('p1.nl') == path.read_bytes()
+        assert zf.read('p2.nl') == members[1][1]
+        assert zf.read('d/ü.txt') == b'x'
+        expected = zipfile.ZIP_DEFLATED if level > 0 else zipfile.ZIP_STORED
+        assert all(info.compress_type == expected for info in zf.infolist())
+
+
+def test_result_archive():
+    out = io.BytesIO()
+    ssop_zip.writeZip(out, [('r/p1.sol', b'sol1'), ('r/p1.log.txt', b'log'), ('r/p1.err.txt', b'err'),
+                            ('r/p2.log.txt', b'failed')])
+    out.seek(0)
+    with ssop_zip.ResultArchive(out) as results:
+        assert results.solved() == ['p1']
+        assert dict((name, (sol, log)) for name, sol, log in results.results()) == \
+            {'p1': (b'sol1', b'logerr'), 'p2': (None, b'failed')}
+        assert results.read('p3') is None
+
+
+def test_mock_results():
+    # SOL-files of results of SSOP job are parsed in memory
+    from read import read_sol_bytes, is_solved
+    mock = everest_mock.MockEverest(solValues=4, taskFailRate=0.5, seed=2)
+    out = io.BytesIO(mock.makeResults(['p%d' % n for n in range(6)]))
+    mock.server.server_close()
+    with ssop_zip.ResultArchive(out) as results:
+        solved = results.solved()
+        assert 0 < len(solved) < 6
+        for nlName, sol, log in results.results():
+            assert log.startswith(b'Mock log of ' + nlName.encode('utf-8'))
+            if nlName in solved:
+                x, y, message, code = read_sol_bytes(sol, duals=True, name=nlName)
+                assert len(x) == 4 and len(y) == 0 and is_solved(code)
+                assert message == 'Mock solution of ' + nlName
+            else:
+                assert sol is None and b'Mock failure' in log